@@ -1,8 +1,17 @@
 from flask import Flask
+import logging
 import os
 
-def create_app():
-    """Create and configure the Flask application."""
+logger = logging.getLogger(__name__)
+
+def create_app(load=True):
+    """
+    Create and configure the Flask application.
+    
+    With load=True the data bundle is loaded on a background thread; the app
+    serves (and answers /healthz) right away and /readyz turns 200 once the
+    data is in. Pass load=False to set app.config['data_bundle'] yourself.
+    """
     app = Flask(__name__, 
                 static_folder='../static',
                 template_folder='../templates')
@@ -10,8 +19,31 @@ def create_app():
     # Load configuration
     app.config.from_pyfile('config.py')
     
+    # Request timing and optional slow-request profiling
+    from app import metrics
+    metrics.init_app(app)
+    
+    # Bounded pool that runs recommendation scoring off the request threads
+    from app import serving
+    serving.init_app(app)
+    
+    # Worker processes for sharded genre scoring (forked before any thread starts)
+    from app import sharding
+    sharding.init_app(app)
+    
+    # ETags and pre-rendered bodies for the read-mostly endpoints
+    from app import http_cache
+    http_cache.init_app(app)
+    
+    # Background data loading, readiness and reloads
+    from app import lifecycle
+    data_lifecycle = lifecycle.init_app(app)
+    
     # Register routes
     from app import routes
     routes.init_app(app)
     
+    if load:
+        data_lifecycle.start()
+    
     return app
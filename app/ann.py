@@ -0,0 +1,174 @@
+import logging
+import os
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+ANN_FORMAT_VERSION = 1
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64    # Training points per list for k-means (bounds build time)
+MAX_BLOCK_BYTES = 64 * 2**20   # Dense working memory per block when assigning rows to lists
+
+
+class IVFIndex:
+    """
+    Inverted-file index for approximate maximum inner product search.
+
+    Rows are clustered with spherical k-means; a query is compared with the
+    centroids and only the rows of the n_probe best lists are scanned. Rows
+    are stored grouped by list so each probed list is one contiguous slice.
+    With metric='ip', inner products are reduced to cosine by appending
+    sqrt(M^2 - |x|^2) to every row (M the largest row norm), so long and short
+    vectors cluster together correctly; metric='cosine' normalizes the rows
+    first. Scores returned by search() are inner products in that
+    transformed space and only meant for ranking candidates; callers rerank
+    them with their exact scoring function.
+    """
+
+    def __init__(self, centroids, list_indptr, list_rows, vectors, key=''):
+        self.centroids = centroids
+        self.list_indptr = list_indptr
+        self.list_rows = list_rows
+        self.vectors = vectors
+        self.key = key
+        self.positions = np.empty(len(list_rows), dtype=np.int64)
+        self.positions[list_rows] = np.arange(len(list_rows))
+
+    @classmethod
+    def build(cls, vectors, metric='ip', n_lists=None, key='', seed=0):
+        """Cluster the rows of `vectors` into n_lists lists (default sqrt(n))."""
+        data = np.asarray(vectors, dtype=np.float32)
+        if metric == 'cosine':
+            data = _normalize(data)
+        elif metric != 'ip':
+            raise ValueError(f"Unknown metric '{metric}'")
+        data = _to_sphere(data)
+        n_rows = len(data)
+        n_lists = max(1, min(int(n_lists or np.sqrt(n_rows)), n_rows))
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n_rows, n_lists * KMEANS_SAMPLE_PER_LIST)
+        sample = data[rng.choice(n_rows, size=sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+            # Restart empty lists from random sample points
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = sample[rng.choice(sample_size, size=len(empty))]
+            centroids = _normalize(sums)
+
+        assignment = _nearest(data, centroids)
+        list_rows = np.argsort(assignment, kind='stable').astype(np.int32)
+        list_indptr = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_indptr[1:])
+        return cls(centroids, list_indptr, list_rows, data[list_rows], key)
+
+    def save(self, path):
+        np.savez(
+            path,
+            version=np.int32(ANN_FORMAT_VERSION),
+            key=np.array(self.key),
+            centroids=self.centroids,
+            list_indptr=self.list_indptr,
+            list_rows=self.list_rows,
+            vectors=self.vectors,
+        )
+
+    @classmethod
+    def load(cls, path, key):
+        """Load a saved index, or return None if it is missing or was built from other vectors."""
+        if not path or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data['version']) != ANN_FORMAT_VERSION or str(data['key']) != key:
+                return None
+            return cls(data['centroids'], data['list_indptr'], data['list_rows'], data['vectors'], key)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (
+            self.centroids, self.list_indptr, self.list_rows, self.vectors, self.positions,
+        ))
+
+    def __len__(self):
+        return len(self.list_rows)
+
+    def query_vector(self, row):
+        """The stored vector of an indexed row (scaled by 1 / M), usable as a query."""
+        return self.vectors[self.positions[row], :-1]
+
+    def search(self, query, k, n_probe):
+        """
+        Approximate top-k rows by inner product with query, best first.
+
+        Only the n_probe lists whose centroids score highest are scanned, so
+        the cost is about n_probe / n_lists of a full scan. Returns (rows,
+        scores); fewer than k rows come back if the probed lists are smaller.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if len(query) == self.vectors.shape[1] - 1:
+            query = np.append(query, np.float32(0.0))
+        n_probe = max(1, min(n_probe, self.n_lists))
+        lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+
+        starts, ends = self.list_indptr[lists], self.list_indptr[lists + 1]
+        positions = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+        scores = self.vectors[positions] @ query
+        if len(positions) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            positions, scores = positions[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return self.list_rows[positions[order]], scores[order]
+
+
+def embed_rows(matrix, dim, seed=0, power_iterations=2):
+    """
+    dim-dimensional embeddings of the rows of a sparse matrix.
+
+    Rows are projected onto the top dim right singular vectors, found with a
+    randomized range finder, so inner products between embeddings approximate
+    inner products between the original rows along their main directions.
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+    n_rows, n_cols = matrix.shape
+    dim = max(1, min(dim, n_rows, n_cols))
+    rng = np.random.default_rng(seed)
+    width = min(dim + 10, n_rows, n_cols)
+    basis, _ = np.linalg.qr(matrix.T @ rng.normal(size=(n_rows, width)).astype(np.float32))
+    for _ in range(power_iterations):
+        basis, _ = np.linalg.qr(matrix @ basis)
+        basis, _ = np.linalg.qr(matrix.T @ basis)
+    projected = matrix @ basis
+    _, _, right = np.linalg.svd(projected, full_matrices=False)
+    return np.ascontiguousarray(projected @ right[:dim].T, dtype=np.float32)
+
+
+def _to_sphere(vectors):
+    """Append sqrt(M^2 - |x|^2) to every row and divide by M, putting all rows on the unit sphere."""
+    norms = np.linalg.norm(vectors, axis=1)
+    scale = float(norms.max()) if len(norms) and norms.max() > 0 else 1.0
+    extra = np.sqrt(np.maximum(scale ** 2 - norms ** 2, 0.0))[:, None]
+    return (np.hstack([vectors, extra]) / scale).astype(np.float32)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _nearest(data, centroids):
+    """Index of the most similar centroid for every row, in blocks."""
+    block_size = max(1, int(MAX_BLOCK_BYTES // (4 * len(centroids))))
+    return np.concatenate([
+        np.argmax(data[start:start + block_size] @ centroids.T, axis=1)
+        for start in range(0, len(data), block_size)
+    ]) if len(data) else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,329 @@
+import numpy as np
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 10000  # Max users whose neighbor lists are kept
+MIN_NEIGHBOR_SUPPORT = 2    # Neighbors that must have rated a movie to predict it
+MAX_BLOCK_BYTES = 128 * 2**20  # Dense working memory per block in batch scoring
+
+_models = weakref.WeakSet()
+
+
+class UserCFModel:
+    """
+    User-user neighborhood model over a RatingStore.
+
+    Ratings are centered on each user's mean, so the cosine between two users'
+    centered vectors is a Pearson correlation computed over their full profiles.
+    Similarities for one user are a single sparse product restricted to the
+    movies that user rated, so only co-raters are ever touched.
+    """
+
+    def __init__(self, store, cache_size=DEFAULT_CACHE_SIZE):
+        counts = store.user_counts()
+        cumulative = np.concatenate(([0.0], np.cumsum(store.user_values, dtype=np.float64)))
+        sums = cumulative[store.user_indptr[1:]] - cumulative[store.user_indptr[:-1]]
+        user_means = (sums / np.maximum(counts, 1)).astype(np.float32)
+
+        user_centered = store.user_values - np.repeat(user_means, counts)
+        movie_centered = store.movie_values - user_means[store.movie_user_idx]
+        self._init(store, cache_size, user_means, user_centered, movie_centered)
+
+    @classmethod
+    def from_arrays(cls, store, arrays, cache_size=DEFAULT_CACHE_SIZE):
+        """Rebuild a model from to_arrays() output without recomputing it."""
+        model = cls.__new__(cls)
+        model._init(
+            store, cache_size, arrays['user_means'], arrays['user_centered'],
+            arrays['movie_centered'], arrays['user_norms'],
+        )
+        return model
+
+    def to_arrays(self):
+        return {
+            'user_means': self.user_means,
+            'user_centered': self.by_user.data,
+            'movie_centered': self.by_movie.data,
+            'user_norms': self.user_norms,
+        }
+
+    def _init(self, store, cache_size, user_means, user_centered, movie_centered, user_norms=None):
+        self.store = store
+        self.cache_size = cache_size
+        self.user_means = user_means
+
+        shape = (store.n_users, store.n_movies)
+        self.by_user = sparse.csr_matrix((user_centered, store.user_movie_idx, store.user_indptr), shape=shape)
+        self.by_movie = sparse.csr_matrix(
+            (movie_centered, store.movie_user_idx, store.movie_indptr), shape=shape[::-1]
+        )
+        if user_norms is None:
+            user_norms = np.sqrt(np.asarray(self.by_user.multiply(self.by_user).sum(axis=1)).ravel())
+        self.user_norms = user_norms
+
+        self.ann = None
+        self._neighbor_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        _models.add(self)
+
+    def attach_ann(self, index, n_probe, n_candidates):
+        """
+        Find neighbor candidates with an IVFIndex over user embeddings (rows in
+        user index order) and rerank only those exactly, instead of scoring
+        every co-rater.
+        """
+        self.ann = index
+        self.ann_n_probe = n_probe
+        self.ann_candidates = n_candidates
+        with self._lock:
+            self._neighbor_cache.clear()
+
+    def neighbors(self, user_idx, k_neighbors, min_overlap, use_cache=True, pending=None):
+        """
+        Top-k (user indices, similarities) for a user, most similar first.
+
+        pending ({movie index: rating}) holds ratings not yet in the store; they
+        are merged into the user's row and the result is not cached.
+        """
+        if pending:
+            return self._compute_neighbors(user_idx, k_neighbors, min_overlap, self.merged_row(user_idx, pending))
+        key = (user_idx, k_neighbors, min_overlap)
+        if use_cache:
+            with self._lock:
+                cached = self._neighbor_cache.get(key)
+                if cached is not None:
+                    self._neighbor_cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return cached
+                self.cache_misses += 1
+
+        result = self._compute_neighbors(user_idx, k_neighbors, min_overlap)
+
+        if use_cache and self.cache_size > 0:
+            with self._lock:
+                self._neighbor_cache[key] = result
+                while len(self._neighbor_cache) > self.cache_size:
+                    self._neighbor_cache.popitem(last=False)
+        return result
+
+    def _row(self, user_idx):
+        """(movie indices, centered ratings, mean, norm) of a stored user."""
+        movies, _ = self.store.user_row(user_idx)
+        start, end = self.by_user.indptr[user_idx], self.by_user.indptr[user_idx + 1]
+        return movies, self.by_user.data[start:end], self.user_means[user_idx], self.user_norms[user_idx]
+
+    def merged_row(self, user_idx, pending):
+        """_row with pending {movie index: rating} replacing or adding to the stored ratings, re-centered."""
+        movies, ratings = self.store.user_row(user_idx)
+        pending_movies = np.fromiter(pending.keys(), dtype=movies.dtype, count=len(pending))
+        pending_ratings = np.fromiter(pending.values(), dtype=np.float32, count=len(pending))
+        keep = ~np.isin(movies, pending_movies)
+        movies = np.concatenate([movies[keep], pending_movies])
+        ratings = np.concatenate([ratings[keep], pending_ratings])
+        order = np.argsort(movies)
+        movies, ratings = movies[order], ratings[order]
+        mean = np.float32(ratings.mean(dtype=np.float64))
+        centered = ratings - mean
+        return movies, centered, mean, np.float32(np.sqrt(np.sum(centered * centered)))
+
+    def _compute_neighbors(self, user_idx, k_neighbors, min_overlap, row=None):
+        row = row if row is not None else self._row(user_idx)
+        if self.ann is not None:
+            return self._ann_neighbors(user_idx, k_neighbors, min_overlap, row)
+        movies, target, _, target_norm = row
+
+        co_raters = self.by_movie[movies]
+        dots = co_raters.T @ target
+        overlap = np.bincount(co_raters.indices, minlength=self.store.n_users)
+
+        norms = self.user_norms * target_norm
+        similarities = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+        similarities[(overlap < min_overlap) | (similarities <= 0)] = 0.0
+        similarities[user_idx] = 0.0
+
+        candidates = np.flatnonzero(similarities > 0)
+        candidates = candidates[_top_neighbors(candidates, similarities[candidates], k_neighbors)]
+        return candidates.astype(np.int32), similarities[candidates].astype(np.float32)
+
+    def _ann_neighbors(self, user_idx, k_neighbors, min_overlap, row=None):
+        """
+        _compute_neighbors over the ANN candidates: same similarities and filters,
+        exact on that set. Candidates come from the user's stored embedding even
+        when row merges in pending ratings.
+        """
+        candidates, _ = self.ann.search(
+            self.ann.query_vector(user_idx), max(self.ann_candidates, k_neighbors) + 1, self.ann_n_probe
+        )
+        candidates = np.sort(candidates[candidates != user_idx])
+
+        movies, centered, _, target_norm = row if row is not None else self._row(user_idx)
+        target = np.zeros(self.store.n_movies, dtype=self.by_user.dtype)
+        target[movies] = centered
+        rated = np.zeros(self.store.n_movies, dtype=np.float64)
+        rated[movies] = 1.0
+
+        rows = self.by_user[candidates]
+        dots = rows @ target
+        overlap = np.bincount(
+            np.repeat(np.arange(len(candidates)), np.diff(rows.indptr)),
+            weights=rated[rows.indices], minlength=len(candidates),
+        )
+
+        norms = self.user_norms[candidates] * target_norm
+        similarities = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+        keep = (overlap >= min_overlap) & (similarities > 0)
+        candidates, similarities = candidates[keep], similarities[keep]
+        order = _top_neighbors(candidates, similarities, k_neighbors)
+        return candidates[order].astype(np.int32), similarities[order].astype(np.float32)
+
+    def predict(self, user_idx, neighbor_idx, weights, min_support=MIN_NEIGHBOR_SUPPORT, pending=None):
+        """
+        Aggregate neighbor deviations into predicted ratings.
+
+        Returns (movie indices, predictions, support) for movies the user has not
+        rated and at least min_support neighbors have. With pending ratings (as
+        in neighbors()) the user's mean and rated movies include them.
+        """
+        rows = self.by_user[neighbor_idx]
+        numerator = rows.T @ weights
+        support = np.bincount(rows.indices, minlength=self.store.n_movies)
+        denominator = np.bincount(
+            rows.indices, weights=np.repeat(np.abs(weights), np.diff(rows.indptr)),
+            minlength=self.store.n_movies,
+        )
+
+        rated, _, mean, _ = self.merged_row(user_idx, pending) if pending else self._row(user_idx)
+        support[rated] = 0
+        candidates = np.flatnonzero((support >= min_support) & (denominator > 0))
+        predictions = mean + numerator[candidates] / denominator[candidates]
+        return candidates, np.clip(predictions, 0.5, 5.0), support[candidates]
+
+    def _rated_matrices(self):
+        """Binary (rated / not rated) copies of the centered matrices, built on first use."""
+        if not hasattr(self, '_rated_by_user'):
+            rated = self.by_user.copy()
+            rated.data = np.ones_like(rated.data)
+            self._rated_by_user = rated
+            rated = self.by_movie.copy()
+            rated.data = np.ones_like(rated.data)
+            self._rated_by_movie = rated
+        return self._rated_by_user, self._rated_by_movie
+
+    def recommend_batch(self, user_idx, k_neighbors, min_overlap, n_recs,
+                        min_support=MIN_NEIGHBOR_SUPPORT, max_block_bytes=MAX_BLOCK_BYTES):
+        """
+        Score many users with matrix-matrix products.
+
+        Users are processed in blocks: one sparse product gives every user's
+        similarity to every other user (or the ANN index, when attached, gives
+        each user's neighbors), the top-k per row become a sparse
+        weight matrix, and a second product aggregates neighbor deviations for
+        the whole block. Returns a list of (movie indices, predictions) per
+        user, ranked like predict() and truncated to n_recs.
+        """
+        user_idx = np.asarray(user_idx, dtype=np.int64)
+        rated_by_user, _ = self._rated_matrices()
+        n_users, n_movies = self.by_user.shape
+        k_neighbors = max(1, min(k_neighbors, n_users - 1))
+        block_size = max(1, int(max_block_bytes // (8 * max(n_users, n_movies))))
+
+        results = []
+        for start in range(0, len(user_idx), block_size):
+            users = user_idx[start:start + block_size]
+            if self.ann is not None:
+                weights = self._ann_weights(users, k_neighbors, min_overlap)
+            else:
+                weights = self._exact_weights(users, k_neighbors, min_overlap)
+            abs_weights = abs(weights)
+            has_neighbor = weights.copy()
+            has_neighbor.data = np.ones_like(has_neighbor.data)
+
+            numerator = (weights @ self.by_user).toarray()
+            denominator = (abs_weights @ rated_by_user).toarray()
+            support = (has_neighbor @ rated_by_user).toarray()
+            support[rated_by_user[users].toarray() > 0] = 0
+
+            for row, user in enumerate(users):
+                candidates = np.flatnonzero((support[row] >= min_support) & (denominator[row] > 0))
+                predictions = np.clip(
+                    self.user_means[user] + numerator[row, candidates] / denominator[row, candidates], 0.5, 5.0
+                )
+                order = np.lexsort((candidates, -support[row, candidates], -predictions))[:n_recs]
+                results.append((candidates[order], predictions[order]))
+        return results
+
+    def _exact_weights(self, users, k_neighbors, min_overlap):
+        """Sparse (users x all users) top-k similarity weights from one similarity product."""
+        rated_by_user, rated_by_movie = self._rated_matrices()
+        rows = np.arange(len(users))
+        dots = (self.by_user[users] @ self.by_movie).toarray()
+        overlap = (rated_by_user[users] @ rated_by_movie).toarray()
+        norms = self.user_norms[users, None] * self.user_norms[None, :]
+        sims = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+        sims[(overlap < min_overlap) | (sims <= 0)] = 0.0
+        sims[rows, users] = 0.0
+
+        # Per row, the same neighbors as _top_neighbors picks in the single-user path
+        rounded = np.round(sims, 6)
+        kth = -np.partition(-rounded, k_neighbors - 1, axis=1)[:, k_neighbors - 1]
+        top_rows, top_users = np.nonzero((rounded > 0) & (rounded >= kth[:, None]))
+        order = np.lexsort((top_users, -rounded[top_rows, top_users], top_rows))
+        top_rows, top_users = top_rows[order], top_users[order]
+        rank = np.arange(len(top_rows)) - np.searchsorted(top_rows, top_rows)
+        top_rows, top_users = top_rows[rank < k_neighbors], top_users[rank < k_neighbors]
+        return sparse.csr_matrix(
+            (sims[top_rows, top_users], (top_rows, top_users)), shape=(len(users), self.store.n_users)
+        )
+
+    def _ann_weights(self, users, k_neighbors, min_overlap):
+        """_exact_weights with each user's neighbors taken from the ANN index."""
+        found = [self._ann_neighbors(user, k_neighbors, min_overlap) for user in users]
+        indptr = np.zeros(len(users) + 1, dtype=np.int64)
+        np.cumsum([len(neighbors) for neighbors, _ in found], out=indptr[1:])
+        return sparse.csr_matrix(
+            (np.concatenate([sims for _, sims in found]), np.concatenate([n for n, _ in found]), indptr),
+            shape=(len(users), self.store.n_users),
+        )
+
+    def clear_cache(self):
+        with self._lock:
+            self._neighbor_cache.clear()
+
+
+def _top_neighbors(candidates, similarities, k):
+    """
+    Positions of the k most similar candidates, most similar first. Like
+    recommender.top_k_indices, similarities are compared at 6 decimals and
+    ties go to the lower user index, so the single-user and batch paths
+    choose the same neighbors.
+    """
+    rounded = np.round(similarities, 6)
+    top = np.flatnonzero(rounded > 0)
+    if len(top) > k:
+        # Keep everything tied with the k-th similarity so the index tie-break is exact
+        kth = -np.partition(-rounded[top], k - 1)[k - 1]
+        top = top[rounded[top] >= kth]
+    return top[np.lexsort((candidates[top], -rounded[top]))[:k]]
+
+
+def neighbor_cache_stats():
+    """Entry, hit and miss counts of the neighbor caches of every live model."""
+    models = list(_models)
+    return {
+        'entries': sum(len(m._neighbor_cache) for m in models),
+        'hits': sum(m.cache_hits for m in models),
+        'misses': sum(m.cache_misses for m in models),
+    }
+
+
+def clear_neighbor_caches():
+    """Drop cached neighbor lists from every live model."""
+    for model in list(_models):
+        model.clear_cache()
@@ -8,11 +8,99 @@ MOVIES_CSV = os.path.join(BASE_DIR, 'movies.csv')
 # Parquet cache (faster load after first run)
 CACHE_RATINGS_PARQUET = os.path.join(BASE_DIR, 'cache_ratings.parquet')
 CACHE_MOVIES_PARQUET = os.path.join(BASE_DIR, 'cache_movies.parquet')
+CACHE_MANIFEST_PATH = os.path.join(BASE_DIR, 'cache_manifest.json')  # Source fingerprints; a stale cache is rebuilt
+CSV_CHUNK_SIZE = 250_000    # Rating rows parsed per chunk when loading the CSV (bounds peak memory)
+
+# Memory-mapped snapshot of the loaded data (fastest startup; shared page cache across workers)
+SNAPSHOT_DIR = os.path.join(BASE_DIR, 'cache_snapshot')
+
+# Precomputed item-item neighbor index (built on first load if missing)
+ITEM_INDEX_PATH = os.path.join(BASE_DIR, 'cache_item_neighbors.npz')
+
+# Offline recommendations written by build_recommendations.py (served when present)
+PRECOMPUTED_RECS_PARQUET = os.path.join(BASE_DIR, 'cache_user_recommendations.parquet')
+PRECOMPUTED_TOP_N = 20  # Recommendations materialized per user
+
+# Matrix factorization model written by train_factors.py; when present it serves
+# /api/recommendations and /api/custom-recommendations (set to None to disable)
+FACTORS_PATH = os.path.join(BASE_DIR, 'cache_factors.npz')
+ALS_RANK = 32               # Latent factors per user and movie
+ALS_REGULARIZATION = 0.1    # L2 penalty, scaled by each user's/movie's rating count
+ALS_PRIOR_COUNT = 20        # Ratings' worth of extra penalty (keeps sparse users/movies near the biases)
+ALS_ITERATIONS = 10         # Alternating user/movie solves
+ALS_THREADS = None          # Solver threads for training (None = one per CPU)
+
+# Approximate nearest-neighbor (IVF) indexes for user neighbors and factor scoring,
+# built on load and cached in ANN_INDEX_DIR. Sets smaller than ANN_MIN_ROWS are scanned exactly.
+ANN_INDEX_DIR = os.path.join(BASE_DIR, 'cache_ann')
+ANN_MIN_ROWS = 50_000       # Users (or movies) needed before an index is used
+ANN_DIM = 64                # Dimensions of the user rating embeddings
+ANN_N_LISTS = None          # k-means lists per index (None = sqrt(rows))
+ANN_N_PROBE = 16            # Lists scanned per query: higher = better recall, slower
+ANN_CANDIDATES = 400        # Approximate hits rescored exactly per query
+
+# Rating ingestion (POST /api/ratings); set RATINGS_WAL_PATH = None to disable
+RATINGS_WAL_PATH = os.path.join(BASE_DIR, 'cache_ratings_wal.csv')  # Write-ahead log, replayed on startup
+INGEST_TAIL_PATH = None             # CSV file to tail for new ratings (userId,movieId,rating[,timestamp])
+INGEST_COMPACT_THRESHOLD = 10000    # Pending ratings that trigger a compaction
+INGEST_COMPACT_INTERVAL = 60        # Max seconds between compactions while ratings are pending
+INGEST_PERSIST_ON_COMPACT = True    # Rewrite the Parquet cache and snapshot after compacting, then trim the log
+
+# Paged endpoints (/api/users, /api/user-history); ?format=ndjson streams instead
+API_PAGE_SIZE = 1000        # Items per page when the request has no limit
+API_MAX_PAGE_SIZE = 10000   # Largest limit a request may ask for
 
 # Collaborative filtering parameters
 K_NEIGHBORS = 30  # Number of similar users to consider
 MIN_OVERLAP = 5   # Minimum number of common movies for similarity calculation
 N_RECOMMENDATIONS = 5  # Default number of recommendations to return
+MAX_RECOMMENDATIONS = 100  # Max limit of the recommendation endpoints
+BATCH_MAX_SIZE = 1000  # Max users plus rating sets per /api/recommendations/batch request
+
+# Item-item parameters
+ITEM_NEIGHBORS = 50     # Neighbors stored per movie in the item index
+ITEM_SHRINKAGE = 25.0   # Shrinks similarities of movie pairs with few co-raters
+
+# Top movies
+TOP_MOVIES_MIN_COUNT = 10  # Default minimum ratings for /api/top-movies
+BAYES_PRIOR_COUNT = 25     # Weight of the global mean in the Bayesian-weighted score
+
+# Trending: per-movie rating counts in time buckets, ranked with exponential decay
+TRENDING_BUCKET_SECONDS = 86400  # Bucket width: 86400 (daily) or 604800 (weekly); None skips timestamps
+TRENDING_WINDOW_DAYS = 30        # Default window of /api/trending
+TRENDING_HALF_LIFE_DAYS = 7      # Default half-life of a rating's weight (0 = no decay)
+TRENDING_MIN_COUNT = 1           # Default minimum ratings in the window
 
 # Cache settings
 ENABLE_SIMILARITY_CACHE = True
+ENABLE_RESULT_CACHE = True            # Cache /api/custom-recommendations results
+RESULT_CACHE_SIZE = 4096              # Max cached rating sets
+RESULT_CACHE_MAX_BYTES = 32 * 2**20   # Approximate memory bound for cached results
+RESULT_CACHE_TTL = 3600               # Seconds before a cached result expires (0 = never)
+
+# HTTP caching of /api/movies/<id>, /api/search-movies and /api/top-movies
+HTTP_CACHE_MAX_AGE = 60             # Cache-Control max-age in seconds (0 = always revalidate)
+HTTP_CACHE_SIZE = 2048              # Rendered responses kept (0 = ETags only)
+HTTP_CACHE_MAX_BYTES = 16 * 2**20   # Approximate memory bound for rendered responses
+HTTP_COMPRESS_MIN_BYTES = 1024      # Smaller bodies are sent uncompressed
+
+# Serving: recommendation scoring runs on a bounded compute pool (SERVING_WORKERS = 0 runs it inline)
+SERVING_WORKERS = None      # Concurrent computations (None = one per CPU)
+SERVING_MAX_QUEUE = 32      # Computations allowed to wait for a worker; more get a 503
+SERVING_TIMEOUT = 30        # Seconds a request waits for its computation before a 503
+SERVING_THREADS = 64        # Request threads of the ASGI front end (asgi.py); each request holds one
+
+# Sharded genre scoring: large catalogs are split across worker processes that map shared memory
+SHARDED_SCORING_WORKERS = 0           # Worker processes (0 = score inline)
+SHARDED_SCORING_MIN_MOVIES = 100_000  # Smaller catalogs are scored inline
+SHARD_MIN_MOVIES = 50_000             # Movies per shard at least; more shards as the catalog grows
+
+# Data lifecycle: background load at startup, /healthz and /readyz, reloads without downtime
+RELOAD_SIGNAL = 'SIGHUP'    # Signal that reloads the data (None = no handler)
+RELOAD_NICE = 10            # Niceness added to the reload thread so requests keep priority
+ADMIN_TOKEN = None          # Bearer token for POST /admin/reload (None = loopback clients only)
+
+# Instrumentation (GET /metrics); the profiler is off unless PROFILE_SAMPLE_RATE > 0
+PROFILE_SAMPLE_RATE = 0.0            # Fraction of requests run under cProfile
+PROFILE_SLOW_MS = 500                # Profiled requests at least this slow are dumped and logged
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')  # Where slow request .prof files are written
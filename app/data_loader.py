@@ -1,79 +1,423 @@
 import pandas as pd
 import numpy as np
+import hashlib
 import logging
 import os
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-logger = logging.getLogger(__name__)
+from app.ann import IVFIndex, embed_rows
+from app.collaborative import UserCFModel
+from app.factorization import FactorModel
+from app.filters import MovieFilterIndex
+from app.item_index import ItemNeighborIndex
+from app.metrics import LOADS, load_phase, record_bundle
+from app.movie_stats import MovieStats
+from app.parquet_cache import check_cache, read_manifest, read_movies, source_fingerprints, write_manifest, write_movies
+from app.precomputed import PrecomputedRecommendations
+from app.rating_reader import DEFAULT_CHUNK_SIZE, has_timestamps, read_ratings_csv, read_ratings_parquet
+from app.rating_store import RatingStore, history_order, user_ratings_view, movie_ratings_view
+from app.recommender import build_genre_index
+from app.search_index import SearchIndex
+from app.snapshot import load_snapshot, save_snapshot
+from app.trending import DAY_SECONDS, TrendingIndex
 
+logger = logging.getLogger(__name__)
 
-def _build_structures_from_dfs(combined_df, movies_df):
-    """Build in-memory structures from combined and movies DataFrames."""
-    user_ratings = defaultdict(dict)
-    movie_ratings = defaultdict(dict)
+def _build_movie_metadata(movies_df):
+    """Build dict[movieId, {title, genres}] from the movies DataFrame."""
+    movie_ids = movies_df['movieId'].astype('int64').tolist()
+    if 'title' in movies_df.columns:
+        titles = movies_df['title'].astype(str).tolist()
+    else:
+        titles = [f'Movie {movie_id}' for movie_id in movie_ids]
+    if 'genres' in movies_df.columns:
+        genres = movies_df['genres'].astype(str).tolist()
+    else:
+        genres = [''] * len(movie_ids)
     
-    for _, row in combined_df.iterrows():
-        user_id = int(row['userId'])
-        movie_id = int(row['movieId'])
-        rating = float(row['rating'])
-        user_ratings[user_id][movie_id] = rating
-        movie_ratings[movie_id][user_id] = rating
+    return {
+        movie_id: {'title': title, 'genres': genre}
+        for movie_id, title, genre in zip(movie_ids, titles, genres)
+    }
+
+
+def read_movies_csv(path):
+    """Read movies.csv, dropping rows without a numeric movieId."""
+    movies_df = pd.read_csv(path)
+    if 'movieId' not in movies_df.columns:
+        raise ValueError("Missing required column 'movieId' in movies.csv")
+    movies_df['movieId'] = pd.to_numeric(movies_df['movieId'], errors='coerce').astype('Int64')
+    return movies_df[movies_df['movieId'].notna()]
+
+
+def compute_data_version(store, movie_metadata):
+    """Content hash of the ratings and catalog, identifying a data bundle."""
+    digest = hashlib.blake2b(digest_size=8)
+    for array in (store.user_ids, store.movie_ids, store.user_indptr, store.user_movie_idx, store.user_values):
+        digest.update(np.ascontiguousarray(array).data)
+    for movie_id in sorted(movie_metadata):
+        info = movie_metadata[movie_id]
+        digest.update(f"{movie_id}\t{info['title']}\t{info['genres']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_store(user_ids, movie_ids, ratings, movies_df):
+    """Build the RatingStore and movie metadata from parallel rating arrays and the movies DataFrame."""
+    movie_metadata = _build_movie_metadata(movies_df)
     
-    movie_metadata = {}
-    for _, row in movies_df.iterrows():
-        movie_id = int(row['movieId'])
-        movie_metadata[movie_id] = {
-            'title': str(row.get('title', f'Movie {movie_id}')),
-            'genres': str(row.get('genres', ''))
-        }
+    store = RatingStore.from_arrays(
+        user_ids, movie_ids, ratings,
+        catalog_movie_ids=np.fromiter(movie_metadata.keys(), dtype=np.int32, count=len(movie_metadata)),
+    )
     
-    for movie_id in set(combined_df['movieId'].dropna().astype(int)):
+    for movie_id in store.movie_ids[store.movie_counts() > 0].tolist():
         if movie_id not in movie_metadata:
             movie_metadata[movie_id] = {'title': f'Movie {movie_id}', 'genres': ''}
     
-    user_ids = set(user_ratings.keys())
-    movie_ids = set(movie_ratings.keys()) | set(movie_metadata.keys())
+    return store, movie_metadata
+
+
+def build_trending(store, columns, config):
+    """The time-bucketed TrendingIndex of ratings read with timestamps, or None."""
+    bucket_seconds = config.get('TRENDING_BUCKET_SECONDS', DAY_SECONDS)
+    if not bucket_seconds or columns.timestamps is None:
+        return None
+    _, movies, ratings = columns.arrays()
+    return TrendingIndex.from_ratings(
+        np.searchsorted(store.movie_ids, movies), columns.timestamp_array(), ratings,
+        len(store.movie_ids), bucket_seconds,
+    )
+
+
+def build_bundle(store, movie_metadata, bayes_prior_count=25, genre_index=None):
+    """
+    Build the data bundle's derived structures around a RatingStore.
+    
+    genre_index can be passed in to reuse one built for the same catalog.
+    """
+    user_ids = set(store.user_ids.tolist())
+    movie_ids = set(store.movie_ids.tolist())
+    
+    with load_phase('data_version'):
+        version = compute_data_version(store, movie_metadata)
+    if genre_index is None:
+        with load_phase('genre_index'):
+            genre_index = build_genre_index(movie_metadata, movie_ids)
+    with load_phase('movie_stats'):
+        movie_stats = MovieStats.from_store(store, prior_count=bayes_prior_count)
+    with load_phase('user_cf'):
+        user_cf = UserCFModel(store)
+    with load_phase('search_index'):
+        search_index = SearchIndex.from_store(movie_metadata, store)
+    with load_phase('history_order'):
+        order = history_order(store)
+    with load_phase('movie_filters'):
+        movie_filters = MovieFilterIndex.from_catalog(store.movie_ids, movie_metadata, genre_index)
     
     return {
-        'user_ratings': dict(user_ratings),
-        'movie_ratings': dict(movie_ratings),
+        'version': version,
+        'rating_store': store,
+        'user_ratings': user_ratings_view(store),
+        'movie_ratings': movie_ratings_view(store),
         'movie_metadata': movie_metadata,
         'user_ids': user_ids,
         'movie_ids': movie_ids,
-        'combined_df': combined_df,
+        'genre_index': genre_index,
+        'movie_stats': movie_stats,
+        'user_cf': user_cf,
+        'search_index': search_index,
+        'history_order': order,
+        'movie_filters': movie_filters,
+    }
+
+
+def bundle_nbytes(data):
+    """Array memory of each bundle component, in bytes."""
+    stats = data['movie_stats']
+    sizes = {
+        'rating_store': data['rating_store'].nbytes,
+        'user_cf': _nbytes(data['user_cf'].to_arrays()),
+        'genre_index': _nbytes(data['genre_index']),
+        'movie_stats': _nbytes([stats.counts, stats.sums, stats.means, stats.bayesian]),
+        'search_index': _nbytes(data['search_index'].to_arrays()),
+        'history_order': data['history_order'].nbytes,
+        'movie_filters': data['movie_filters'].nbytes,
+    }
+    if data.get('trending') is not None:
+        sizes['trending'] = data['trending'].nbytes
+    item_index = data.get('item_index')
+    if item_index is not None:
+        sizes['item_index'] = item_index.neighbors.nbytes + item_index.similarities.nbytes
+    factors = data.get('factors')
+    if factors is not None:
+        sizes['factors'] = factors.nbytes
+        if factors.ann is not None:
+            sizes['ann_items'] = factors.ann.nbytes
+    if data['user_cf'].ann is not None:
+        sizes['ann_users'] = data['user_cf'].ann.nbytes
+    return sizes
+
+
+def _nbytes(value):
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    return int(getattr(value, 'nbytes', 0))
+
+
+def attach_item_index(data, config):
+    """Load the item-item neighbor index, building and saving it if missing or stale."""
+    path = config.get('ITEM_INDEX_PATH')
+    store = data['rating_store']
+    metadata = item_index_metadata(data, config)
+    try:
+        index = ItemNeighborIndex.load(path, store.movie_ids, metadata)
+    except Exception as e:
+        logger.warning(f"Item index read failed: {e}. Rebuilding.")
+        index = None
+    
+    if index is None:
+        logger.info("Building item-item neighbor index...")
+        with load_phase('item_index'):
+            index = ItemNeighborIndex.build(
+                data['user_cf'].by_movie,
+                store.movie_ids,
+                n_neighbors=metadata['n_neighbors'],
+                shrinkage=metadata['shrinkage'],
+            )
+        if path:
+            try:
+                index.save(path, metadata)
+                logger.info(f"Item index saved to {path}")
+            except Exception as e:
+                logger.warning(f"Could not save item index: {e}")
+    
+    data['item_index'] = index
+
+
+def item_index_metadata(data, config):
+    """Data version and parameters a saved item index must have been built with to be used."""
+    return {
+        'data_version': data['version'],
+        'n_neighbors': int(config.get('ITEM_NEIGHBORS', 50)),
+        'shrinkage': float(config.get('ITEM_SHRINKAGE', 25.0)),
+    }
+
+
+def _attach_factors(data, config):
+    """Load the matrix factorization model written by train_factors.py, if any."""
+    path = config.get('FACTORS_PATH')
+    try:
+        factors = FactorModel.load(path)
+    except Exception as e:
+        logger.warning(f"Factor model read failed: {e}. Ignoring.")
+        factors = None
+    
+    if factors is not None:
+        logger.info(f"Loaded {factors.rank}-factor model for {len(factors.user_ids)} users from {path}")
+        if factors.metadata.get('data_version') != data['version']:
+            # Still usable: users it has not seen are folded in from their ratings
+            logger.info("Factor model was trained on other data; rerun train_factors.py to refresh it")
+    data['factors'] = factors
+
+
+def attach_ann_indexes(data, config):
+    """
+    Attach IVF indexes to the user CF model (over rating embeddings) and the
+    factor model (over movie factors) when they cover at least ANN_MIN_ROWS
+    rows. Indexes are loaded from ANN_INDEX_DIR when built from the same data
+    and parameters, else built and saved there.
+    """
+    min_rows = config.get('ANN_MIN_ROWS', 50_000)
+    n_lists = config.get('ANN_N_LISTS')
+    n_probe = config.get('ANN_N_PROBE', 16)
+    n_candidates = config.get('ANN_CANDIDATES', 400)
+    
+    user_cf = data['user_cf']
+    if min_rows is not None and data['rating_store'].n_users >= min_rows:
+        dim = config.get('ANN_DIM', 64)
+        index = _load_or_build_ann(
+            config, 'users.npz', f"users-{data['version']}-{dim}-{n_lists}",
+            lambda: embed_rows(user_cf.by_user, dim), 'cosine', n_lists,
+        )
+        user_cf.attach_ann(index, n_probe, n_candidates)
+    
+    factors = data.get('factors')
+    if factors is not None and min_rows is not None and len(factors.movie_ids) >= min_rows:
+        key = f"items-{factors.model_id}-{n_lists}"
+        if factors.ann is None or factors.ann.key != key:
+            index = _load_or_build_ann(config, 'items.npz', key, factors.item_vectors, 'ip', n_lists)
+            factors.attach_ann(index, n_probe, n_candidates)
+
+
+def _load_or_build_ann(config, name, key, vectors, metric, n_lists):
+    directory = config.get('ANN_INDEX_DIR')
+    path = os.path.join(directory, name) if directory else None
+    try:
+        index = IVFIndex.load(path, key)
+    except Exception as e:
+        logger.warning(f"ANN index read failed: {e}. Rebuilding.")
+        index = None
+    if index is not None:
+        return index
+    
+    logger.info(f"Building ANN index {name}...")
+    index = IVFIndex.build(vectors(), metric=metric, n_lists=n_lists, key=key)
+    if path:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp.npz"
+            index.save(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not save ANN index: {e}")
+    return index
+
+
+def _attach_precomputed(data, config):
+    """Load recommendations materialized for this data version and CF parameters, if any."""
+    path = config.get('PRECOMPUTED_RECS_PARQUET')
+    try:
+        precomputed = PrecomputedRecommendations.load(path, precomputed_metadata(data, config))
+    except Exception as e:
+        logger.warning(f"Precomputed recommendations read failed: {e}. Ignoring.")
+        precomputed = None
+    
+    if precomputed is not None:
+        logger.info(f"Loaded precomputed recommendations for {len(precomputed.user_ids)} users from {path}")
+    data['precomputed_recs'] = precomputed
+
+
+def precomputed_metadata(data, config):
+    """Metadata a precomputed recommendations file must carry to be served."""
+    return {
+        'data_version': data['version'],
+        'k_neighbors': config.get('K_NEIGHBORS', 30),
+        'min_overlap': config.get('MIN_OVERLAP', 5),
+        'model': data['factors'].model_id if data.get('factors') is not None else 'user_cf',
     }
 
 
 def load_data(config):
     """
-    Load data from Parquet cache if present (fast), else from CSV and create cache.
+    Load ratings and movies, then attach the precomputed indexes.
+    
+    When SNAPSHOT_DIR holds a snapshot matching the input files, the bundle is
+    rebuilt around its memory-mapped arrays instead; otherwise the snapshot is
+    (re)written after a full load.
     
     Returns a dictionary containing:
-    - user_ratings: dict[userId, dict[movieId, rating]]
-    - movie_ratings: dict[movieId, dict[userId, rating]]
+    - version: content hash identifying this data
+    - rating_store: RatingStore with CSR/CSC rating arrays
+    - user_ratings: read-only mapping userId -> {movieId: rating}
+    - movie_ratings: read-only mapping movieId -> {userId: rating}
     - movie_metadata: dict[movieId, {title, genres}]
     - user_ids: set of all user IDs
     - movie_ids: set of all movie IDs
+    - genre_index: genre vocabulary, movie x genre matrix and row norms
+    - movie_stats: per-movie count, sum, mean and Bayesian-weighted score arrays
+    - user_cf: mean-centered user-user neighborhood model
+    - search_index: title search index ranked by match quality and popularity
+    - movie_filters: per-genre bitsets and sorted release years for request filters
+    - trending: per-movie rating counts and sums by time bucket, or None without timestamps
+    - item_index: top-N item-item neighbors per movie
+    - factors: ALS matrix factorization model, or None
+    (user_cf and factors get IVF indexes attached once they reach ANN_MIN_ROWS rows)
+    - precomputed_recs: materialized per-user recommendations, or None
+    """
+    with load_phase('total'):
+        snapshot_dir = config.get('SNAPSHOT_DIR')
+        data = None
+        if snapshot_dir:
+            try:
+                with load_phase('snapshot_load'):
+                    data = load_snapshot(snapshot_dir, config)
+            except Exception as e:
+                logger.warning(f"Snapshot read failed: {e}. Loading from source files.")
+        
+        if data is not None:
+            LOADS.labels('snapshot').inc()
+            logger.info(
+                f"Loaded {len(data['user_ids'])} users, {len(data['movie_ids'])} movies, "
+                f"{data['rating_store'].n_ratings} ratings (memory-mapped from {snapshot_dir})"
+            )
+        else:
+            data = _load_rating_data(config)
+            attach_item_index(data, config)
+            if snapshot_dir:
+                try:
+                    with load_phase('snapshot_save'):
+                        save_snapshot(data, snapshot_dir, config)
+                    logger.info(f"Snapshot saved to {snapshot_dir}")
+                except Exception as e:
+                    logger.warning(f"Could not save snapshot: {e}")
+        
+        with load_phase('factors'):
+            _attach_factors(data, config)
+        with load_phase('ann'):
+            attach_ann_indexes(data, config)
+        with load_phase('precomputed'):
+            _attach_precomputed(data, config)
+    
+    record_bundle(data, bundle_nbytes(data))
+    return data
+
+
+def _load_rating_data(config):
+    """
+    Load data from the Parquet cache if it matches the source CSVs (fast),
+    else from CSV and rebuild the cache.
+    
+    Ratings are streamed in chunks into narrow int32/float32 columns, so peak
+    memory stays close to the size of the finished rating store. The ratings
+    cache is written from the same chunks while the CSV is read, and the
+    manifest records the fingerprints of the CSVs it was built from.
     """
     cache_ratings = config.get('CACHE_RATINGS_PARQUET')
     cache_movies = config.get('CACHE_MOVIES_PARQUET')
     ratings_csv = config.get('RATINGS_CSV')
     movies_csv = config.get('MOVIES_CSV')
+    chunk_size = config.get('CSV_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    bayes_prior_count = config.get('BAYES_PRIOR_COUNT', 25)
+    trending_buckets = config.get('TRENDING_BUCKET_SECONDS', DAY_SECONDS)
     
-    # Prefer Parquet cache if both files exist
-    if cache_ratings and cache_movies and os.path.exists(cache_ratings) and os.path.exists(cache_movies):
-        logger.info("Loading from Parquet cache...")
-        try:
-            combined_df = pd.read_parquet(cache_ratings)
-            movies_df = pd.read_parquet(cache_movies)
-            data = _build_structures_from_dfs(combined_df, movies_df)
-            logger.info(
-                f"Loaded {len(data['user_ids'])} users, {len(data['movie_ids'])} movies, "
-                f"{len(combined_df)} ratings (from cache)"
-            )
-            return data
-        except Exception as e:
-            logger.warning(f"Parquet cache read failed: {e}. Falling back to CSV.")
+    # Prefer the Parquet cache while it is up to date
+    if cache_ratings and cache_movies:
+        with load_phase('cache_check'):
+            fresh, reason = check_cache(config)
+        if fresh:
+            logger.info("Loading from Parquet cache...")
+            try:
+                with load_phase('ratings_read'):
+                    columns = read_ratings_parquet(
+                        cache_ratings, batch_size=chunk_size,
+                        with_timestamps=bool(trending_buckets) and has_timestamps(cache_ratings),
+                    )
+                    movies_df = read_movies(cache_movies)
+                with load_phase('store_build'):
+                    store, movie_metadata = build_store(*columns.arrays(), movies_df)
+                with load_phase('trending'):
+                    trending = build_trending(store, columns, config)
+                del columns
+                data = build_bundle(store, movie_metadata, bayes_prior_count)
+                data['trending'] = trending
+                LOADS.labels('parquet').inc()
+                logger.info(
+                    f"Loaded {len(data['user_ids'])} users, {len(data['movie_ids'])} movies, "
+                    f"{data['rating_store'].n_ratings} ratings (from cache)"
+                )
+                return data
+            except Exception as e:
+                logger.warning(f"Parquet cache read failed: {e}. Falling back to CSV.")
+        elif os.path.exists(cache_ratings):
+            logger.info(f"Rebuilding Parquet cache: {reason}")
+            manifest = read_manifest(config)
+            if manifest and manifest.get('ingested_ratings'):
+                logger.warning(
+                    f"Discarding {manifest['ingested_ratings']} ingested ratings compacted into the "
+                    f"old cache; they are not in {ratings_csv}"
+                )
     
     # Load from CSV
     if not os.path.exists(ratings_csv):
@@ -81,42 +425,69 @@ def load_data(config):
     if not os.path.exists(movies_csv):
         raise FileNotFoundError(f"Movies file not found: {movies_csv}")
     
-    logger.info(f"Loading ratings from {ratings_csv}")
-    ratings_df = pd.read_csv(ratings_csv)
-    logger.info(f"Loading movies from {movies_csv}")
-    movies_df = pd.read_csv(movies_csv)
-    
-    for col in ['userId', 'movieId', 'rating']:
-        if col not in ratings_df.columns:
-            raise ValueError(f"Missing required column '{col}' in ratings.csv")
-    if 'movieId' not in movies_df.columns:
-        raise ValueError("Missing required column 'movieId' in movies.csv")
-    
-    ratings_df = ratings_df.dropna(subset=['userId', 'movieId', 'rating'])
-    ratings_df['movieId'] = pd.to_numeric(ratings_df['movieId'], errors='coerce').astype('Int64')
-    ratings_df['userId'] = pd.to_numeric(ratings_df['userId'], errors='coerce').astype('Int64')
-    movies_df['movieId'] = pd.to_numeric(movies_df['movieId'], errors='coerce').astype('Int64')
+    # Written next to the cache and moved into place only once the load succeeds
+    write_cache = bool(cache_ratings and cache_movies)
+    tmp_ratings = f"{cache_ratings}.tmp-{os.getpid()}" if write_cache else None
+    # Fingerprint the sources before reading them (hashing overlaps with parsing), so a file
+    # that changes during the load no longer matches the manifest
+    hasher = ThreadPoolExecutor(1) if write_cache else None
+    sources = hasher.submit(source_fingerprints, config) if write_cache else None
     
-    ratings_df = ratings_df[ratings_df['movieId'].notna() & ratings_df['userId'].notna()]
-    movies_df = movies_df[movies_df['movieId'].notna()]
+    logger.info(f"Loading movies from {movies_csv}")
+    with load_phase('movies_read'):
+        movies_df = read_movies_csv(movies_csv)
     
-    logger.info("Combining ratings and movies datasets")
-    combined_df = ratings_df.merge(movies_df, on='movieId', how='left')
+    logger.info(f"Loading ratings from {ratings_csv} in chunks of {chunk_size}")
+    with_timestamps = bool(trending_buckets) and has_timestamps(ratings_csv)
+    with load_phase('ratings_read'):
+        try:
+            columns = read_ratings_csv(
+                ratings_csv, chunk_size=chunk_size, parquet_path=tmp_ratings, with_timestamps=with_timestamps,
+            )
+        except OSError as e:
+            if not write_cache:
+                raise
+            logger.warning(f"Could not write Parquet cache: {e}")
+            write_cache, tmp_ratings = False, None
+            columns = read_ratings_csv(ratings_csv, chunk_size=chunk_size, with_timestamps=with_timestamps)
     
-    data = _build_structures_from_dfs(combined_df, movies_df)
+    try:
+        # The raw columns are freed before the derived structures are built
+        with load_phase('store_build'):
+            store, movie_metadata = build_store(*columns.arrays(), movies_df)
+        with load_phase('trending'):
+            trending = build_trending(store, columns, config)
+        del columns
+        data = build_bundle(store, movie_metadata, bayes_prior_count)
+        data['trending'] = trending
+    except BaseException:
+        if tmp_ratings and os.path.exists(tmp_ratings):
+            os.remove(tmp_ratings)
+        raise
+    finally:
+        if hasher:
+            hasher.shutdown(wait=False)
+    LOADS.labels('csv').inc()
     logger.info(
         f"Loaded {len(data['user_ids'])} users, {len(data['movie_ids'])} movies, "
-        f"{len(combined_df)} ratings"
+        f"{data['rating_store'].n_ratings} ratings "
+        f"({data['rating_store'].nbytes / 1e6:.1f} MB rating store)"
     )
     
     # Save Parquet cache for next time
-    if cache_ratings and cache_movies:
+    if write_cache:
         try:
-            combined_df.to_parquet(cache_ratings, index=False)
-            movies_df.to_parquet(cache_movies, index=False)
+            tmp_movies = f"{cache_movies}.tmp-{os.getpid()}"
+            write_movies(movies_df, tmp_movies)
+            os.replace(tmp_movies, cache_movies)
+            os.replace(tmp_ratings, cache_ratings)
+            write_manifest(config, sources.result())
             logger.info("Parquet cache saved for faster startup next time.")
         except Exception as e:
             logger.warning(f"Could not save Parquet cache: {e}")
+            for path in (tmp_ratings, tmp_movies):
+                if os.path.exists(path):
+                    os.remove(path)
     
     return data
 
@@ -0,0 +1,420 @@
+"""
+Offline evaluation of the recommenders on a timestamp split of the ratings.
+
+The ratings are split by time: with split='global' the latest test_fraction
+of all ratings form the test set, and with split='user' the latest
+test_fraction of each user's ratings. A bundle is built from the training
+ratings alone and written as a snapshot; worker processes memory-map it, so
+they share one copy of the rating store through the page cache. Each worker
+scores chunks of test users with every scorer, given only their training
+ratings, and reports:
+
+- precision@k, recall@k and NDCG@k against the user's test ratings of at
+  least relevant_rating (users without such ratings are skipped)
+- RMSE of predicted ratings on all of the user's test ratings, for scorers
+  that can predict a given movie
+- catalog coverage: distinct recommended movies / movies with training ratings
+- scoring latency per user (mean, p50, p95) and the throughput it implies
+  for one core
+"""
+import importlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+
+from app.data_loader import attach_ann_indexes, attach_item_index, build_bundle, build_store, read_movies_csv
+from app.factorization import FactorModel
+from app.parquet_cache import check_cache, read_movies
+from app.rating_reader import DEFAULT_CHUNK_SIZE, read_ratings_csv, read_ratings_parquet
+from app.recommender import (
+    get_item_based_recommendations, get_recommendations, get_recommendations_from_ratings,
+    predict_from_ratings, recommend_for_ratings,
+)
+from app.snapshot import SOURCE_KEYS, load_snapshot, save_snapshot
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCORERS = ('content', 'item', 'custom', 'user_cf', 'popular')
+SPLITS = ('global', 'user')
+
+
+def load_timestamped_ratings(config):
+    """
+    (RatingColumns with timestamps, movies DataFrame) from the Parquet cache
+    while it matches the CSVs, else from the CSVs.
+    """
+    chunk_size = config.get('CSV_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    if config.get('CACHE_RATINGS_PARQUET') and config.get('CACHE_MOVIES_PARQUET') and check_cache(config)[0]:
+        try:
+            columns = read_ratings_parquet(config['CACHE_RATINGS_PARQUET'], chunk_size, with_timestamps=True)
+            return columns, read_movies(config['CACHE_MOVIES_PARQUET'])
+        except ValueError as e:
+            logger.info(f"Reading {config['RATINGS_CSV']} instead of the cache: {e}")
+    columns = read_ratings_csv(config['RATINGS_CSV'], chunk_size, with_timestamps=True)
+    return columns, read_movies_csv(config['MOVIES_CSV'])
+
+
+def temporal_split(users, timestamps, test_fraction=0.2, split='global'):
+    """Boolean mask of the test ratings: the latest test_fraction overall ('global') or per user ('user')."""
+    n = len(timestamps)
+    test = np.zeros(n, dtype=bool)
+    if split == 'global':
+        order = np.argsort(timestamps, kind='stable')
+        test[order[n - int(round(n * test_fraction)):]] = True
+    elif split == 'user':
+        order = np.lexsort((timestamps, users))
+        sorted_users = users[order]
+        starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+        counts = np.diff(np.r_[starts, n])
+        position = np.arange(n) - np.repeat(starts, counts)
+        n_test = np.repeat(np.floor(counts * test_fraction).astype(np.int64), counts)
+        test[order[position >= np.repeat(counts, counts) - n_test]] = True
+    else:
+        raise ValueError(f"Unknown split '{split}' (expected one of {', '.join(SPLITS)})")
+    return test
+
+
+# Scorers: make(config) returns (recommend, predict). recommend(user_id,
+# train_ratings, data_bundle, n) returns recommendation dicts as the API does;
+# predict(user_id, train_ratings, data_bundle, movie_ids) returns predicted
+# ratings, or is None when the scorer cannot rate arbitrary movies.
+
+def _user_mean(ratings):
+    return float(np.mean(list(ratings.values()))) if ratings else 0.0
+
+
+def _fill(movie_ids, ratings, movies, predictions, store):
+    """Predictions for movie_ids from (store movie indices, predictions), the user's mean elsewhere."""
+    result = np.full(len(movie_ids), _user_mean(ratings), dtype=np.float32)
+    by_movie = dict(zip(store.movie_ids[movies].tolist(), np.asarray(predictions, dtype=np.float32).tolist()))
+    for i, movie_id in enumerate(movie_ids.tolist()):
+        if movie_id in by_movie:
+            result[i] = by_movie[movie_id]
+    return result
+
+
+def _content(config):
+    return (
+        lambda user_id, ratings, data, n: get_recommendations_from_ratings(ratings, data, n),
+        lambda user_id, ratings, data, movie_ids: predict_from_ratings(ratings, data, movie_ids),
+    )
+
+
+def _item(config):
+    def predict(user_id, ratings, data, movie_ids):
+        store = data['rating_store']
+        rated = [(store.movie_index(m), r) for m, r in ratings.items() if store.movie_index(m) >= 0]
+        if not rated:
+            return np.full(len(movie_ids), _user_mean(ratings), dtype=np.float32)
+        movies, predictions, _ = data['item_index'].predict([i for i, _ in rated], [r for _, r in rated])
+        return _fill(movie_ids, ratings, movies, predictions, store)
+
+    return lambda user_id, ratings, data, n: get_item_based_recommendations(ratings, data, n), predict
+
+
+def _custom(config):
+    # What /api/custom-recommendations serves for the same ratings
+    return lambda user_id, ratings, data, n: recommend_for_ratings(ratings, data, n, use_cache=False), None
+
+
+def _user_cf(config):
+    k_neighbors, min_overlap = config.get('K_NEIGHBORS', 30), config.get('MIN_OVERLAP', 5)
+
+    def recommend(user_id, ratings, data, n):
+        return get_recommendations(user_id, data, k_neighbors, min_overlap, n, use_cache=False, use_precomputed=False)
+
+    def predict(user_id, ratings, data, movie_ids):
+        store, model = data['rating_store'], data['user_cf']
+        neighbor_idx, similarities = model.neighbors(store.user_index(user_id), k_neighbors, min_overlap, False)
+        if len(neighbor_idx) == 0:
+            return np.full(len(movie_ids), _user_mean(ratings), dtype=np.float32)
+        movies, predictions, _ = model.predict(store.user_index(user_id), neighbor_idx, similarities)
+        return _fill(movie_ids, ratings, movies, predictions, store)
+
+    return recommend, predict
+
+
+def _als(config):
+    k_neighbors, min_overlap = config.get('K_NEIGHBORS', 30), config.get('MIN_OVERLAP', 5)
+
+    def recommend(user_id, ratings, data, n):
+        return get_recommendations(user_id, data, k_neighbors, min_overlap, n, use_cache=False, use_precomputed=False)
+
+    def predict(user_id, ratings, data, movie_ids):
+        factors = data['factors']
+        profile = factors.user_vector(user_id) or factors.fold_in(list(ratings), list(ratings.values()))
+        result = np.full(len(movie_ids), factors.global_mean, dtype=np.float32)
+        if profile is None:
+            return result
+        vector, bias = profile
+        pos, found = factors.movie_positions(movie_ids)
+        result[found] = factors.item_factors[pos] @ vector + factors.item_bias[pos] + factors.global_mean + bias
+        return np.clip(result, 0.5, 5.0)
+
+    return recommend, predict
+
+
+def _popular(config):
+    def recommend(user_id, ratings, data, n):
+        stats, store = data['movie_stats'], data['rating_store']
+        top = stats.top(n + len(ratings), mode='bayesian')
+        movie_ids = [m for m in store.movie_ids[top].tolist() if m not in ratings][:n]
+        return [{'movieId': m} for m in movie_ids]
+
+    def predict(user_id, ratings, data, movie_ids):
+        stats, store = data['movie_stats'], data['rating_store']
+        pos = np.searchsorted(store.movie_ids, movie_ids).clip(0, max(len(store.movie_ids) - 1, 0))
+        return np.where(store.movie_ids[pos] == movie_ids, stats.bayesian[pos], _user_mean(ratings)).astype(np.float32)
+
+    return recommend, predict
+
+
+SCORERS = {
+    'content': _content,
+    'item': _item,
+    'custom': _custom,
+    'user_cf': _user_cf,
+    'als': _als,
+    'popular': _popular,
+}
+
+
+def resolve_scorer(name, config):
+    """
+    (recommend, predict) for a built-in scorer name or a 'module:function'
+    recommend function (with an optional `predict` attribute).
+    """
+    if name in SCORERS:
+        return SCORERS[name](config)
+    module_name, sep, attr = name.partition(':')
+    if not sep:
+        raise ValueError(f"Unknown scorer '{name}' (built in: {', '.join(SCORERS)}; or module:function)")
+    recommend = getattr(importlib.import_module(module_name), attr)
+    return recommend, getattr(recommend, 'predict', None)
+
+
+# Worker state, set once per process by _init_worker
+_worker = None
+
+
+def _init_worker(config, scorer_names):
+    """Map the training snapshot and resolve the scorers (in each worker process)."""
+    global _worker
+    # Users without a neighborhood are logged at INFO, which would be one line per user here
+    logging.getLogger('app.recommender').setLevel(logging.WARNING)
+    data = load_snapshot(config['SNAPSHOT_DIR'], config)
+    if data is None:
+        raise RuntimeError(f"Training snapshot {config['SNAPSHOT_DIR']} could not be opened")
+    data['factors'] = FactorModel.load(config['FACTORS_PATH'])
+    data['precomputed_recs'] = None
+    attach_ann_indexes(data, config)
+    # Only the als scorer sees the factor model; the others must not be routed through it
+    without_factors = dict(data, factors=None)
+    _worker = {
+        name: (data if name == 'als' else without_factors, resolve_scorer(name, config))
+        for name in scorer_names
+    }
+
+
+def _evaluate_chunk(task, k, relevant_rating):
+    user_ids, indptr, test_movies, test_ratings = task
+    results = {}
+    for name, (data, (recommend, predict)) in _worker.items():
+        user_ratings = data['user_ratings']
+        precision, recall, ndcg, latencies, recommended = [], [], [], [], set()
+        squared, n_predictions = 0.0, 0
+        discounts = 1.0 / np.log2(np.arange(k) + 2)
+        for i, user_id in enumerate(user_ids):
+            movies = test_movies[indptr[i]:indptr[i + 1]]
+            ratings = test_ratings[indptr[i]:indptr[i + 1]]
+            train_ratings = user_ratings[user_id]
+
+            start = time.perf_counter()
+            recs = recommend(user_id, train_ratings, data, k)
+            latencies.append(time.perf_counter() - start)
+
+            rec_ids = [r['movieId'] for r in recs[:k]]
+            recommended.update(rec_ids)
+            relevant = set(movies[ratings >= relevant_rating].tolist())
+            if relevant:
+                hits = np.array([m in relevant for m in rec_ids] + [False] * (k - len(rec_ids)))
+                precision.append(hits.sum() / k)
+                recall.append(hits.sum() / len(relevant))
+                ndcg.append(float(discounts[hits].sum() / discounts[:min(len(relevant), k)].sum()))
+            if predict is not None:
+                predicted = np.clip(predict(user_id, train_ratings, data, movies), 0.0, 5.0)
+                squared += float(np.sum((predicted - ratings) ** 2))
+                n_predictions += len(movies)
+        results[name] = {
+            'precision': float(np.sum(precision)),
+            'recall': float(np.sum(recall)),
+            'ndcg': float(np.sum(ndcg)),
+            'ranked_users': len(precision),
+            'squared_error': squared,
+            'predictions': n_predictions,
+            'latencies': latencies,
+            'recommended': recommended,
+        }
+    return results
+
+
+def _test_tasks(test_users, test_movies, test_ratings, chunk_size):
+    """Chunks of (user IDs, indptr, movie IDs, ratings) over test ratings sorted by user."""
+    starts = np.flatnonzero(np.r_[True, test_users[1:] != test_users[:-1]]) if len(test_users) else np.array([], int)
+    bounds = np.r_[starts, len(test_users)]
+    users = test_users[starts]
+    for first in range(0, len(users), chunk_size):
+        last = min(first + chunk_size, len(users))
+        lo, hi = bounds[first], bounds[last]
+        yield (
+            users[first:last].tolist(),
+            bounds[first:last + 1] - lo,
+            test_movies[lo:hi],
+            test_ratings[lo:hi],
+        )
+
+
+def evaluate(config, scorers=DEFAULT_SCORERS, k=10, test_fraction=0.2, split='global', relevant_rating=4.0,
+             min_train_ratings=5, max_users=None, workers=1, chunk_size=100, seed=0):
+    """
+    Evaluate each scorer on a temporal split of the configured ratings.
+
+    Returns a report dict with the split's sizes and, per scorer, quality
+    metrics, coverage and per-user scoring latency. The 'als' scorer trains
+    a factor model on the training ratings first (with the ALS_* settings).
+    """
+    start = time.time()
+    columns, movies_df = load_timestamped_ratings(config)
+    users, movies, ratings = columns.arrays()
+    test = temporal_split(users, columns.timestamp_array(), test_fraction, split)
+    del columns
+
+    store, movie_metadata = build_store(users[~test], movies[~test], ratings[~test], movies_df)
+    train = build_bundle(store, movie_metadata, config.get('BAYES_PRIOR_COUNT', 25))
+    attach_item_index(train, dict(config, ITEM_INDEX_PATH=None))
+
+    # Test users need enough training ratings for the scorers to work with
+    train_counts = store.user_counts()
+    user_idx = np.searchsorted(store.user_ids, users[test]).clip(0, max(store.n_users - 1, 0))
+    known = (store.user_ids[user_idx] == users[test]) & (train_counts[user_idx] >= min_train_ratings)
+    test_users, test_movies, test_ratings = users[test][known], movies[test][known], ratings[test][known]
+    eligible = np.unique(test_users)
+    if max_users is not None and len(eligible) > max_users:
+        eligible = np.sort(np.random.default_rng(seed).choice(eligible, max_users, replace=False))
+    keep = np.isin(test_users, eligible)
+    order = np.argsort(test_users[keep], kind='stable')
+    test_users, test_movies, test_ratings = test_users[keep][order], test_movies[keep][order], test_ratings[keep][order]
+    del users, movies, ratings, test
+
+    report = {
+        'split': {
+            'method': split,
+            'test_fraction': test_fraction,
+            'train_ratings': int(store.n_ratings),
+            'test_ratings': int(len(test_ratings)),
+            'test_users': int(len(eligible)),
+            'catalog_movies': int(np.count_nonzero(store.movie_counts())),
+            'k': k,
+            'relevant_rating': relevant_rating,
+        },
+        'workers': workers,
+        'scorers': {},
+    }
+    logger.info(
+        f"Split ({split}): {store.n_ratings} training ratings, {len(test_ratings)} test ratings "
+        f"from {len(eligible)} users ({time.time() - start:.1f}s)"
+    )
+
+    with tempfile.TemporaryDirectory(prefix='evaluation-') as workdir:
+        # Worker config: the snapshot is self-contained, so it is not tied to any source file
+        worker_config = dict(
+            config,
+            SNAPSHOT_DIR=os.path.join(workdir, 'snapshot'),
+            ANN_INDEX_DIR=os.path.join(workdir, 'ann'),
+            FACTORS_PATH=None,
+            PRECOMPUTED_RECS_PARQUET=None,
+            **{key: None for key in SOURCE_KEYS},
+        )
+        if 'als' in scorers:
+            model_start = time.time()
+            train['factors'] = FactorModel.train(
+                store,
+                rank=config.get('ALS_RANK', 32),
+                regularization=config.get('ALS_REGULARIZATION', 0.1),
+                prior_count=config.get('ALS_PRIOR_COUNT', 20.0),
+                iterations=config.get('ALS_ITERATIONS', 10),
+                threads=config.get('ALS_THREADS'),
+            )
+            train['factors'].metadata['data_version'] = train['version']
+            worker_config['FACTORS_PATH'] = os.path.join(workdir, 'factors.npz')
+            train['factors'].save(worker_config['FACTORS_PATH'])
+            report['als_training_seconds'] = round(time.time() - model_start, 2)
+        save_snapshot(train, worker_config['SNAPSHOT_DIR'], worker_config)
+        # Built once here and loaded by every worker
+        attach_ann_indexes(train, worker_config)
+        del train, store
+
+        tasks = list(_test_tasks(test_users, test_movies, test_ratings, chunk_size))
+        score = partial(_evaluate_chunk, k=k, relevant_rating=relevant_rating)
+        totals = {name: _empty_total() for name in scorers}
+        scoring_start = time.time()
+        if workers > 1:
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            with multiprocessing.get_context(method).Pool(
+                workers, initializer=_init_worker, initargs=(worker_config, list(scorers)),
+            ) as pool:
+                for results in pool.imap_unordered(score, tasks):
+                    _accumulate(totals, results)
+        else:
+            _init_worker(worker_config, list(scorers))
+            for results in map(score, tasks):
+                _accumulate(totals, results)
+        report['scoring_seconds'] = round(time.time() - scoring_start, 2)
+
+    for name, total in totals.items():
+        report['scorers'][name] = _summarize(total, report['split']['catalog_movies'])
+    report['seconds'] = round(time.time() - start, 2)
+    return report
+
+
+def _empty_total():
+    """Zeroed accumulator, so a scorer with no qualifying test users still summarizes."""
+    return {
+        'precision': 0.0, 'recall': 0.0, 'ndcg': 0.0, 'ranked_users': 0,
+        'squared_error': 0.0, 'predictions': 0, 'latencies': [], 'recommended': set(),
+    }
+
+
+def _accumulate(totals, results):
+    for name, result in results.items():
+        total = totals[name]
+        for key in ('precision', 'recall', 'ndcg', 'ranked_users', 'squared_error', 'predictions'):
+            total[key] += result[key]
+        total['latencies'].extend(result['latencies'])
+        total['recommended'] |= result['recommended']
+
+
+def _summarize(total, catalog_movies):
+    ranked = max(total['ranked_users'], 1)
+    latencies = np.array(total['latencies']) * 1000
+    mean_ms = float(latencies.mean()) if len(latencies) else 0.0
+    return {
+        'precision_at_k': round(total['precision'] / ranked, 4),
+        'recall_at_k': round(total['recall'] / ranked, 4),
+        'ndcg_at_k': round(total['ndcg'] / ranked, 4),
+        'rmse': round(float(np.sqrt(total['squared_error'] / total['predictions'])), 4) if total['predictions'] else None,
+        'coverage': round(len(total['recommended']) / catalog_movies, 4) if catalog_movies else None,
+        'users': len(latencies),
+        'ranked_users': total['ranked_users'],
+        'latency_ms': {
+            'mean': round(mean_ms, 3),
+            'p50': round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+            'p95': round(float(np.percentile(latencies, 95)), 3) if len(latencies) else None,
+        },
+        'users_per_second_per_worker': round(1000 / mean_ms, 1) if mean_ms else None,
+    }
@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FACTORS_FORMAT_VERSION = 1
+BLOCKS_PER_THREAD = 8          # Row blocks per solver thread (evens out heavy users)
+RMSE_BLOCK_SIZE = 1_000_000    # Ratings per block when computing the training error
+
+
+class FactorModel:
+    """
+    Biased matrix factorization trained with alternating least squares.
+
+    A rating is predicted as global_mean + user_bias[u] + item_bias[i] +
+    user_factors[u] . item_factors[i]. Rows follow the sorted user_ids and
+    movie_ids the model was trained on; item_counts holds each movie's
+    number of training ratings (movies without any are never recommended).
+    """
+
+    def __init__(self, user_ids, movie_ids, user_factors, user_bias, item_factors, item_bias,
+                 item_counts, global_mean, regularization, prior_count=0.0, metadata=None):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.user_factors = user_factors
+        self.user_bias = user_bias
+        self.item_factors = item_factors
+        self.item_bias = item_bias
+        self.item_counts = item_counts
+        self.global_mean = float(global_mean)
+        self.regularization = float(regularization)
+        self.prior_count = float(prior_count)
+        self.metadata = metadata or {}
+        self.ann = None
+
+    @classmethod
+    def train(cls, store, rank=32, regularization=0.1, prior_count=20.0, iterations=10, threads=None, seed=0):
+        """
+        Fit the model to a RatingStore.
+
+        Each iteration solves every user's factors and bias with the movie side
+        fixed, then every movie's with the user side fixed. The L2 penalty is
+        regularization times the row's rating count plus prior_count (ALS-WR
+        with a prior), so it scales across dataset sizes while users and movies
+        with a handful of ratings stay close to zero. Rows are solved in blocks on a thread pool;
+        the per-row products and batched solves run in BLAS/LAPACK with the GIL
+        released, so training uses every core.
+        """
+        threads = max(1, threads or os.cpu_count() or 1)
+        rng = np.random.default_rng(seed)
+        scale = 0.1 / np.sqrt(rank)
+        user_factors = rng.normal(0.0, scale, size=(store.n_users, rank))
+        item_factors = rng.normal(0.0, scale, size=(store.n_movies, rank))
+        user_bias = np.zeros(store.n_users)
+        item_bias = np.zeros(store.n_movies)
+        global_mean = float(store.user_values.mean(dtype=np.float64)) if store.n_ratings else 0.0
+
+        rmse = None
+        with ThreadPoolExecutor(threads) as pool:
+            for iteration in range(1, iterations + 1):
+                start = time.time()
+                user_factors, user_bias = _solve_rows(
+                    pool, threads, store.user_indptr, store.user_movie_idx, store.user_values,
+                    item_factors, item_bias, global_mean, regularization, prior_count,
+                )
+                item_factors, item_bias = _solve_rows(
+                    pool, threads, store.movie_indptr, store.movie_user_idx, store.movie_values,
+                    user_factors, user_bias, global_mean, regularization, prior_count,
+                )
+                rmse = _training_rmse(store, user_factors, user_bias, item_factors, item_bias, global_mean)
+                logger.info(f"ALS iteration {iteration}/{iterations}: train RMSE {rmse:.4f} ({time.time() - start:.1f}s)")
+
+        metadata = {
+            'rank': rank,
+            'regularization': regularization,
+            'prior_count': prior_count,
+            'iterations': iterations,
+            'train_rmse': rmse,
+            'trained_at': int(time.time()),
+        }
+        return cls(
+            store.user_ids, store.movie_ids,
+            user_factors.astype(np.float32), user_bias.astype(np.float32),
+            item_factors.astype(np.float32), item_bias.astype(np.float32),
+            store.movie_counts().astype(np.int32), global_mean, regularization, prior_count, metadata,
+        )
+
+    def save(self, path):
+        np.savez(
+            path,
+            version=np.int32(FACTORS_FORMAT_VERSION),
+            user_ids=self.user_ids,
+            movie_ids=self.movie_ids,
+            user_factors=self.user_factors,
+            user_bias=self.user_bias,
+            item_factors=self.item_factors,
+            item_bias=self.item_bias,
+            item_counts=self.item_counts,
+            global_mean=np.float64(self.global_mean),
+            regularization=np.float64(self.regularization),
+            prior_count=np.float64(self.prior_count),
+            metadata=np.array(json.dumps(self.metadata)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved model, or return None if it is missing or in an older format."""
+        if not path or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data['version']) != FACTORS_FORMAT_VERSION:
+                return None
+            return cls(
+                data['user_ids'], data['movie_ids'],
+                data['user_factors'], data['user_bias'],
+                data['item_factors'], data['item_bias'],
+                data['item_counts'], float(data['global_mean']),
+                float(data['regularization']), float(data['prior_count']),
+                json.loads(str(data['metadata'])),
+            )
+
+    @property
+    def rank(self):
+        return self.item_factors.shape[1]
+
+    @property
+    def model_id(self):
+        """Identifies this training run (precomputed recommendations are tied to it)."""
+        return f"als-{self.metadata.get('data_version', '')}-{self.metadata.get('trained_at', 0)}"
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (
+            self.user_ids, self.movie_ids, self.user_factors, self.user_bias,
+            self.item_factors, self.item_bias, self.item_counts,
+        ))
+
+    def user_vector(self, user_id):
+        """(factors, bias) learned for a user, or None if the user was not in the training data."""
+        pos = int(np.searchsorted(self.user_ids, user_id))
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return None
+        return self.user_factors[pos], float(self.user_bias[pos])
+
+    def movie_positions(self, movie_ids):
+        """(positions in the model, mask over movie_ids of those found) for raw movie IDs."""
+        wanted = np.asarray(movie_ids, dtype=np.int64)
+        pos = np.searchsorted(self.movie_ids, wanted)
+        found = pos < len(self.movie_ids)
+        found[found] = self.movie_ids[pos[found]] == wanted[found]
+        return pos[found], found
+
+    def fold_in(self, movie_ids, ratings):
+        """
+        Solve (factors, bias) for ratings the model was not trained on.
+
+        This is the same regularized least-squares problem a training
+        iteration solves for a user, with the movie side fixed, so it costs
+        one (rank + 1)-sized solve. Returns None if no rated movie is known.
+        """
+        pos, found = self.movie_positions(movie_ids)
+        ratings = np.asarray(ratings, dtype=np.float64)[found]
+        trained = self.item_counts[pos] > 0
+        pos, ratings = pos[trained], ratings[trained]
+        if len(pos) == 0:
+            return None
+        design = np.hstack([self.item_factors[pos].astype(np.float64), np.ones((len(pos), 1))])
+        targets = ratings - self.global_mean - self.item_bias[pos]
+        gram = design.T @ design
+        gram.flat[::self.rank + 2] += self.regularization * (len(pos) + self.prior_count)
+        solution = np.linalg.solve(gram, design.T @ targets)
+        return solution[:-1].astype(np.float32), float(solution[-1])
+
+    def item_vectors(self):
+        """Movie factors with the movie bias appended: [q, b] . [p, 1] ranks movies for a user."""
+        return np.hstack([self.item_factors, self.item_bias[:, None]])
+
+    def attach_ann(self, index, n_probe, n_candidates):
+        """Score only the candidates an IVFIndex over item_vectors() returns for each user."""
+        self.ann = index
+        self.ann_n_probe = n_probe
+        self.ann_candidates = n_candidates
+
+    def score_candidates(self, vector, bias, n, positions=None):
+        """
+        (movie positions, exact predicted ratings) worth ranking for the top n.
+
+        Every movie without an ANN index; otherwise the best max(n,
+        ann_candidates) movies the index finds, rescored exactly. Given
+        `positions` (e.g. the movies passing a filter), exactly those movies.
+        """
+        if positions is None and self.ann is None:
+            return np.arange(len(self.movie_ids)), self.scores(vector, bias)
+        if positions is None:
+            positions, _ = self.ann.search(
+                np.append(vector, np.float32(1.0)), max(n, self.ann_candidates), self.ann_n_probe
+            )
+        positions = np.sort(positions)
+        scores = self.item_factors[positions] @ vector
+        scores += self.item_bias[positions] + np.float32(self.global_mean + bias)
+        scores[self.item_counts[positions] == 0] = -np.inf
+        return positions, scores
+
+    def scores(self, vector, bias):
+        """Predicted ratings of every model movie for one user; movies never rated score -inf."""
+        scores = self.item_factors @ vector
+        scores += self.item_bias + np.float32(self.global_mean + bias)
+        scores[self.item_counts == 0] = -np.inf
+        return scores
+
+    def scores_batch(self, vectors, biases):
+        """scores() for many users: a (movies x users) matrix from one matrix-matrix product."""
+        scores = self.item_factors @ np.asarray(vectors, dtype=np.float32).T
+        scores += self.item_bias[:, None]
+        scores += (self.global_mean + np.asarray(biases, dtype=np.float32))[None, :]
+        scores[self.item_counts == 0] = -np.inf
+        return scores
+
+
+def _row_blocks(indptr, n_blocks):
+    """Split rows into contiguous blocks with about the same number of ratings each."""
+    bounds = np.searchsorted(indptr, np.linspace(0, indptr[-1], n_blocks + 1)[1:-1])
+    bounds = np.unique(np.concatenate(([0], bounds, [len(indptr) - 1])))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _solve_rows(pool, threads, indptr, indices, values, fixed, fixed_bias, global_mean, regularization, prior_count):
+    """
+    One ALS half-step: the least-squares factors and bias of every row given the other side.
+
+    Row r solves (X'X + reg * (n_r + prior_count) * I) w = X'y, where X holds the fixed
+    factors of its rated columns plus a column of ones (for the bias) and y
+    its ratings minus the global mean and the fixed side's biases.
+    """
+    n_rows, rank = len(indptr) - 1, fixed.shape[1]
+    design = np.hstack([fixed, np.ones((len(fixed), 1))])
+    offsets = global_mean + fixed_bias
+    solutions = np.zeros((n_rows, rank + 1))
+
+    def solve_block(bounds):
+        first, last = bounds
+        grams = np.empty((last - first, rank + 1, rank + 1))
+        rhs = np.zeros((last - first, rank + 1))
+        for row in range(first, last):
+            start, end = indptr[row], indptr[row + 1]
+            gram = grams[row - first]
+            if start == end:
+                gram[:] = np.eye(rank + 1)
+                continue
+            cols = indices[start:end]
+            x = design[cols]
+            np.dot(x.T, x, out=gram)
+            gram.flat[::rank + 2] += regularization * (end - start + prior_count)
+            np.dot(x.T, values[start:end] - offsets[cols], out=rhs[row - first])
+        solutions[first:last] = np.linalg.solve(grams, rhs[:, :, None])[:, :, 0]
+
+    list(pool.map(solve_block, _row_blocks(indptr, threads * BLOCKS_PER_THREAD)))
+    return solutions[:, :rank], solutions[:, rank]
+
+
+def _training_rmse(store, user_factors, user_bias, item_factors, item_bias, global_mean):
+    users = np.repeat(np.arange(store.n_users), store.user_counts())
+    squared = 0.0
+    for start in range(0, store.n_ratings, RMSE_BLOCK_SIZE):
+        u = users[start:start + RMSE_BLOCK_SIZE]
+        i = store.user_movie_idx[start:start + RMSE_BLOCK_SIZE]
+        predicted = global_mean + user_bias[u] + item_bias[i] + np.einsum('ij,ij->i', user_factors[u], item_factors[i])
+        squared += float(np.sum((store.user_values[start:start + RMSE_BLOCK_SIZE] - predicted) ** 2))
+    return float(np.sqrt(squared / max(store.n_ratings, 1)))
@@ -0,0 +1,134 @@
+"""
+Catalog filters (genre, release year, popularity) applied before scoring.
+
+The filter index is built once per bundle from the catalog: a packed bitset
+of movies per genre, and each movie's release year (parsed from the title)
+with the positions sorted by year. A request's filters become one boolean
+mask over RatingStore.movie_ids: genre bitsets are ANDed, a year range is
+two binary searches into the sorted years, and the minimum rating count is
+read from the live movie_stats. Scorers drop masked-out movies before they
+rank candidates, so a filtered page is as full as an unfiltered one.
+"""
+import re
+from collections import namedtuple
+
+import numpy as np
+
+# A release year, or a range of years for series, at the end of a MovieLens title
+TITLE_YEAR = re.compile(r'\((\d{4})(?:\s*[-–]\s*\d{4})?\)\s*$')
+
+
+class MovieFilter(namedtuple('MovieFilter', 'genres year_min year_max min_count')):
+    """
+    Filters of a recommendation request: movies must have every genre in
+    `genres`, a release year in [year_min, year_max] and at least min_count
+    ratings. None (or an empty tuple) disables a filter. Hashable, so it can
+    be part of a cache key.
+    """
+
+
+class MovieFilterIndex:
+    """Per-genre bitsets and sorted release years, aligned with RatingStore.movie_ids."""
+
+    def __init__(self, genres, genre_bits, years, year_order, n_movies):
+        self.genres = list(genres)
+        self.genre_bits = genre_bits    # (genres, ceil(movies / 8)) uint8, np.packbits rows
+        self.years = years              # int16 release year per movie, 0 when unknown
+        self.year_order = year_order    # Movie positions sorted by release year
+        self.sorted_years = years[year_order]
+        self.n_movies = int(n_movies)
+        self._by_name = {genre.lower(): col for col, genre in enumerate(self.genres)}
+
+    @classmethod
+    def from_catalog(cls, movie_ids, movie_metadata, genre_index):
+        """Build from the store's sorted movie IDs, the catalog titles and the bundle's genre index."""
+        movie_ids = np.asarray(movie_ids)
+        pos = np.searchsorted(genre_index['movie_ids'], movie_ids).clip(0, max(len(genre_index['movie_ids']) - 1, 0))
+        found = np.zeros(len(movie_ids), dtype=bool)
+        if len(genre_index['movie_ids']):
+            found = genre_index['movie_ids'][pos] == movie_ids
+        members = np.zeros((len(genre_index['genres']), len(movie_ids)), dtype=bool)
+        members[:, found] = genre_index['matrix'][pos[found]].T > 0
+
+        years = np.zeros(len(movie_ids), dtype=np.int16)
+        for i, movie_id in enumerate(movie_ids.tolist()):
+            match = TITLE_YEAR.search(str((movie_metadata.get(movie_id) or {}).get('title', '')))
+            if match:
+                years[i] = int(match.group(1))
+        year_order = np.argsort(years, kind='stable').astype(np.int32)
+        return cls(genre_index['genres'], np.packbits(members, axis=1), years, year_order, len(movie_ids))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['genres'], arrays['genre_bits'], arrays['years'], arrays['year_order'], len(arrays['years']))
+
+    def to_arrays(self):
+        return {
+            'genres': self.genres,
+            'genre_bits': self.genre_bits,
+            'years': self.years,
+            'year_order': self.year_order,
+        }
+
+    @property
+    def nbytes(self):
+        return self.genre_bits.nbytes + self.years.nbytes + self.year_order.nbytes + self.sorted_years.nbytes
+
+    def genre_name(self, genre):
+        """The catalog's spelling of a genre (case-insensitive), or raise ValueError."""
+        col = self._by_name.get(genre.strip().lower())
+        if col is None:
+            raise ValueError(f"Unknown genre '{genre.strip()}'")
+        return self.genres[col]
+
+    def genre_mask(self, genres):
+        """Movies having every genre, from the ANDed bitsets."""
+        bits = np.full(self.genre_bits.shape[1], 0xFF, dtype=np.uint8)
+        for genre in genres:
+            bits &= self.genre_bits[self._by_name[genre.lower()]]
+        return np.unpackbits(bits, count=self.n_movies).astype(bool)
+
+    def year_mask(self, year_min=None, year_max=None):
+        """Movies released in [year_min, year_max]; movies without a known year never match."""
+        lo = np.searchsorted(self.sorted_years, max(year_min or 1, 1), side='left')
+        hi = np.searchsorted(self.sorted_years, year_max, side='right') if year_max is not None else self.n_movies
+        mask = np.zeros(self.n_movies, dtype=bool)
+        mask[self.year_order[lo:hi]] = True
+        return mask
+
+
+def parse_filter(filter_index, genre=None, year_min=None, year_max=None, min_count=None):
+    """
+    A MovieFilter from request values (genre as a comma-separated string or a
+    list), or None when no filter is set. Raises ValueError for unknown genres
+    and non-integer years or counts.
+    """
+    if isinstance(genre, str):
+        genre = genre.split(',')
+    genres = tuple(sorted({filter_index.genre_name(str(g)) for g in genre or () if str(g).strip()}))
+    try:
+        year_min = int(year_min) if year_min not in (None, '') else None
+        year_max = int(year_max) if year_max not in (None, '') else None
+        min_count = int(min_count) if min_count not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError('year_min, year_max and min_count must be integers') from None
+    if not min_count or min_count < 1:
+        min_count = None
+    if not genres and year_min is None and year_max is None and min_count is None:
+        return None
+    return MovieFilter(genres, year_min, year_max, min_count)
+
+
+def filter_mask(data_bundle, movie_filter):
+    """Boolean mask over RatingStore.movie_ids of the movies passing movie_filter (None for no filter)."""
+    if movie_filter is None:
+        return None
+    index = data_bundle['movie_filters']
+    mask = np.ones(index.n_movies, dtype=bool)
+    if movie_filter.genres:
+        mask &= index.genre_mask(movie_filter.genres)
+    if movie_filter.year_min is not None or movie_filter.year_max is not None:
+        mask &= index.year_mask(movie_filter.year_min, movie_filter.year_max)
+    if movie_filter.min_count:
+        mask &= data_bundle['movie_stats'].counts >= movie_filter.min_count
+    return mask
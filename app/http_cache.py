@@ -0,0 +1,165 @@
+"""
+HTTP caching for read-mostly endpoints (movie details, search, top movies).
+
+Their responses depend only on the request URL and the loaded data, so each
+gets an ETag derived from the data version (plus the number of ingested
+ratings for endpoints reading the live movie aggregates) and a Cache-Control
+max-age. A request whose If-None-Match still matches gets an empty 304
+without touching the data. Otherwise the body is served from an LRU of
+pre-rendered bytes, each stored with its gzip (and, with the brotli package
+installed, brotli) encoding, so a hot key is serialized and compressed once
+per data version. Bodies are encoded with orjson when it is installed.
+"""
+import gzip
+import json
+
+from flask import Response, request
+
+from app.metrics import HTTP_CACHE_RESPONSES
+from app.result_cache import ResultCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Brotli's fast levels compress JSON better than gzip -6 at similar cost
+ENCODINGS = ('identity', 'gzip', 'br')
+
+
+def dumps(value):
+    """UTF-8 JSON bytes with sorted keys, like Flask's jsonify."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def data_token(data_bundle, movie_stats=None):
+    """
+    Validator for responses computed from data_bundle. Pass the movie_stats
+    a response reads: they are replaced as ratings are ingested.
+    """
+    token = str(data_bundle.get('version'))
+    if movie_stats is not None:
+        token += f'.{movie_stats.updates}'
+    return token
+
+
+def _etag(token, encoding):
+    """Each encoding of a body is a different representation, so it gets its own entity tag."""
+    return token if encoding == 'identity' else f'{token}-{encoding}'
+
+
+class Rendered:
+    """A serialized response body with its compressed encodings."""
+
+    __slots__ = ('bodies', 'nbytes')
+
+    def __init__(self, body, compress_min_bytes):
+        self.bodies = {'identity': body}
+        if len(body) >= compress_min_bytes:
+            self.bodies['gzip'] = gzip.compress(body, GZIP_LEVEL)
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+        self.nbytes = sum(len(b) for b in self.bodies.values())
+
+
+class HttpCache:
+    """ETag/304 handling and a bounded store of rendered responses, bound to the data version."""
+
+    def __init__(self, max_entries=2048, max_bytes=16 * 2**20, max_age=60, compress_min_bytes=1024):
+        self.max_age = max_age
+        self.compress_min_bytes = compress_min_bytes
+        self.rendered = ResultCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.not_modified = 0
+
+    def cache_control(self):
+        return f'public, max-age={self.max_age}' if self.max_age > 0 else 'no-cache'
+
+    def _encoding(self, rendered):
+        """The best encoding of the rendered body that the client accepts."""
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in rendered.bodies and accepted.quality(encoding) > 0:
+                return encoding
+        return 'identity'
+
+    def _matching_encoding(self, token):
+        """The encoding of the If-None-Match entity tag naming this token (weak tags included), or None."""
+        tags = request.if_none_match
+        if tags.star_tag:
+            return 'identity'
+        named = tags.as_set(include_weak=True)
+        for encoding in ENCODINGS:
+            if _etag(token, encoding) in named:
+                return encoding
+        return None
+
+    def _headers(self, token, encoding):
+        return {
+            'ETag': f'"{_etag(token, encoding)}"',
+            'Cache-Control': self.cache_control(),
+            'Vary': 'Accept-Encoding',
+        }
+
+    def respond(self, data_bundle, key, render, movie_stats=None):
+        """
+        Response for a cacheable request identified by `key`: a 304 if the
+        client's copy is current, else the rendered JSON. `render()` returns
+        the payload, or a Flask response (e.g. an error) that is passed
+        through uncached. Pass the movie_stats that render() reads, if any.
+        A 304 skips render(), so validate request parameters before calling.
+        """
+        token = data_token(data_bundle, movie_stats)
+        encoding = self._matching_encoding(token)
+        if encoding is not None:
+            self.not_modified += 1
+            HTTP_CACHE_RESPONSES.labels('not_modified', encoding).inc()
+            return Response(status=304, headers=self._headers(token, encoding))
+
+        version = data_bundle.get('version')
+        self.rendered.bind(version)
+        rendered = self.rendered.get((key, token), version)
+        outcome = 'hit'
+        if rendered is None:
+            payload = render()
+            if not isinstance(payload, (dict, list)):
+                return payload
+            rendered = Rendered(dumps(payload), self.compress_min_bytes)
+            self.rendered.put((key, token), rendered, version, size=rendered.nbytes)
+            outcome = 'rendered'
+
+        encoding = self._encoding(rendered)
+        HTTP_CACHE_RESPONSES.labels(outcome, encoding).inc()
+        response = Response(
+            rendered.bodies[encoding], mimetype='application/json', headers=self._headers(token, encoding),
+        )
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def stats(self):
+        stats = self.rendered.stats()
+        stats['notModified'] = self.not_modified
+        stats['maxAge'] = self.max_age
+        stats['encoder'] = 'orjson' if orjson is not None else 'json'
+        stats['encodings'] = ['br', 'gzip'] if brotli is not None else ['gzip']
+        return stats
+
+
+def init_app(app):
+    """Create the app's HTTP cache (HTTP_CACHE_SIZE = 0 still sends ETags but keeps no bodies)."""
+    cache = HttpCache(
+        max_entries=app.config.get('HTTP_CACHE_SIZE', 2048),
+        max_bytes=app.config.get('HTTP_CACHE_MAX_BYTES', 16 * 2**20),
+        max_age=app.config.get('HTTP_CACHE_MAX_AGE', 60),
+        compress_min_bytes=app.config.get('HTTP_COMPRESS_MIN_BYTES', 1024),
+    )
+    app.config['http_cache'] = cache
+    return cache
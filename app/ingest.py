@@ -0,0 +1,587 @@
+import numpy as np
+import pandas as pd
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Mapping, Set
+
+from app.data_loader import attach_ann_indexes, build_bundle, bundle_nbytes
+from app.metrics import LOAD_PHASE_SECONDS, record_bundle
+from app.parquet_cache import read_manifest, write_manifest
+from app.rating_store import RatingStore
+from app.snapshot import save_snapshot
+from app.trending import DAY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+WAL_HEADER = 'userId,movieId,rating,timestamp\n'
+TAIL_POLL_SECONDS = 1.0
+MIN_RATING, MAX_RATING = 0.5, 5.0
+
+
+class _Layer:
+    """One generation of pending ratings."""
+
+    __slots__ = ('by_user', 'by_movie', 'log', 'bucket_seconds', 'buckets', 'newest', '_bucket_arrays')
+
+    def __init__(self, bucket_seconds):
+        self.by_user = {}
+        self.by_movie = {}
+        self.log = []  # (userId, movieId, rating, timestamp) in arrival order
+        self.bucket_seconds = bucket_seconds
+        self.buckets = {}  # (time bucket, movieId) -> [ratings, rating sum], for trending
+        self.newest = None
+        self._bucket_arrays = None
+
+    def add(self, user_id, movie_id, rating, timestamp):
+        self.by_user.setdefault(user_id, {})[movie_id] = rating
+        self.by_movie.setdefault(movie_id, {})[user_id] = rating
+        self.log.append((user_id, movie_id, rating, timestamp))
+        # Every accepted rating is an event in its bucket, as in TrendingIndex.merged
+        total = self.buckets.setdefault((timestamp // self.bucket_seconds, movie_id), [0, 0.0])
+        total[0] += 1
+        total[1] += rating
+        self.newest = timestamp if self.newest is None else max(self.newest, timestamp)
+        self._bucket_arrays = None
+
+    def bucket_arrays(self):
+        """The bucket aggregates as (buckets, movieIds, counts, sums) arrays, rebuilt after a change."""
+        if self._bucket_arrays is None:
+            n = len(self.buckets)
+            self._bucket_arrays = (
+                np.fromiter((bucket for bucket, _ in self.buckets), dtype=np.int64, count=n),
+                np.fromiter((movie_id for _, movie_id in self.buckets), dtype=np.int64, count=n),
+                np.fromiter((count for count, _ in self.buckets.values()), dtype=np.int64, count=n),
+                np.fromiter((total for _, total in self.buckets.values()), dtype=np.float64, count=n),
+            )
+        return self._bucket_arrays
+
+
+class RatingDelta:
+    """
+    Ratings accepted since the last compaction, newest value per (user, movie).
+
+    A compaction freezes the current layer and merges it into a new store
+    while new ratings go to a fresh layer; lookups see both until the new
+    bundle is swapped in. Rating counts and sums per (time bucket of
+    bucket_seconds, movie) are kept as ratings arrive, for trending queries.
+    """
+
+    def __init__(self, bucket_seconds=DAY_SECONDS):
+        self.bucket_seconds = int(bucket_seconds)
+        self._frozen = None
+        self._active = _Layer(self.bucket_seconds)
+        self._lock = threading.RLock()  # Request threads read while ingestion writes
+
+    def _layers(self):
+        return [layer for layer in (self._frozen, self._active) if layer is not None]
+
+    def get(self, user_id, movie_id):
+        with self._lock:
+            for layer in reversed(self._layers()):
+                rating = layer.by_user.get(user_id, {}).get(movie_id)
+                if rating is not None:
+                    return rating
+        return None
+
+    def user_row(self, user_id):
+        row = {}
+        with self._lock:
+            for layer in self._layers():
+                row.update(layer.by_user.get(user_id, ()))
+        return row
+
+    def movie_row(self, movie_id):
+        row = {}
+        with self._lock:
+            for layer in self._layers():
+                row.update(layer.by_movie.get(movie_id, ()))
+        return row
+
+    def users(self):
+        with self._lock:
+            return set().union(*(layer.by_user for layer in self._layers()))
+
+    def movies(self):
+        with self._lock:
+            return set().union(*(layer.by_movie for layer in self._layers()))
+
+    def add(self, user_id, movie_id, rating, timestamp):
+        with self._lock:
+            self._active.add(user_id, movie_id, rating, timestamp)
+
+    def freeze(self):
+        """Start a new layer and return the log of everything before it."""
+        with self._lock:
+            if self._frozen is not None:
+                raise RuntimeError('Delta is already frozen')
+            self._frozen, self._active = self._active, _Layer(self.bucket_seconds)
+            return list(self._frozen.log)
+
+    def thaw(self):
+        """Undo freeze() after a failed compaction."""
+        with self._lock:
+            layer = self._frozen
+            for entry in self._active.log:
+                layer.add(*entry)
+            self._frozen, self._active = None, layer
+
+    def entries(self):
+        """All pending (userId, movieId, rating, timestamp) entries in arrival order."""
+        with self._lock:
+            return [entry for layer in self._layers() for entry in layer.log]
+
+    def bucket_totals(self):
+        """
+        Pending (buckets, movieIds, rating counts, rating sums) arrays per time
+        bucket and movie. A pair can appear once per layer; sum them.
+        """
+        with self._lock:
+            parts = [layer.bucket_arrays() for layer in self._layers()]
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def newest_timestamp(self):
+        """Timestamp of the newest pending rating, or None."""
+        with self._lock:
+            newest = [layer.newest for layer in self._layers() if layer.newest is not None]
+        return max(newest) if newest else None
+
+    def since_freeze(self):
+        with self._lock:
+            return list(self._active.log)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(layer.log) for layer in self._layers())
+
+
+class OverlayRatingsView(Mapping):
+    """Read-only ratings view with pending delta ratings merged over a base view."""
+
+    def __init__(self, base, delta, by_user=True):
+        self._base = base
+        self._delta = delta
+        self._by_user = by_user
+
+    def _delta_row(self, key):
+        return self._delta.user_row(key) if self._by_user else self._delta.movie_row(key)
+
+    def _delta_keys(self):
+        return self._delta.users() if self._by_user else self._delta.movies()
+
+    def __getitem__(self, key):
+        row = self._base.get(key) or {}
+        row.update(self._delta_row(key))
+        if not row:
+            raise KeyError(key)
+        return row
+
+    def __contains__(self, key):
+        return key in self._base or bool(self._delta_row(key))
+
+    def __iter__(self):
+        yield from self._base
+        yield from sorted(k for k in self._delta_keys() if k not in self._base)
+
+    def __len__(self):
+        return len(self._base) + sum(1 for k in self._delta_keys() if k not in self._base)
+
+
+class OverlayIdSet(Set):
+    """Read-only ID set: the base IDs plus users that only have pending ratings."""
+
+    def __init__(self, base, delta):
+        self._base = base
+        self._delta = delta
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return set(iterable)
+
+    def __contains__(self, value):
+        return value in self._base or bool(self._delta.user_row(value))
+
+    def __iter__(self):
+        yield from self._base
+        yield from sorted(u for u in self._delta.users() if u not in self._base)
+
+    def __len__(self):
+        return len(self._base) + sum(1 for u in self._delta.users() if u not in self._base)
+
+
+def attach_delta(data, delta=None):
+    """Give a bundle a pending-ratings delta and views that include it."""
+    if delta is None:
+        trending = data.get('trending')
+        delta = RatingDelta(trending.bucket_seconds) if trending is not None else RatingDelta()
+    data['delta'] = delta
+    data['user_ratings'] = OverlayRatingsView(data['user_ratings'], delta, by_user=True)
+    data['movie_ratings'] = OverlayRatingsView(data['movie_ratings'], delta, by_user=False)
+    data['user_ids'] = OverlayIdSet(data['user_ids'], delta)
+    return delta
+
+
+def apply_ratings(data, ratings):
+    """
+    Add ratings to the bundle's delta and return movie_stats updated for them.
+
+    A rating for a pair that already has one (stored or pending) replaces it:
+    the movie's count is unchanged and its sum moves by the difference.
+    """
+    store = data['rating_store']
+    delta = data['delta']
+    movie_idx, count_deltas, sum_deltas = [], [], []
+    for user_id, movie_id, rating, timestamp in ratings:
+        previous = delta.get(user_id, movie_id)
+        if previous is None:
+            previous = store.rating(user_id, movie_id)
+        delta.add(user_id, movie_id, rating, timestamp)
+        movie_idx.append(store.movie_index(movie_id))
+        count_deltas.append(0 if previous is not None else 1)
+        sum_deltas.append(rating - (previous if previous is not None else 0.0))
+    return data['movie_stats'].updated(movie_idx, count_deltas, sum_deltas)
+
+
+def parse_rating(user_id, movie_id, rating, timestamp, movie_ids):
+    """
+    Validate one rating and return it as a (userId, movieId, rating, timestamp) tuple.
+
+    Raises ValueError for malformed values and KeyError for unknown movies.
+    """
+    try:
+        user_id, movie_id, rating = int(user_id), int(movie_id), float(rating)
+        timestamp = int(timestamp) if timestamp not in (None, '') else int(time.time())
+    except (TypeError, ValueError):
+        raise ValueError('userId, movieId, rating and timestamp must be numbers')
+    if not 0 <= user_id < 2**31:
+        raise ValueError('userId must be a non-negative 32-bit integer')
+    if not MIN_RATING <= rating <= MAX_RATING:
+        raise ValueError(f'Rating must be between {MIN_RATING} and {MAX_RATING}')
+    if movie_id not in movie_ids:
+        raise KeyError(f'Movie {movie_id} not found')
+    return user_id, movie_id, rating, timestamp
+
+
+class RatingIngestor:
+    """
+    Accepts new ratings without reloading the data.
+
+    Ratings are appended to a write-ahead log (replayed on startup) and to an
+    in-memory delta that movie aggregates, user histories and recommendations
+    see immediately. A background thread compacts the delta into a new rating
+    store and swaps in a rebuilt bundle once INGEST_COMPACT_THRESHOLD ratings
+    are pending or INGEST_COMPACT_INTERVAL seconds pass. With
+    INGEST_PERSIST_ON_COMPACT the merged ratings are written to the Parquet
+    cache and snapshot and the log is trimmed. An optional thread tails
+    INGEST_TAIL_PATH for CSV lines of userId,movieId,rating[,timestamp].
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.wal_path = config.get('RATINGS_WAL_PATH')
+        self.tail_path = config.get('INGEST_TAIL_PATH')
+        self.compact_threshold = config.get('INGEST_COMPACT_THRESHOLD', 10000)
+        self.compact_interval = config.get('INGEST_COMPACT_INTERVAL', 60)
+        self.persist = config.get('INGEST_PERSIST_ON_COMPACT', True)
+        self.accepted = 0
+        self.compactions = 0
+        self.last_compaction = None
+        self._lock = threading.Lock()          # Delta, bundle swaps and the log file
+        self._compact_lock = threading.Lock()  # One compaction at a time
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._wal = None
+        self._threads = []
+
+    def start(self):
+        """Replay the log into the loaded bundle and start the background threads."""
+        data = self.config['data_bundle']
+        attach_delta(data)
+        replayed = self._replay_wal(data)
+        logger.info(f"Rating ingestion enabled ({replayed} ratings replayed from {self.wal_path})")
+        self._open_wal()
+
+        self._threads.append(threading.Thread(target=self._compaction_loop, name='rating-compaction', daemon=True))
+        if self.tail_path:
+            self._threads.append(threading.Thread(target=self._tail_loop, name='rating-tail', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        if len(data['delta']) >= self.compact_threshold:
+            self._wake.set()
+
+    def reload(self, load):
+        """
+        Make load()'s bundle current, with the log replayed into it.
+        
+        Compaction waits while the new bundle loads, so the cache it reads and
+        the log replayed over it stay consistent; ratings are still accepted
+        into the current bundle until the swap.
+        """
+        with self._compact_lock:
+            data = load()
+            with self._lock:
+                attach_delta(data)
+                replayed = self._replay_wal(data)
+                self.config['data_bundle'] = data
+        logger.info(f"Replayed {replayed} logged ratings into the reloaded data")
+        if len(data['delta']) >= self.compact_threshold:
+            self._wake.set()
+        return data
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        if self._wal:
+            self._wal.close()
+
+    def ingest(self, ratings):
+        """Log and apply validated rating tuples. Returns the number of pending ratings."""
+        with self._lock:
+            data = self.config['data_bundle']
+            self._append_wal(ratings)
+            data['movie_stats'] = apply_ratings(data, ratings)
+            pending = len(data['delta'])
+            self.accepted += len(ratings)
+        if pending >= self.compact_threshold:
+            self._wake.set()
+        return pending
+
+    def stats(self):
+        data = self.config.get('data_bundle') or {}
+        delta = data.get('delta')
+        return {
+            'accepted': self.accepted,
+            'pending': len(delta) if delta is not None else 0,
+            'compactions': self.compactions,
+            'lastCompaction': self.last_compaction,
+        }
+
+    def compact(self):
+        """Merge pending ratings into a new store and swap in a rebuilt bundle."""
+        with self._compact_lock:
+            with self._lock:
+                data = self.config['data_bundle']
+                if len(data['delta']) == 0:
+                    return False
+                entries = data['delta'].freeze()
+
+            start = time.time()
+            try:
+                compacted = self._build_compacted(data, entries)
+                persisted = self._persist(compacted, len(entries)) if self.persist else False
+            except Exception:
+                with self._lock:
+                    data['delta'].thaw()
+                raise
+
+            with self._lock:
+                leftover = data['delta'].since_freeze()
+                attach_delta(compacted)
+                compacted['movie_stats'] = apply_ratings(compacted, leftover)
+                self.config['data_bundle'] = compacted
+                if persisted:
+                    self._rewrite_wal(leftover)
+
+            self.compactions += 1
+            self.last_compaction = time.time()
+            LOAD_PHASE_SECONDS.labels('compaction').set(self.last_compaction - start)
+            record_bundle(compacted, bundle_nbytes(compacted))
+            logger.info(
+                f"Compacted {len(entries)} ratings into {compacted['rating_store'].n_ratings} "
+                f"in {time.time() - start:.2f}s ({len(leftover)} still pending)"
+            )
+            return True
+
+    def _build_compacted(self, data, entries):
+        store = data['rating_store']
+        users, movies, values = store.to_arrays()
+        new_users, new_movies, new_values, new_timestamps = (np.array(column) for column in zip(*entries))
+        merged = RatingStore.from_arrays(
+            np.concatenate([users, new_users.astype(np.int32)]),
+            np.concatenate([movies, new_movies.astype(np.int32)]),
+            np.concatenate([values, new_values.astype(np.float32)]),
+            catalog_movie_ids=store.movie_ids,
+        )
+        compacted = build_bundle(
+            merged, data['movie_metadata'], self.config.get('BAYES_PRIOR_COUNT', 25),
+            genre_index=data['genre_index'],
+        )
+        # The catalog is unchanged (unknown movies are rejected), so the item index still applies
+        compacted['item_index'] = data['item_index']
+        # Users first seen in the new ratings are folded into the factor model at request time
+        compacted['factors'] = data.get('factors')
+        # Users were renumbered, so the user index is rebuilt; the factor model keeps its own
+        attach_ann_indexes(compacted, self.config)
+        compacted['precomputed_recs'] = None
+        # Every accepted rating is an event in its bucket, including ones that replace an earlier rating
+        trending = data.get('trending')
+        compacted['trending'] = trending.merged(
+            np.searchsorted(store.movie_ids, new_movies), new_timestamps, new_values,
+        ) if trending is not None else None
+        return compacted
+
+    def _persist(self, data, n_ingested):
+        """
+        Write the merged ratings to the Parquet cache and snapshot. Returns True on success.
+        
+        The cache manifest keeps the fingerprints of the CSVs the cache was
+        first built from, so the rewritten cache stays valid until they change.
+        """
+        cache_ratings = self.config.get('CACHE_RATINGS_PARQUET')
+        if not cache_ratings or not self.config.get('CACHE_MOVIES_PARQUET'):
+            return False
+        try:
+            users, movies, values = data['rating_store'].to_arrays()
+            tmp_path = f"{cache_ratings}.tmp"
+            pd.DataFrame({'userId': users, 'movieId': movies, 'rating': values}).to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, cache_ratings)
+            manifest = read_manifest(self.config) or {}
+            write_manifest(
+                self.config, manifest.get('sources'), manifest.get('ingested_ratings', 0) + n_ingested,
+            )
+            if self.config.get('SNAPSHOT_DIR'):
+                save_snapshot(data, self.config['SNAPSHOT_DIR'], self.config)
+            return True
+        except Exception as e:
+            logger.warning(f"Could not persist compacted ratings: {e}. Keeping the rating log.")
+            return False
+
+    def _compaction_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.compact_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Rating compaction failed: {e}")
+
+    # Write-ahead log
+
+    def _open_wal(self):
+        if not self.wal_path:
+            return
+        new_file = not os.path.exists(self.wal_path) or os.path.getsize(self.wal_path) == 0
+        self._wal = open(self.wal_path, 'a')
+        if new_file:
+            self._wal.write(WAL_HEADER)
+            self._wal.flush()
+
+    def _append_wal(self, ratings):
+        if not self._wal:
+            return
+        self._wal.write(''.join(f"{u},{m},{r},{t}\n" for u, m, r, t in ratings))
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+
+    def _rewrite_wal(self, ratings):
+        """Replace the log with just the ratings not yet persisted."""
+        if not self._wal:
+            return
+        self._wal.close()
+        tmp_path = f"{self.wal_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(WAL_HEADER)
+            f.write(''.join(f"{u},{m},{r},{t}\n" for u, m, r, t in ratings))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.wal_path)
+        self._wal = open(self.wal_path, 'a')
+
+    def _replay_wal(self, data):
+        if not self.wal_path or not os.path.exists(self.wal_path) or os.path.getsize(self.wal_path) == 0:
+            return 0
+        with open(self.wal_path) as f:
+            ratings, skipped = parse_rating_lines(f.read().splitlines(), data['movie_ids'])
+        if skipped:
+            logger.warning(f"Skipped {skipped} invalid lines in {self.wal_path}")
+        if ratings:
+            data['movie_stats'] = apply_ratings(data, ratings)
+        return len(ratings)
+
+    # File tail
+
+    def _tail_offset_path(self):
+        return f"{self.wal_path or self.tail_path}.tail-offset"
+
+    def _read_tail_offset(self):
+        try:
+            with open(self._tail_offset_path()) as f:
+                state = json.load(f)
+            return state['offset'] if state.get('path') == self.tail_path else 0
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _write_tail_offset(self, offset):
+        tmp_path = f"{self._tail_offset_path()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'path': self.tail_path, 'offset': offset}, f)
+        os.replace(tmp_path, self._tail_offset_path())
+
+    def _tail_loop(self):
+        offset = self._read_tail_offset()
+        while not self._stop.is_set():
+            try:
+                offset = self._tail_once(offset)
+            except Exception as e:
+                logger.warning(f"Reading {self.tail_path} failed: {e}")
+            self._stop.wait(TAIL_POLL_SECONDS)
+
+    def _tail_once(self, offset):
+        """Ingest complete lines appended to the tailed file since offset."""
+        if not os.path.exists(self.tail_path):
+            return offset
+        size = os.path.getsize(self.tail_path)
+        if size < offset:
+            logger.info(f"{self.tail_path} was truncated, reading from the start")
+            offset = 0
+        if size == offset:
+            return offset
+
+        with open(self.tail_path, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read(size - offset)
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return offset
+
+        data = self.config['data_bundle']
+        ratings, skipped = parse_rating_lines(chunk[:end].decode('utf-8').splitlines(), data['movie_ids'])
+        if skipped:
+            logger.warning(f"Skipped {skipped} invalid lines in {self.tail_path}")
+        if ratings:
+            self.ingest(ratings)
+        offset += end
+        self._write_tail_offset(offset)
+        return offset
+
+
+def parse_rating_lines(lines, movie_ids):
+    """Parse userId,movieId,rating[,timestamp] CSV lines. Returns (ratings, skipped count)."""
+    ratings = []
+    skipped = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('userId'):
+            continue
+        fields = line.split(',')
+        try:
+            ratings.append(parse_rating(*fields[:3], fields[3] if len(fields) > 3 else None, movie_ids))
+        except (TypeError, ValueError, KeyError):
+            skipped += 1
+    return ratings, skipped
+
+
+def init_ingestion(config):
+    """Create and start a RatingIngestor for the loaded bundle, if RATINGS_WAL_PATH is set."""
+    if not config.get('RATINGS_WAL_PATH') or not config.get('data_bundle'):
+        return None
+    ingestor = RatingIngestor(config)
+    ingestor.start()
+    config['ingestor'] = ingestor
+    return ingestor
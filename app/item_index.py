@@ -0,0 +1,182 @@
+import numpy as np
+import json
+import logging
+import os
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 2
+
+
+class ItemNeighborIndex:
+    """
+    Precomputed top-N item-item neighbors.
+
+    Row i of `neighbors` holds the catalog indices of movie i's most similar
+    movies (padded with -1) and `similarities` the matching shrunk adjusted
+    cosine scores, best first.
+    """
+
+    def __init__(self, movie_ids, neighbors, similarities):
+        self.movie_ids = movie_ids
+        self.neighbors = neighbors
+        self.similarities = similarities
+
+    @classmethod
+    def build(cls, centered_by_movie, movie_ids, n_neighbors=50, shrinkage=25.0, max_block_bytes=128 * 2**20):
+        """
+        Build the index from user-mean-centered ratings (movies x users CSR).
+
+        Similarities are adjusted cosine (ratings centered on each user's mean)
+        multiplied by n / (n + shrinkage), where n is the number of co-raters,
+        so pairs with little support are pulled towards zero. Only positive
+        similarities are kept.
+        """
+        n_movies = centered_by_movie.shape[0]
+        n_neighbors = max(0, min(n_neighbors, n_movies - 1))
+        neighbors = np.full((n_movies, n_neighbors), -1, dtype=np.int32)
+        similarities = np.zeros((n_movies, n_neighbors), dtype=np.float32)
+        if n_neighbors == 0:
+            return cls(movie_ids, neighbors, similarities)
+
+        values = centered_by_movie.tocsr().astype(np.float32)
+        rated = values.copy()
+        rated.data = np.ones_like(rated.data)
+        norms = np.sqrt(np.asarray(values.multiply(values).sum(axis=1)).ravel())
+        values_t = values.T.tocsr()
+        rated_t = rated.T.tocsr()
+
+        block_size = max(1, int(max_block_bytes // (8 * n_movies)))
+        for start in range(0, n_movies, block_size):
+            end = min(start + block_size, n_movies)
+            dots = (values[start:end] @ values_t).toarray()
+            support = (rated[start:end] @ rated_t).toarray()
+
+            scale = norms[start:end, None] * norms[None, :]
+            sims = np.divide(dots, scale, out=np.zeros_like(dots), where=scale > 0)
+            sims *= support / (support + shrinkage)
+            sims[np.arange(end - start), np.arange(start, end)] = 0.0
+
+            top = np.argpartition(-sims, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_sims = np.take_along_axis(top_sims, order, axis=1)
+
+            keep = top_sims > 0
+            neighbors[start:end] = np.where(keep, top, -1)
+            similarities[start:end] = np.where(keep, top_sims, 0.0)
+
+        return cls(movie_ids, neighbors, similarities)
+
+    def save(self, path, metadata=None):
+        """Write the index with `metadata` (e.g. data version and build parameters) that load() checks."""
+        np.savez(
+            path,
+            version=np.int32(INDEX_FORMAT_VERSION),
+            metadata=np.array(json.dumps(metadata or {}, sort_keys=True)),
+            movie_ids=self.movie_ids,
+            neighbors=self.neighbors,
+            similarities=self.similarities,
+        )
+
+    @classmethod
+    def load(cls, path, movie_ids, expected=None):
+        """
+        Load a saved index, or return None if it is missing, built for another
+        catalog, or its metadata differs from `expected` (key -> value).
+        """
+        if not path or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data['version']) != INDEX_FORMAT_VERSION:
+                return None
+            metadata = json.loads(str(data['metadata']))
+            for key, value in (expected or {}).items():
+                if metadata.get(key) != value:
+                    logger.info(f"Ignoring item index in {path}: {key} does not match")
+                    return None
+            if not np.array_equal(data['movie_ids'], movie_ids):
+                return None
+            return cls(data['movie_ids'], data['neighbors'], data['similarities'])
+
+    @property
+    def n_neighbors(self):
+        return self.neighbors.shape[1]
+
+    def similar(self, movie_idx, limit=None):
+        """(movie indices, similarities) for one movie, most similar first."""
+        row = self.neighbors[movie_idx]
+        valid = row >= 0
+        row, sims = row[valid], self.similarities[movie_idx][valid]
+        if limit is not None:
+            row, sims = row[:limit], sims[:limit]
+        return row, sims
+
+    def predict(self, rated_idx, ratings):
+        """
+        Merge the neighbor lists of the rated movies into predictions.
+
+        Each candidate's prediction is the similarity-weighted average of the
+        ratings of the rated movies it neighbors. Returns (movie indices,
+        predictions, total similarity) for candidates not already rated.
+        """
+        rated_idx = np.asarray(rated_idx, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        neighbors = self.neighbors[rated_idx]
+        valid = neighbors >= 0
+
+        candidates = neighbors[valid]
+        sims = self.similarities[rated_idx][valid]
+        weighted = np.repeat(ratings, self.n_neighbors)[valid.ravel()] * sims
+
+        movies, inverse = np.unique(candidates, return_inverse=True)
+        numerator = np.bincount(inverse, weights=weighted)
+        denominator = np.bincount(inverse, weights=np.abs(sims))
+
+        keep = ~np.isin(movies, rated_idx) & (denominator > 0)
+        movies, numerator, denominator = movies[keep], numerator[keep], denominator[keep]
+        return movies, np.clip(numerator / denominator, 0.5, 5.0), denominator
+
+    def similarity_matrix(self):
+        """Sparse movies x movies matrix with row j holding movie j's neighbor similarities."""
+        if getattr(self, '_similarity_matrix', None) is None:
+            n_movies = len(self.movie_ids)
+            valid = self.neighbors >= 0
+            rows = np.repeat(np.arange(n_movies), valid.sum(axis=1))
+            self._similarity_matrix = sparse.csr_matrix(
+                (self.similarities[valid].astype(np.float64), (rows, self.neighbors[valid])), shape=(n_movies, n_movies)
+            )
+        return self._similarity_matrix
+
+    def predict_batch(self, rated_rows, rated_idx, ratings):
+        """
+        predict() for many rating sets with two sparse matrix-matrix products.
+
+        rated_rows[i] is the rating set that (rated_idx[i], ratings[i]) belongs
+        to. Returns (denominator, numerator): a CSR matrix of total similarity
+        per (set, candidate movie) and the matching weighted rating sums,
+        aligned with denominator.data. Already-rated movies have a zero
+        denominator.
+        """
+        n_sets = int(rated_rows.max()) + 1 if len(rated_rows) else 0
+        shape = (n_sets, len(self.movie_ids))
+        weighted = sparse.csr_matrix((np.asarray(ratings, dtype=np.float64), (rated_rows, rated_idx)), shape=shape)
+        present = sparse.csr_matrix((np.ones(len(rated_rows)), (rated_rows, rated_idx)), shape=shape)
+
+        similarities = self.similarity_matrix()
+        denominator = (present @ abs(similarities)).tocsr()
+        denominator.sort_indices()
+        rows = np.repeat(np.arange(n_sets), np.diff(denominator.indptr))
+        numerator = np.asarray((weighted @ similarities).tocsr()[rows, denominator.indices]).ravel()
+
+        keys = rows.astype(np.int64) * shape[1] + denominator.indices
+        rated = np.asarray(rated_rows, dtype=np.int64) * shape[1] + rated_idx
+        denominator.data[np.isin(keys, rated)] = 0.0
+        return denominator, numerator
+
+    @property
+    def nbytes(self):
+        return self.neighbors.nbytes + self.similarities.nbytes
+
@@ -0,0 +1,181 @@
+"""
+Data bundle lifecycle: load in the background while the app serves, report
+readiness, and reload without downtime.
+
+The app answers /healthz as soon as it starts and /readyz once a bundle is
+loaded; until then API requests get a 503 with Retry-After. A reload (POST
+/admin/reload, or SIGHUP where the server entry point installed the handler)
+builds a complete new bundle on a background thread while the current one
+keeps serving, then swaps the app.config reference.
+Requests read the bundle once when they start, so in-flight requests finish
+on the bundle they began with and the old bundle is freed after the last one.
+"""
+import logging
+import os
+import signal
+import threading
+import time
+import traceback
+
+from app.metrics import DATA_LOADS
+
+logger = logging.getLogger(__name__)
+
+
+class DataLifecycle:
+    """Loads the app's data bundle and tracks whether it is ready."""
+
+    def __init__(self, app):
+        self.app = app
+        self.state = 'idle'    # idle, loading, ready or failed
+        self.error = None
+        self.loaded_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Load the data on a background thread, or reload it once loaded.
+
+        Returns False without doing anything if a load is already running.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            if self.state != 'ready':
+                self.state = 'loading'
+            self._thread = threading.Thread(target=self._run, name='data-load', daemon=True)
+            self._thread.start()
+        return True
+
+    def wait(self, timeout=None):
+        """Wait for a running background load. Returns True if none is running afterwards."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def _run(self):
+        if self.state == 'ready':
+            # A reload shares the CPU with requests served from the current bundle
+            _lower_priority(self.app.config.get('RELOAD_NICE', 0))
+        self.load()
+
+    def load(self):
+        """Load, or reload, on the calling thread. Returns True on success."""
+        config = self.app.config
+        kind = 'reload' if config.get('data_bundle') else 'initial'
+        start = time.time()
+        try:
+            if kind == 'initial':
+                self._load_initial()
+            else:
+                self._reload()
+        except FileNotFoundError as e:
+            self._failed(kind, e)
+            logger.error(f"CSV file not found: {e}")
+            logger.error("Please ensure ratings.csv and movies.csv are in the project root directory")
+            return False
+        except Exception as e:
+            self._failed(kind, e)
+            logger.error(f"Error loading data: {e}")
+            traceback.print_exc()
+            return False
+
+        self.state, self.error, self.loaded_at = 'ready', None, time.time()
+        DATA_LOADS.labels(kind, 'ok').inc()
+        data_bundle = config['data_bundle']
+        logger.info(
+            f"Data {'reloaded' if kind == 'reload' else 'loaded'} in {time.time() - start:.1f}s: "
+            f"{len(data_bundle['user_ids'])} users, {len(data_bundle['movie_ids'])} movies"
+        )
+        return True
+
+    def _load_initial(self):
+        from app.data_loader import load_data
+        from app.ingest import init_ingestion
+        logger.info("Loading data...")
+        self.app.config['data_bundle'] = load_data(self.app.config)
+        init_ingestion(self.app.config)
+
+    def _reload(self):
+        from app.data_loader import load_data
+        config = self.app.config
+        logger.info("Reloading data...")
+        ingestor = config.get('ingestor')
+        if ingestor is not None:
+            # The ingestor swaps the bundle itself, with pending ratings replayed into it
+            ingestor.reload(lambda: load_data(config))
+        else:
+            config['data_bundle'] = load_data(config)
+
+    def _failed(self, kind, error):
+        DATA_LOADS.labels(kind, 'failed').inc()
+        self.error = str(error)
+        if kind == 'initial':
+            self.state = 'failed'
+            self.app.config['data_bundle'] = None
+
+    def status(self):
+        data_bundle = self.app.config.get('data_bundle')
+        thread = self._thread
+        return {
+            'ready': bool(data_bundle),
+            'status': self.state,
+            'reloading': self.state == 'ready' and thread is not None and thread.is_alive(),
+            'dataVersion': data_bundle.get('version') if data_bundle else None,
+            'loadedAt': self.loaded_at,
+            'error': self.error,
+        }
+
+
+def _lower_priority(nice):
+    """Raise the niceness of the calling thread (Linux schedules threads individually)."""
+    if not nice or not hasattr(os, 'setpriority') or not hasattr(threading, 'get_native_id'):
+        return
+    try:
+        tid = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + nice)
+    except OSError as e:
+        logger.debug(f"Could not lower reload thread priority: {e}")
+
+
+def init_app(app):
+    """
+    Attach a DataLifecycle to the app and answer API requests with 503 until
+    data is loaded. Servers call install_signal_handler() to reload on
+    RELOAD_SIGNAL.
+    """
+    from flask import jsonify, request
+
+    lifecycle = DataLifecycle(app)
+    app.config['data_lifecycle'] = lifecycle
+
+    @app.before_request
+    def _require_data():
+        if lifecycle.state == 'loading' and request.path.startswith('/api/') and not app.config.get('data_bundle'):
+            response = jsonify({'error': 'Data is loading, retry shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '5'
+            return response
+
+    return lifecycle
+
+
+def install_signal_handler(app):
+    """
+    Reload the app's data on RELOAD_SIGNAL. The handler is process-wide, so
+    only server entry points (app.py, asgi.py) install it. Returns whether
+    a handler was installed.
+    """
+    signal_name = app.config.get('RELOAD_SIGNAL')
+    signum = getattr(signal, signal_name, None) if signal_name else None
+    # Handlers can only be installed from the main thread (e.g. not by a server's worker thread)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+    lifecycle = app.config['data_lifecycle']
+    # Start the reload from another thread: the handler interrupts the main thread,
+    # which may be holding the lifecycle lock
+    signal.signal(signum, lambda *_: threading.Thread(target=lifecycle.start, daemon=True).start())
+    return True
@@ -0,0 +1,417 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) of the latency histogram buckets
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+PROFILE_TOP_FUNCTIONS = 25  # Functions listed in the log summary of a slow request
+
+
+class _Metric:
+    """A metric family: one child per combination of label values."""
+
+    type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        """(suffix, labels, value) for every child, in a stable order."""
+        for values, child in sorted(self._children.items()):
+            labels = dict(zip(self.label_names, values))
+            yield from child.samples(labels)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def samples(self, labels):
+        yield '', labels, self.value
+
+
+class _CounterChild(_Value):
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_Value):
+    def set(self, value):
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramChild:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        bucket = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, labels):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += count
+            yield '_bucket', dict(labels, le=_format_bound(bound)), cumulative
+        yield '_sum', labels, total
+        yield '_count', labels, cumulative
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class _Timer:
+    """Context manager observing its elapsed wall time into a histogram child."""
+
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Registry:
+    """Metric families plus collector callbacks, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector):
+        """
+        Add a callable returning (name, type, help, [(labels, value), ...])
+        tuples, read on every scrape. Used for values owned elsewhere, such as
+        cache counters.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self, extra_collectors=()):
+        """The exposition text; extra_collectors are read for this scrape only."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        for collector in list(self._collectors) + list(extra_collectors):
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append(f'# HELP {name} {_escape_help(documentation)}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    value = float(value)
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    return repr(int(value)) if value.is_integer() and abs(value) < 2**53 else repr(value)
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route, method and status.',
+    ('endpoint', 'method', 'status'),
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'recommender_stage_duration_seconds', 'Time spent in each stage of a recommendation path.',
+    ('path', 'stage'), buckets=STAGE_BUCKETS,
+))
+LOAD_PHASE_SECONDS = REGISTRY.register(Gauge(
+    'data_load_phase_seconds', 'Duration of each phase of the most recent data load.', ('phase',),
+))
+LOADS = REGISTRY.register(Counter(
+    'data_loads_total', 'Data bundle loads by source (snapshot, parquet, csv).', ('source',),
+))
+DATA_LOADS = REGISTRY.register(Counter(
+    'data_lifecycle_loads_total', 'Background data loads, by kind (initial, reload) and outcome (ok, failed).',
+    ('kind', 'outcome'),
+))
+BUNDLE_ITEMS = REGISTRY.register(Gauge(
+    'data_bundle_items', 'Users, movies and ratings in the loaded data bundle.', ('kind',),
+))
+BUNDLE_BYTES = REGISTRY.register(Gauge(
+    'data_bundle_bytes', 'Array memory of each data bundle component.', ('component',),
+))
+OFFLOADED = REGISTRY.register(Counter(
+    'compute_requests_total',
+    'Computations requested from the compute pool, by outcome (computed, coalesced, rejected, timeout).',
+    ('outcome',),
+))
+COMPUTE_PENDING = REGISTRY.register(Gauge(
+    'compute_pool_pending', 'Computations running or queued in the compute pool.',
+))
+HTTP_CACHE_RESPONSES = REGISTRY.register(Counter(
+    'http_cache_responses_total',
+    'Responses of cacheable endpoints, by outcome (not_modified, hit, rendered) and content encoding.',
+    ('outcome', 'encoding'),
+))
+PROFILED_REQUESTS = REGISTRY.register(Counter(
+    'profiled_requests_total', 'Requests run under the profiler, by whether they were slow enough to dump.',
+    ('dumped',),
+))
+
+
+def stage(path, name):
+    """Time a block as one stage of a recommendation path: `with stage('item', 'scoring'): ...`"""
+    return STAGE_SECONDS.labels(path, name).time()
+
+
+class load_phase:
+    """Time a block as a data load phase, recording the duration of the latest run."""
+
+    __slots__ = ('_gauge', '_start')
+
+    def __init__(self, name):
+        self._gauge = LOAD_PHASE_SECONDS.labels(name)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._gauge.set(time.perf_counter() - self._start)
+
+
+def record_bundle(data, component_bytes):
+    """Publish the bundle's item counts and per-component array sizes."""
+    store = data['rating_store']
+    BUNDLE_ITEMS.labels('users').set(store.n_users)
+    BUNDLE_ITEMS.labels('movies').set(store.n_movies)
+    BUNDLE_ITEMS.labels('ratings').set(store.n_ratings)
+    for component, nbytes in component_bytes.items():
+        BUNDLE_BYTES.labels(component).set(nbytes)
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in profiler for a random sample of requests.
+
+    A sampled request runs under cProfile; if it takes at least slow_ms, the
+    stats are written to output_dir as a .prof file (open with pstats or
+    snakeviz) and the top functions are logged. Only one request is profiled
+    at a time, and only the thread serving it is profiled.
+    """
+
+    def __init__(self, sample_rate, slow_ms, output_dir):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.output_dir = output_dir
+        self._busy = threading.Lock()
+
+    def start(self):
+        """A running profiler for this request, or None if it is not sampled."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is active
+            self._busy.release()
+            return None
+        return profiler
+
+    def abort(self, profiler):
+        profiler.disable()
+        self._busy.release()
+
+    def finish(self, profiler, elapsed, label):
+        self.abort(profiler)
+        slow = elapsed * 1000 >= self.slow_ms
+        PROFILED_REQUESTS.labels('true' if slow else 'false').inc()
+        if not slow:
+            return None
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        path = None
+        if self.output_dir:
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                safe_label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'request'
+                path = os.path.join(
+                    self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{elapsed * 1000:.0f}ms.prof"
+                )
+                stats.dump_stats(path)
+            except OSError as e:
+                logger.warning(f"Could not write profile: {e}")
+                path = None
+        logger.warning(
+            f"Slow request {label} took {elapsed * 1000:.1f}ms"
+            f"{f' (profile saved to {path})' if path else ''}\n{stream.getvalue()}"
+        )
+        return path
+
+
+def init_app(app):
+    """Time every request by route and, if configured, profile a sample of slow ones."""
+    from flask import g, request
+
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    profiler = None
+    if sample_rate > 0:
+        profiler = SlowRequestProfiler(
+            sample_rate, app.config.get('PROFILE_SLOW_MS', 500), app.config.get('PROFILE_DIR'),
+        )
+    app.config['slow_request_profiler'] = profiler
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_profiler = profiler.start() if profiler is not None else None
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        # The route template keeps label cardinality bounded (/api/movies/<int:movie_id>)
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.labels(endpoint, request.method, response.status_code).observe(elapsed)
+
+        running = g.pop('metrics_profiler', None)
+        if running is not None:
+            profiler.finish(running, elapsed, f'{request.method} {request.full_path.rstrip("?")}')
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        # after_request is skipped when a response could not be built
+        running = g.pop('metrics_profiler', None)
+        if running is not None:
+            profiler.abort(running)
+
+
+def ingestion_metrics(ingestor):
+    """Collector output for a RatingIngestor's counters (empty without one)."""
+    if ingestor is None:
+        return []
+    stats = ingestor.stats()
+    return [
+        ('ingest_ratings_accepted_total', 'counter', 'Ratings accepted by the ingestor.',
+         [({}, stats['accepted'])]),
+        ('ingest_ratings_pending', 'gauge', 'Ingested ratings not yet compacted into the store.',
+         [({}, stats['pending'])]),
+        ('ingest_compactions_total', 'counter', 'Completed compactions.',
+         [({}, stats['compactions'])]),
+    ]
@@ -0,0 +1,75 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+RANKING_MODES = ('average', 'bayesian', 'count')
+
+
+class MovieStats:
+    """
+    Per-movie rating aggregates, aligned with RatingStore.movie_ids.
+
+    The Bayesian score shrinks each mean towards the global mean as if every
+    movie had `prior_count` extra ratings at the global average, so movies
+    with a handful of 5-star ratings do not outrank established favorites.
+    """
+
+    def __init__(self, movie_ids, counts, sums, prior_count=25, updates=0):
+        self.movie_ids = movie_ids
+        self.prior_count = prior_count
+        self.updates = updates  # Ratings applied since the aggregates were built from a store
+        self.update(counts, sums)
+
+    @classmethod
+    def from_store(cls, store, prior_count=25):
+        cumulative = np.concatenate(([0.0], np.cumsum(store.movie_values, dtype=np.float64)))
+        sums = cumulative[store.movie_indptr[1:]] - cumulative[store.movie_indptr[:-1]]
+        return cls(store.movie_ids, store.movie_counts(), sums, prior_count)
+
+    def update(self, counts, sums):
+        """Recompute derived arrays from new counts and sums."""
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.sums = np.asarray(sums, dtype=np.float64)
+        total = self.counts.sum()
+        self.global_mean = float(self.sums.sum() / total) if total else 0.0
+        self.means = np.divide(self.sums, self.counts, out=np.zeros(len(self.counts)), where=self.counts > 0)
+        self.bayesian = (self.sums + self.prior_count * self.global_mean) / (self.counts + self.prior_count)
+
+    def updated(self, movie_idx, count_deltas, sum_deltas):
+        """A new MovieStats with per-movie count and sum changes applied."""
+        counts, sums = self.counts.copy(), self.sums.copy()
+        np.add.at(counts, movie_idx, count_deltas)
+        np.add.at(sums, movie_idx, sum_deltas)
+        return MovieStats(self.movie_ids, counts, sums, self.prior_count, self.updates + len(movie_idx))
+
+    def top(self, limit, min_count=1, mask=None, mode='average'):
+        """
+        Indices of the top movies for a ranking mode, best first.
+
+        'average' ranks by mean rating (to 2 decimals) then count, 'bayesian' by
+        the Bayesian-weighted score and 'count' by number of ratings.
+        """
+        if mode == 'average':
+            primary, secondary = np.round(self.means, 2), self.counts
+        elif mode == 'bayesian':
+            primary, secondary = self.bayesian, self.counts
+        elif mode == 'count':
+            primary, secondary = self.counts, self.means
+        else:
+            raise ValueError(f"Unknown ranking mode '{mode}'")
+
+        eligible = self.counts >= max(min_count, 1)
+        if mask is not None:
+            eligible &= mask
+        candidates = np.flatnonzero(eligible)
+        if limit <= 0:
+            return candidates[:0]
+
+        # Keep everything tied with the limit-th best so tie-breaks stay exact
+        if len(candidates) > limit:
+            values = primary[candidates]
+            kth = np.partition(values, len(values) - limit)[len(values) - limit]
+            candidates = candidates[values >= kth]
+        order = np.lexsort((self.movie_ids[candidates], -secondary[candidates], -primary[candidates]))
+        return candidates[order[:limit]]
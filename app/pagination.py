@@ -0,0 +1,121 @@
+"""
+Cursor pagination over the user list and user rating histories.
+
+Pages are cut from arrays that are already in order: the sorted user IDs
+of the rating store and each user's ratings as ordered by history_order at
+load time. A cursor names the last item returned (a user ID, or a
+"rating:movieId" pair), so the next page starts with a binary search
+rather than skipping over earlier items, and pages stay consistent when
+ratings are added in between.
+"""
+import json
+
+import numpy as np
+
+NDJSON_CHUNK_LINES = 1000  # Lines per chunk of a streamed NDJSON response
+
+
+class InvalidCursor(ValueError):
+    """A cursor that this endpoint did not produce."""
+
+
+def user_page(data_bundle, cursor=None, limit=1000):
+    """
+    Up to `limit` user IDs after `cursor` in ascending order, and the cursor
+    for the next page (None on the last page).
+
+    Users that only have pending (not yet compacted) ratings are merged in.
+    """
+    after = _parse_int(cursor)
+    store = data_bundle['rating_store']
+    start = int(np.searchsorted(store.user_ids, after, side='right')) if after is not None else 0
+    ids = store.user_ids[start:start + limit + 1].tolist()
+
+    delta = data_bundle.get('delta')
+    if delta is not None:
+        pending = sorted(
+            u for u in delta.users()
+            if (after is None or u > after) and store.user_index(u) < 0
+        )
+        if pending:
+            ids = sorted(ids + pending[:limit + 1])[:limit + 1]
+
+    if len(ids) > limit:
+        return ids[:limit], str(ids[limit - 1])
+    return ids, None
+
+
+def user_history(data_bundle, user_id):
+    """
+    (movie IDs, ratings) of a user's ratings, highest rating first, then by
+    movie ID, including pending ratings. Returns None for an unknown user.
+    """
+    store = data_bundle['rating_store']
+    delta = data_bundle.get('delta')
+    pending = delta.user_row(user_id) if delta is not None else {}
+    user_idx = store.user_index(user_id)
+
+    if not pending:
+        if user_idx < 0:
+            return None
+        order = data_bundle['history_order'][store.user_indptr[user_idx]:store.user_indptr[user_idx + 1]]
+        return store.movie_ids[store.user_movie_idx[order]], store.user_values[order]
+
+    # Pending ratings add or replace entries, so merge and sort this one user
+    row = data_bundle['user_ratings'][user_id]
+    movie_ids = np.fromiter(row.keys(), dtype=np.int64, count=len(row))
+    ratings = np.fromiter(row.values(), dtype=np.float32, count=len(row))
+    order = np.lexsort((movie_ids, -ratings))
+    return movie_ids[order], ratings[order]
+
+
+def history_start(movie_ids, ratings, cursor=None):
+    """Position in a user_history() of the first entry after `cursor`."""
+    if cursor is None:
+        return 0
+    try:
+        rating, movie_id = cursor.split(':')
+        rating, movie_id = np.float32(rating), int(movie_id)
+    except (AttributeError, ValueError):
+        raise InvalidCursor(f"Invalid cursor '{cursor}'") from None
+    # Entries sort by (-rating, movieId): find the run of equal ratings, then the movie within it
+    negated = -ratings
+    lo = int(np.searchsorted(negated, -rating, side='left'))
+    hi = int(np.searchsorted(negated, -rating, side='right'))
+    return lo + int(np.searchsorted(movie_ids[lo:hi], movie_id, side='right'))
+
+
+def history_cursor(movie_ids, ratings, end):
+    """Cursor for the page that ends before position `end`, or None if nothing follows."""
+    if end >= len(movie_ids) or end == 0:
+        return None
+    return f"{float(ratings[end - 1])!r}:{int(movie_ids[end - 1])}"
+
+
+def ndjson_chunks(pages, line):
+    """
+    Encode an iterable of item lists as NDJSON, yielding about
+    NDJSON_CHUNK_LINES lines per bytes chunk.
+    """
+    buffer = []
+    for items in pages:
+        for item in items:
+            buffer.append(line(item))
+            if len(buffer) >= NDJSON_CHUNK_LINES:
+                yield ''.join(buffer).encode('utf-8')
+                buffer = []
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def json_line(item):
+    return json.dumps(item, separators=(',', ':')) + '\n'
+
+
+def _parse_int(cursor):
+    if cursor is None:
+        return None
+    try:
+        return int(cursor)
+    except (TypeError, ValueError):
+        raise InvalidCursor(f"Invalid cursor '{cursor}'") from None
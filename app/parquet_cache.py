@@ -0,0 +1,155 @@
+"""
+Parquet cache of ratings.csv and movies.csv, and the manifest that says
+what the cache was built from.
+
+The manifest records the schema version, the size, mtime and SHA-256 of each
+source CSV, and the size and mtime of each cache file. A cache is used only
+while all of them still match; a source whose mtime changed but whose size
+did not is re-hashed, so touching or copying a file does not force a
+rebuild. Deleting the CSVs keeps the cache in use, as the only copy of the data.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+CACHE_SCHEMA_VERSION = 2
+HASH_BLOCK_SIZE = 4 * 2**20
+
+SOURCE_KEYS = ('RATINGS_CSV', 'MOVIES_CSV')
+OUTPUT_KEYS = ('CACHE_RATINGS_PARQUET', 'CACHE_MOVIES_PARQUET')
+MOVIE_COLUMNS = ['movieId', 'title', 'genres']
+# Genre lists repeat across the catalog (under 1k distinct in MovieLens), so they are dictionary-encoded
+MOVIES_SCHEMA = pa.schema([
+    ('movieId', pa.int32()),
+    ('title', pa.string()),
+    ('genres', pa.dictionary(pa.int32(), pa.string())),
+])
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def source_fingerprints(config):
+    """Size, mtime and SHA-256 of each source CSV (None for a missing file)."""
+    sources = {}
+    for key in SOURCE_KEYS:
+        path = config.get(key)
+        if path and os.path.exists(path):
+            sources[key] = dict(_stat(path), sha256=file_sha256(path))
+        else:
+            sources[key] = None
+    return sources
+
+
+def write_movies(movies_df, path):
+    """Write the catalog as movieId (int32), title and dictionary-encoded genres."""
+    columns = {}
+    for name, field in zip(MOVIE_COLUMNS, MOVIES_SCHEMA):
+        if name in movies_df.columns:
+            columns[name] = pa.array(movies_df[name], type=field.type if name == 'movieId' else pa.string(),
+                                     from_pandas=True)
+        else:
+            columns[name] = pa.nulls(len(movies_df), type=pa.string())
+    columns['genres'] = columns['genres'].dictionary_encode()
+    pq.write_table(pa.Table.from_pydict(columns, schema=MOVIES_SCHEMA), path)
+
+
+def read_movies(path):
+    """The cached catalog as a DataFrame (genres as a pandas categorical)."""
+    return pd.read_parquet(path, columns=MOVIE_COLUMNS)
+
+
+def write_manifest(config, sources=None, ingested_ratings=0):
+    """
+    Record the cache files as built from `sources` (default: fingerprint the CSVs now).
+
+    ingested_ratings counts ratings compacted into the cache that are not in
+    ratings.csv; they are lost if the cache is rebuilt from a changed CSV.
+    """
+    path = config.get('CACHE_MANIFEST_PATH')
+    if not path:
+        return
+    manifest = {
+        'schema_version': CACHE_SCHEMA_VERSION,
+        'created': time.time(),
+        'sources': sources if sources is not None else source_fingerprints(config),
+        'outputs': {key: _stat(config[key]) for key in OUTPUT_KEYS},
+        'ingested_ratings': ingested_ratings,
+    }
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(config):
+    path = config.get('CACHE_MANIFEST_PATH')
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable cache manifest {path}: {e}")
+        return None
+
+
+def check_cache(config):
+    """
+    Whether the Parquet cache can be used: (True, None) or (False, reason).
+
+    Sources whose content hash still matches after an mtime change are
+    recorded with their new mtime so the next check is cheap again.
+    """
+    if not all(config.get(key) and os.path.exists(config[key]) for key in OUTPUT_KEYS):
+        return False, 'cache files missing'
+    manifest = read_manifest(config)
+    if manifest is None:
+        return False, 'no cache manifest'
+    if manifest.get('schema_version') != CACHE_SCHEMA_VERSION:
+        return False, f"cache schema version {manifest.get('schema_version')}"
+    for key in OUTPUT_KEYS:
+        if manifest['outputs'].get(key) != _stat(config[key]):
+            return False, f'{os.path.basename(config[key])} changed since it was written'
+
+    rehashed = False
+    for key in SOURCE_KEYS:
+        path = config.get(key)
+        recorded = manifest['sources'].get(key)
+        if not path or not os.path.exists(path):
+            continue
+        if recorded is None:
+            return False, f'{os.path.basename(path)} appeared since the cache was built'
+        current = _stat(path)
+        if current['size'] != recorded['size']:
+            return False, f'{os.path.basename(path)} changed size'
+        if current['mtime_ns'] != recorded['mtime_ns']:
+            if file_sha256(path) != recorded['sha256']:
+                return False, f'{os.path.basename(path)} content changed'
+            recorded['mtime_ns'] = current['mtime_ns']
+            rehashed = True
+
+    if rehashed:
+        try:
+            write_manifest(config, manifest['sources'], manifest.get('ingested_ratings', 0))
+        except OSError as e:
+            logger.warning(f"Could not update cache manifest: {e}")
+    return True, None
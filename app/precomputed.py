@@ -0,0 +1,101 @@
+import numpy as np
+import logging
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['userId', 'rank', 'movieId', 'predictedRating']
+
+
+class PrecomputedRecommendations:
+    """
+    Materialized top-N recommendations per user, as CSR-style arrays.
+
+    Rows for user_ids[i] live in movie_ids[indptr[i]:indptr[i + 1]], best first.
+    """
+
+    def __init__(self, user_ids, indptr, movie_ids, predictions, top_n):
+        self.user_ids = user_ids
+        self.indptr = indptr
+        self.movie_ids = movie_ids
+        self.predictions = predictions
+        self.top_n = top_n
+
+    @classmethod
+    def load(cls, path, expected):
+        """
+        Load a precomputed file, or return None if it is missing or was built
+        for different data or parameters.
+
+        `expected` maps metadata keys (data_version, k_neighbors, min_overlap)
+        to the values the running app uses.
+        """
+        if not path or not os.path.exists(path):
+            return None
+
+        parquet = pq.ParquetFile(path)
+        metadata = {k.decode(): v.decode() for k, v in (parquet.schema_arrow.metadata or {}).items()}
+        for key, value in expected.items():
+            if metadata.get(key) != str(value):
+                logger.info(f"Ignoring precomputed recommendations in {path}: {key} does not match")
+                return None
+
+        table = parquet.read(columns=COLUMNS).to_pandas()
+        table = table.sort_values(['userId', 'rank'], kind='stable')
+        users = table['userId'].to_numpy(dtype=np.int32)
+        user_ids, counts = np.unique(users, return_counts=True)
+        indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(
+            user_ids, indptr,
+            table['movieId'].to_numpy(dtype=np.int32),
+            table['predictedRating'].to_numpy(dtype=np.float32),
+            int(metadata.get('top_n', 0)),
+        )
+
+    def get(self, user_id, n):
+        """(movie IDs, predictions) for a user, or None if not materialized deep enough."""
+        if n > self.top_n:
+            return None
+        pos = int(np.searchsorted(self.user_ids, user_id))
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return None
+        start = self.indptr[pos]
+        end = min(self.indptr[pos + 1], start + n)
+        return self.movie_ids[start:end], self.predictions[start:end]
+
+
+class PrecomputedWriter:
+    """Streams recommendation rows to a Parquet file tagged with build metadata."""
+
+    def __init__(self, path, metadata):
+        self.schema = pa.schema([
+            ('userId', pa.int32()),
+            ('rank', pa.int16()),
+            ('movieId', pa.int32()),
+            ('predictedRating', pa.float32()),
+        ], metadata={str(k): str(v) for k, v in metadata.items()})
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._writer = pq.ParquetWriter(self._tmp_path, self.schema)
+
+    def write(self, user_ids, ranks, movie_ids, predictions):
+        self._writer.write_table(pa.Table.from_arrays([
+            pa.array(np.asarray(user_ids, dtype=np.int32)),
+            pa.array(np.asarray(ranks, dtype=np.int16)),
+            pa.array(np.asarray(movie_ids, dtype=np.int32)),
+            pa.array(np.asarray(predictions, dtype=np.float32)),
+        ], schema=self.schema))
+
+    def close(self):
+        """Finish the file and move it into place atomically."""
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Discard a partially written file."""
+        self._writer.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+import logging
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+RATING_COLUMNS = ['userId', 'movieId', 'rating']
+DEFAULT_CHUNK_SIZE = 250_000
+CSV_DTYPES = {'userId': np.int32, 'movieId': np.int32, 'rating': np.float32, 'timestamp': np.int64}
+MAX_ID = np.iinfo(np.int32).max
+MIN_RATING, MAX_RATING = 0.0, 5.0
+GROWTH = 1.5
+
+
+class RatingColumns:
+    """
+    Growable rating columns filled one chunk at a time.
+
+    IDs are int32. Ratings are kept as uint8 half-star codes (rating * 2) while
+    every rating is a multiple of 0.5, as in MovieLens, and switch to float32
+    the first time one is not. int64 timestamps are kept only if asked for.
+    """
+
+    def __init__(self, capacity=0, with_timestamps=False):
+        self.size = 0
+        self.users = np.empty(capacity, dtype=np.int32)
+        self.movies = np.empty(capacity, dtype=np.int32)
+        self.codes = np.empty(capacity, dtype=np.uint8)
+        self.values = None
+        self.timestamps = np.empty(capacity, dtype=np.int64) if with_timestamps else None
+
+    def _reserve(self, n):
+        needed = self.size + n
+        if needed <= len(self.users):
+            return
+        capacity = max(needed, int(len(self.users) * GROWTH))
+        for name in ('users', 'movies', 'codes', 'values', 'timestamps'):
+            old = getattr(self, name)
+            if old is not None:
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:self.size] = old[:self.size]
+                setattr(self, name, new)
+
+    def append(self, users, movies, ratings, timestamps=None):
+        n = len(users)
+        self._reserve(n)
+        rows = slice(self.size, self.size + n)
+        self.users[rows] = users
+        self.movies[rows] = movies
+        if self.timestamps is not None:
+            self.timestamps[rows] = timestamps
+        if self.values is None:
+            doubled = np.asarray(ratings, dtype=np.float32) * 2
+            codes = np.rint(doubled)
+            if np.array_equal(codes, doubled):
+                self.codes[rows] = codes
+            else:
+                self.values = np.empty(len(self.codes), dtype=np.float32)
+                self.values[:self.size] = self.codes[:self.size] * np.float32(0.5)
+                self.codes = None
+        if self.values is not None:
+            self.values[rows] = ratings
+        self.size += n
+
+    def arrays(self):
+        """(user IDs, movie IDs, float32 ratings) for the rows appended so far."""
+        if self.values is not None:
+            ratings = self.values[:self.size]
+        else:
+            ratings = self.codes[:self.size] * np.float32(0.5)
+        return self.users[:self.size], self.movies[:self.size], ratings
+
+    def timestamp_array(self):
+        return self.timestamps[:self.size]
+
+    @property
+    def nbytes(self):
+        return sum(
+            a.nbytes for a in (self.users, self.movies, self.codes, self.values, self.timestamps) if a is not None
+        )
+
+
+class _ParquetRatingsWriter:
+    """Streams cleaned rating chunks to a Parquet file with narrow column types."""
+
+    def __init__(self, path, with_timestamps):
+        fields = [('userId', pa.int32()), ('movieId', pa.int32()), ('rating', pa.float32())]
+        if with_timestamps:
+            fields.append(('timestamp', pa.int64()))
+        self.schema = pa.schema(fields)
+        self.path = path
+        self._writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, users, movies, ratings, timestamps=None):
+        columns = [pa.array(users), pa.array(movies), pa.array(ratings)]
+        if timestamps is not None:
+            columns.append(pa.array(timestamps))
+        self._writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+    def abort(self):
+        self._writer.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _numeric(column):
+    """Column values as a numeric array, without copying columns that already parsed as numbers."""
+    if column.dtype.kind in 'iuf':
+        return column.to_numpy()
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _valid_ids(ids):
+    valid = (ids >= 0) & (ids <= MAX_ID)
+    if ids.dtype.kind == 'f':
+        valid &= ids == np.floor(ids)
+    return valid
+
+
+def _clean_chunk(chunk):
+    """
+    Validate and deduplicate one chunk.
+
+    Drops rows with missing or non-numeric values, IDs outside int32 and
+    ratings outside [0, 5], then keeps the last rating of each (user, movie)
+    pair. Returns (users, movies, ratings, timestamps or None, dropped rows).
+    """
+    users = _numeric(chunk['userId'])
+    movies = _numeric(chunk['movieId'])
+    ratings = _numeric(chunk['rating'])
+    timestamps = _numeric(chunk['timestamp']) if 'timestamp' in chunk.columns else None
+    if timestamps is not None and timestamps.dtype.kind == 'f':
+        timestamps = np.nan_to_num(timestamps, nan=0.0)
+
+    valid = _valid_ids(users) & _valid_ids(movies) & (ratings >= MIN_RATING) & (ratings <= MAX_RATING)
+    if not valid.all():
+        users, movies = np.where(valid, users, 0), np.where(valid, movies, 0)
+    users, movies = users.astype(np.int32, copy=False), movies.astype(np.int32, copy=False)
+    ratings = ratings.astype(np.float32, copy=False)
+    # Invalid rows get distinct negative keys so they never shadow a valid rating
+    keys = np.where(valid, users.astype(np.int64) << 32 | movies, -1 - np.arange(len(valid)))
+    keep = valid & ~pd.Index(keys).duplicated(keep='last')
+    del keys
+
+    if timestamps is not None:
+        timestamps = timestamps.astype(np.int64, copy=False)
+    dropped = int(len(keep) - np.count_nonzero(keep))
+    if dropped == 0:
+        return users, movies, ratings, timestamps, 0
+    return (
+        users[keep], movies[keep], ratings[keep],
+        timestamps[keep] if timestamps is not None else None,
+        dropped,
+    )
+
+
+def has_timestamps(path):
+    """Whether a ratings CSV or Parquet file has a timestamp column."""
+    if path.endswith('.parquet'):
+        return 'timestamp' in pq.ParquetFile(path).schema_arrow.names
+    return 'timestamp' in pd.read_csv(path, nrows=0).columns
+
+
+def _estimate_rows(path, sample_bytes=1 << 20):
+    """Rough row count of a CSV file from the average length of its first lines."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    lines = max(sample.count(b'\n'), 1)
+    return int(size / (len(sample) / lines) * 1.05) + 1
+
+
+def read_ratings_csv(path, chunk_size=DEFAULT_CHUNK_SIZE, parquet_path=None, with_timestamps=False):
+    """
+    Stream a ratings CSV into RatingColumns, optionally writing the cleaned
+    chunks to parquet_path as they are read and keeping the timestamps.
+
+    Chunks are parsed straight into int32/float32 columns. A file with
+    missing or malformed values fails that fast path and is re-read with
+    per-value validation.
+    """
+    header = list(pd.read_csv(path, nrows=0).columns)
+    for col in RATING_COLUMNS:
+        if col not in header:
+            raise ValueError(f"Missing required column '{col}' in ratings.csv")
+    if with_timestamps and 'timestamp' not in header:
+        raise ValueError("Missing column 'timestamp' in ratings.csv")
+    usecols = RATING_COLUMNS + (['timestamp'] if 'timestamp' in header else [])
+
+    try:
+        return _read_ratings_csv(path, usecols, chunk_size, parquet_path, with_timestamps, strict=True)
+    except (ValueError, OverflowError) as e:
+        logger.warning(f"{path} has missing or malformed values ({e}); re-reading with per-value validation")
+        return _read_ratings_csv(path, usecols, chunk_size, parquet_path, with_timestamps, strict=False)
+
+
+def _read_ratings_csv(path, usecols, chunk_size, parquet_path, with_timestamps, strict):
+    dtype = {c: CSV_DTYPES[c] for c in usecols} if strict else {c: str for c in usecols}
+
+    columns = RatingColumns(_estimate_rows(path), with_timestamps)
+    writer = _ParquetRatingsWriter(parquet_path, 'timestamp' in usecols) if parquet_path else None
+    dropped = 0
+    try:
+        for chunk in pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunk_size):
+            users, movies, ratings, timestamps, chunk_dropped = _clean_chunk(chunk)
+            del chunk
+            columns.append(users, movies, ratings, timestamps)
+            if writer:
+                writer.write(users, movies, ratings, timestamps)
+            dropped += chunk_dropped
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+    if writer:
+        writer.close()
+
+    if dropped:
+        logger.info(f"Dropped {dropped} invalid or duplicate rows from {path}")
+    return columns
+
+
+def read_ratings_parquet(path, batch_size=DEFAULT_CHUNK_SIZE, with_timestamps=False):
+    """Stream the rating columns (and optionally timestamps) of a Parquet file into RatingColumns."""
+    parquet = pq.ParquetFile(path)
+    names = RATING_COLUMNS + (['timestamp'] if with_timestamps else [])
+    if with_timestamps and 'timestamp' not in parquet.schema_arrow.names:
+        raise ValueError(f"Missing column 'timestamp' in {path}")
+    columns = RatingColumns(parquet.metadata.num_rows, with_timestamps)
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=names):
+        users, movies, ratings, timestamps, _ = _clean_chunk(batch.to_pandas())
+        columns.append(users, movies, ratings, timestamps)
+    return columns
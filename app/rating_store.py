@@ -0,0 +1,241 @@
+import numpy as np
+from collections.abc import Mapping, Set
+
+
+class RatingStore:
+    """
+    Compact columnar rating storage.
+
+    Raw user and movie IDs are mapped to dense indices through sorted int32
+    arrays. Ratings are stored twice: user-major (CSR) for per-user lookups
+    and movie-major (CSC) for per-movie lookups, with float32 values.
+    """
+
+    def __init__(self, user_ids, movie_ids, user_indptr, user_movie_idx, user_values,
+                 movie_indptr, movie_user_idx, movie_values):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.user_indptr = user_indptr
+        self.user_movie_idx = user_movie_idx
+        self.user_values = user_values
+        self.movie_indptr = movie_indptr
+        self.movie_user_idx = movie_user_idx
+        self.movie_values = movie_values
+
+    @classmethod
+    def from_arrays(cls, user_ids, movie_ids, ratings, catalog_movie_ids=None):
+        """
+        Build a store from parallel rating arrays.
+
+        Duplicate (user, movie) pairs keep the last rating seen. Movies listed in
+        catalog_movie_ids get an index even if they have no ratings.
+        """
+        users = np.asarray(user_ids, dtype=np.int32)
+        movies = np.asarray(movie_ids, dtype=np.int32)
+        values = np.asarray(ratings, dtype=np.float32)
+
+        store_user_ids = np.unique(users)
+        store_movie_ids = np.unique(movies)
+        if catalog_movie_ids is not None:
+            store_movie_ids = np.union1d(store_movie_ids, np.asarray(catalog_movie_ids, dtype=np.int32))
+
+        user_idx = np.searchsorted(store_user_ids, users).astype(np.int32)
+        del users
+        movie_idx = np.searchsorted(store_movie_ids, movies).astype(np.int32)
+        del movies
+
+        # Sort by (user, movie) and keep the last occurrence of each pair. Input
+        # that is already sorted without duplicates (as MovieLens ships) is kept as is.
+        keys = user_idx.astype(np.int64) * len(store_movie_ids) + movie_idx
+        if not np.all(keys[1:] > keys[:-1]):
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            last = np.ones(len(keys), dtype=bool)
+            np.not_equal(keys[1:], keys[:-1], out=last[:-1])
+            keep = order[last]
+            del order, last
+            user_idx, movie_idx, values = user_idx[keep], movie_idx[keep], values[keep]
+            del keep
+        del keys
+
+        user_indptr = _indptr(user_idx, len(store_user_ids))
+
+        order = np.argsort(movie_idx, kind='stable')
+        movie_indptr = _indptr(movie_idx, len(store_movie_ids))
+
+        return cls(
+            store_user_ids, store_movie_ids,
+            user_indptr, movie_idx, values,
+            movie_indptr, user_idx[order], values[order],
+        )
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_movies(self):
+        return len(self.movie_ids)
+
+    @property
+    def n_ratings(self):
+        return len(self.user_values)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (
+            self.user_ids, self.movie_ids, self.user_indptr, self.user_movie_idx, self.user_values,
+            self.movie_indptr, self.movie_user_idx, self.movie_values,
+        ))
+
+    def user_index(self, user_id):
+        """Dense index for a raw user ID, or -1 if unknown."""
+        return _lookup(self.user_ids, user_id)
+
+    def movie_index(self, movie_id):
+        """Dense index for a raw movie ID, or -1 if unknown."""
+        return _lookup(self.movie_ids, movie_id)
+
+    def user_row(self, idx):
+        """(movie indices, ratings) for the user at dense index idx."""
+        start, end = self.user_indptr[idx], self.user_indptr[idx + 1]
+        return self.user_movie_idx[start:end], self.user_values[start:end]
+
+    def movie_column(self, idx):
+        """(user indices, ratings) for the movie at dense index idx."""
+        start, end = self.movie_indptr[idx], self.movie_indptr[idx + 1]
+        return self.movie_user_idx[start:end], self.movie_values[start:end]
+
+    def rating(self, user_id, movie_id):
+        """The stored rating for a (user, movie) pair, or None."""
+        user_idx, movie_idx = self.user_index(user_id), self.movie_index(movie_id)
+        if user_idx < 0 or movie_idx < 0:
+            return None
+        movies, values = self.user_row(user_idx)
+        pos = int(np.searchsorted(movies, movie_idx))
+        if pos < len(movies) and movies[pos] == movie_idx:
+            return float(values[pos])
+        return None
+
+    def to_arrays(self):
+        """(user IDs, movie IDs, ratings) for every stored rating, user-major."""
+        return (
+            np.repeat(self.user_ids, self.user_counts()),
+            self.movie_ids[self.user_movie_idx],
+            self.user_values,
+        )
+
+    def user_counts(self):
+        return np.diff(self.user_indptr)
+
+    def movie_counts(self):
+        return np.diff(self.movie_indptr)
+
+
+class RatingsView(Mapping):
+    """Read-only dict-of-dicts view over one orientation of a RatingStore."""
+
+    def __init__(self, keys, indptr, indices, values, other_keys):
+        self._keys = keys
+        self._indptr = indptr
+        self._indices = indices
+        self._values = values
+        self._other_keys = other_keys
+        self._nonempty = np.flatnonzero(np.diff(indptr) > 0)
+
+    def _row(self, key):
+        try:
+            idx = _lookup(self._keys, key)
+        except (TypeError, ValueError, OverflowError):
+            return -1
+        if idx < 0 or self._indptr[idx] == self._indptr[idx + 1]:
+            return -1
+        return idx
+
+    def __getitem__(self, key):
+        idx = self._row(key)
+        if idx < 0:
+            raise KeyError(key)
+        start, end = self._indptr[idx], self._indptr[idx + 1]
+        return dict(zip(
+            self._other_keys[self._indices[start:end]].tolist(),
+            self._values[start:end].tolist(),
+        ))
+
+    def __contains__(self, key):
+        return self._row(key) >= 0
+
+    def __iter__(self):
+        return iter(self._keys[self._nonempty].tolist())
+
+    def __len__(self):
+        return len(self._nonempty)
+
+
+class IdSet(Set):
+    """Read-only set view over a sorted ID array."""
+
+    def __init__(self, sorted_ids):
+        self._ids = sorted_ids
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return set(iterable)
+
+    def __contains__(self, value):
+        try:
+            return _lookup(self._ids, value) >= 0
+        except (TypeError, ValueError, OverflowError):
+            return False
+
+    def __iter__(self):
+        return iter(self._ids.tolist())
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def user_ratings_view(store):
+    """dict[userId, dict[movieId, rating]] view over a RatingStore."""
+    return RatingsView(store.user_ids, store.user_indptr, store.user_movie_idx,
+                       store.user_values, store.movie_ids)
+
+
+def movie_ratings_view(store):
+    """dict[movieId, dict[userId, rating]] view over a RatingStore."""
+    return RatingsView(store.movie_ids, store.movie_indptr, store.movie_user_idx,
+                       store.movie_values, store.user_ids)
+
+
+def history_order(store):
+    """
+    Positions of the user-major ratings ordered within each user by rating,
+    highest first, then movie ID.
+
+    order[user_indptr[u]:user_indptr[u + 1]] indexes user u's ratings in
+    user_movie_idx / user_values, so a user's history can be paged without
+    sorting it per request.
+    """
+    rows = np.repeat(np.arange(store.n_users, dtype=np.int64), store.user_counts())
+    # Rows are stored in movie order, so a stable sort keeps it for equal ratings
+    half_stars = np.rint(store.user_values * 2).astype(np.int64)
+    if np.array_equal(half_stars, store.user_values * 2):
+        # One packed integer key sorts about twice as fast as lexsort
+        order = np.argsort(rows * 16 + (10 - half_stars), kind='stable')
+    else:
+        order = np.lexsort((-store.user_values, rows))
+    return order.astype(np.int32 if store.n_ratings < 2**31 else np.int64)
+
+
+def _indptr(row_idx, n_rows):
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_idx, minlength=n_rows), out=indptr[1:])
+    return indptr
+
+
+def _lookup(sorted_ids, value):
+    value = int(value)
+    pos = int(np.searchsorted(sorted_ids, value))
+    if pos < len(sorted_ids) and sorted_ids[pos] == value:
+        return pos
+    return -1
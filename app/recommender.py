@@ -1,9 +1,57 @@
 import numpy as np
 from collections import defaultdict
+from scipy import sparse
 import logging
 
+from app.collaborative import UserCFModel, clear_neighbor_caches, neighbor_cache_stats
+from app.filters import filter_mask
+from app.metrics import REGISTRY, stage
+from app.result_cache import ResultCache
+from app.sharding import get_sharded_scorer
+
 logger = logging.getLogger(__name__)
 
+# Results of recommend_for_ratings, keyed on the canonical rating set
+_result_cache = ResultCache()
+# Lookups of materialized per-user recommendations
+_precomputed_lookups = {'hits': 0, 'misses': 0}
+
+def configure_cache(max_entries=None, max_bytes=None, ttl=None):
+    """Set the result cache's entry limit, memory bound (bytes) and TTL (seconds, 0 = none)."""
+    _result_cache.configure(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+def cache_stats():
+    """Hit/miss/eviction counters for the result cache."""
+    return _result_cache.stats()
+
+def _cache_metrics():
+    """Hit, miss and size figures of the result, neighbor and precomputed caches for /metrics."""
+    result = _result_cache.stats()
+    caches = {
+        'result': (result['hits'], result['misses'], result['entries']),
+        'neighbors': tuple(neighbor_cache_stats()[k] for k in ('hits', 'misses', 'entries')),
+        'precomputed': (_precomputed_lookups['hits'], _precomputed_lookups['misses'], None),
+    }
+    ratios = []
+    for name, (hits, misses, _) in caches.items():
+        if hits + misses:
+            ratios.append(({'cache': name}, hits / (hits + misses)))
+    return [
+        ('recommender_cache_hits_total', 'counter', 'Cache hits by cache.',
+         [({'cache': name}, hits) for name, (hits, _, _) in caches.items()]),
+        ('recommender_cache_misses_total', 'counter', 'Cache misses by cache.',
+         [({'cache': name}, misses) for name, (_, misses, _) in caches.items()]),
+        ('recommender_cache_hit_ratio', 'gauge', 'Hits over lookups since start, by cache.', ratios),
+        ('recommender_cache_entries', 'gauge', 'Entries held by each in-memory cache.',
+         [({'cache': name}, entries) for name, (_, _, entries) in caches.items() if entries is not None]),
+        ('recommender_result_cache_bytes', 'gauge', 'Approximate memory held by the result cache.',
+         [({}, result['bytes'])]),
+        ('recommender_result_cache_evictions_total', 'counter', 'Result cache entries evicted for space.',
+         [({}, result['evictions'])]),
+    ]
+
+REGISTRY.register_collector(_cache_metrics)
+
 def parse_genres(genres_str):
     """Parse genres string into a set of genres."""
     if not genres_str or genres_str == '' or str(genres_str).lower() == 'nan':
@@ -75,75 +123,663 @@ def cosine_similarity(vec1, vec2):
     
     return dot_product / (norm1 * norm2)
 
-def get_recommendations_from_ratings(custom_ratings, data_bundle, n_recs=5):
-    """Get recommendations using content-based filtering from custom ratings."""
-    movie_metadata = data_bundle['movie_metadata']
-    movie_ids = data_bundle['movie_ids']
+def build_genre_index(movie_metadata, movie_ids):
+    """Build the genre vocabulary, movie x genre matrix and row norms once at load time."""
+    ids = np.array(sorted(int(m) for m in movie_ids), dtype=np.int64)
+    parsed = [parse_genres(movie_metadata.get(int(m), {}).get('genres', '')) for m in ids]
+    genres = sorted(set().union(*parsed)) if parsed else []
+    genre_to_col = {genre: i for i, genre in enumerate(genres)}
     
-    if not custom_ratings or len(custom_ratings) == 0:
-        logger.warning("No custom ratings provided")
-        return []
+    matrix = np.zeros((len(ids), len(genres)), dtype=np.float32)
+    rows = [i for i, movie_genres in enumerate(parsed) for _ in movie_genres]
+    cols = [genre_to_col[g] for movie_genres in parsed for g in movie_genres]
+    matrix[rows, cols] = 1.0
     
-    user_profile = build_user_genre_profile(custom_ratings, data_bundle)
+    return {
+        'genres': genres,
+        'genre_to_col': genre_to_col,
+        'movie_ids': ids,
+        'matrix': matrix,
+        'norms': np.linalg.norm(matrix, axis=1),
+    }
+
+def get_genre_index(data_bundle):
+    """Return the bundle's genre index, building it on first use if the loader did not."""
+    index = data_bundle.get('genre_index')
+    if index is None:
+        index = build_genre_index(data_bundle['movie_metadata'], data_bundle['movie_ids'])
+        data_bundle['genre_index'] = index
+    return index
+
+def movie_positions(index, movie_ids):
+    """Map movie IDs to row positions in the genre index, dropping unknown IDs."""
+    ids = index['movie_ids']
+    wanted = np.fromiter((int(m) for m in movie_ids), dtype=np.int64)
+    pos = np.searchsorted(ids, wanted)
+    found = pos < len(ids)
+    found[found] = ids[pos[found]] == wanted[found]
+    return pos[found]
+
+def top_k_indices(scores, k, ids):
+    """
+    Indices of the k highest positive scores, best first, ties broken by ID.
+    
+    Scores are compared at 6 decimals so mathematically equal scores computed
+    through different float paths (single vs batch) tie consistently.
+    """
+    scores = np.round(scores, 6)
+    candidates = np.flatnonzero(scores > 0)
+    if k <= 0:
+        return candidates[:0]
+    if len(candidates) > k:
+        # Keep everything tied with the k-th score so the ID tie-break is exact
+        kth = -np.partition(-scores[candidates], k - 1)[k - 1]
+        candidates = candidates[scores[candidates] >= kth]
+    order = np.lexsort((ids[candidates], -scores[candidates]))
+    return candidates[order[:k]]
+
+def format_recommendation(movie_id, predicted_rating, movie_metadata):
+    """Build the JSON-ready recommendation entry for one movie."""
+    movie_id = int(movie_id)
+    movie_info = movie_metadata.get(movie_id, {
+        'title': f'Movie {movie_id}',
+        'genres': ''
+    })
+    return {
+        'movieId': movie_id,
+        'title': movie_info['title'],
+        'genres': movie_info['genres'],
+        'predictedRating': round(float(predicted_rating), 2)
+    }
+
+def _genre_profile(custom_ratings, data_bundle):
+    """
+    (genre index, user genre vector, its norm) for custom_ratings, or None
+    without genre information.
+    """
+    with stage('genre', 'profile'):
+        user_profile = build_user_genre_profile(custom_ratings, data_bundle)
+        index = get_genre_index(data_bundle)
+        all_genres = index['genres']
+        if user_profile and all_genres:
+            user_vector = get_user_genre_vector(user_profile, all_genres).astype(np.float32)
     
     if not user_profile:
         logger.warning("No genre information in rated movies")
-        return []
-    
-    all_genres = set()
-    for movie_id in movie_ids:
-        movie_info = movie_metadata.get(movie_id, {})
-        genres = parse_genres(movie_info.get('genres', ''))
-        all_genres.update(genres)
-    
-    all_genres = sorted(list(all_genres))
+        return None
     
     if not all_genres:
         logger.warning("No genre information available")
+        return None
+    
+    user_norm = np.linalg.norm(user_vector)
+    if user_norm == 0:
+        return None
+    return index, user_vector, user_norm
+
+def _genre_similarities(custom_ratings, data_bundle):
+    """
+    Cosine similarity of every genre-indexed movie to the genre profile of
+    custom_ratings, as (genre index, similarities), or None without genre information.
+    """
+    profile = _genre_profile(custom_ratings, data_bundle)
+    if profile is None:
+        return None
+    index, user_vector, user_norm = profile
+    
+    # One matrix-vector product scores the whole catalog
+    with stage('genre', 'scoring'):
+        norms = index['norms'] * user_norm
+        similarities = np.divide(
+            index['matrix'] @ user_vector, norms,
+            out=np.zeros(len(norms), dtype=np.float32), where=norms > 0
+        )
+    return index, similarities
+
+def _genre_predicted_rating(similarity, target_mean):
+    """Predicted rating: the user's mean moved towards 5 by the genre similarity."""
+    return np.clip(target_mean + similarity * (5.0 - target_mean), 0.0, 5.0)
+
+def get_recommendations_from_ratings(custom_ratings, data_bundle, n_recs=5, mask=None):
+    """
+    Get recommendations using content-based filtering from custom ratings.
+    
+    mask (boolean, over RatingStore.movie_ids) limits the movies considered.
+    """
+    movie_metadata = data_bundle['movie_metadata']
+    
+    if not custom_ratings or len(custom_ratings) == 0:
+        logger.warning("No custom ratings provided")
         return []
     
-    user_vector = get_user_genre_vector(user_profile, all_genres)
     target_mean = np.mean(list(custom_ratings.values()))
+    top = None
+    scorer = get_sharded_scorer()
+    index = get_genre_index(data_bundle)
+    if scorer is not None and scorer.applies(len(index['movie_ids'])):
+        profile = _genre_profile(custom_ratings, data_bundle)
+        if profile is None:
+            return []
+        index, user_vector, user_norm = profile
+        # Shards are scored and cut to n_recs in the worker processes
+        with stage('genre', 'sharded'):
+            sharded = scorer.top_k(
+                index, user_vector, user_norm, n_recs, movie_positions(index, custom_ratings.keys()), mask,
+            )
+        if sharded is not None:
+            top, top_similarities = sharded
     
-    recommendations = []
-    for movie_id in movie_ids:
-        if movie_id in custom_ratings:
-            continue
+    if top is None:
+        scored = _genre_similarities(custom_ratings, data_bundle)
+        if scored is None:
+            return []
+        index, similarities = scored
+        similarities[movie_positions(index, custom_ratings.keys())] = 0.0
+        if mask is not None:
+            # The genre index rows are the store's movies, in the same order
+            similarities[~mask] = 0.0
         
-        movie_vector = get_movie_genre_vector(movie_id, all_genres, data_bundle)
-        genre_similarity = cosine_similarity(user_vector, movie_vector)
-        
-        if genre_similarity == 0:
-            continue
+        with stage('genre', 'top_k'):
+            top = top_k_indices(similarities, n_recs, index['movie_ids'])
+        top_similarities = similarities[top]
+    
+    with stage('genre', 'serialization'):
+        recommendations = []
+        for pos, similarity in zip(top, top_similarities):
+            predicted_rating = float(_genre_predicted_rating(float(similarity), target_mean))
+            recommendations.append(format_recommendation(index['movie_ids'][pos], predicted_rating, movie_metadata))
+    
+    return recommendations
+
+def predict_from_ratings(custom_ratings, data_bundle, movie_ids):
+    """
+    Content-based predicted ratings of movie_ids, on the scale of
+    get_recommendations_from_ratings; movies sharing no genre with the
+    ratings (or unknown) get the ratings' mean.
+    """
+    target_mean = float(np.mean(list(custom_ratings.values()))) if custom_ratings else 0.0
+    predictions = np.full(len(movie_ids), target_mean, dtype=np.float32)
+    scored = _genre_similarities(custom_ratings, data_bundle) if custom_ratings else None
+    if scored is None:
+        return predictions
+    index, similarities = scored
+    ids = index['movie_ids']
+    wanted = np.asarray(movie_ids, dtype=np.int64)
+    pos = np.searchsorted(ids, wanted)
+    found = pos < len(ids)
+    found[found] = ids[pos[found]] == wanted[found]
+    predictions[found] = _genre_predicted_rating(similarities[pos[found]], target_mean)
+    return predictions
+
+def _rating_set_coordinates(rating_sets, sorted_ids):
+    """Flatten rating sets into (set row, catalog position, rating) arrays, dropping unknown movies."""
+    rows = np.repeat(np.arange(len(rating_sets)), [len(r) for r in rating_sets])
+    movie_ids = np.fromiter((int(m) for r in rating_sets for m in r), dtype=np.int64, count=len(rows))
+    ratings = np.fromiter((float(v) for r in rating_sets for v in r.values()), dtype=np.float32, count=len(rows))
+    pos = np.searchsorted(sorted_ids, movie_ids)
+    found = pos < len(sorted_ids)
+    found[found] = sorted_ids[pos[found]] == movie_ids[found]
+    return rows[found], pos[found], ratings[found]
+
+def get_recommendations_from_ratings_batch(rating_sets, data_bundle, n_recs=5, max_block_bytes=128 * 2**20):
+    """
+    Content-based recommendations for many rating sets at once.
+    
+    Genre profiles for a block of sets come from two sparse x dense products and
+    the whole catalog is scored against all of them in one matrix-matrix
+    product. Results match get_recommendations_from_ratings.
+    """
+    results = [[] for _ in rating_sets]
+    index = get_genre_index(data_bundle)
+    if not rating_sets or not index['genres']:
+        return results
+    
+    movie_metadata = data_bundle['movie_metadata']
+    matrix = index['matrix']
+    n_movies = len(index['movie_ids'])
+    block_size = max(1, int(max_block_bytes // (8 * max(n_movies, 1))))
+    
+    for start in range(0, len(rating_sets), block_size):
+        block = rating_sets[start:start + block_size]
+        with stage('genre_batch', 'profile'):
+            rows, cols, ratings = _rating_set_coordinates(block, index['movie_ids'])
+            shape = (len(block), n_movies)
+            weighted = sparse.csr_matrix((ratings.astype(np.float64), (rows, cols)), shape=shape)
+            present = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=shape)
+            
+            sums = np.asarray(weighted @ matrix.astype(np.float64))
+            counts = np.asarray(present @ matrix.astype(np.float64))
+            profiles = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0).astype(np.float32)
+            profile_norms = np.linalg.norm(profiles, axis=1)
         
-        predicted_rating = target_mean + (genre_similarity * (5.0 - target_mean))
-        predicted_rating = max(0.0, min(5.0, predicted_rating))
+        with stage('genre_batch', 'scoring'):
+            norms = index['norms'][:, None] * profile_norms[None, :]
+            similarities = np.divide(matrix @ profiles.T, norms, out=np.zeros(norms.shape, dtype=np.float32), where=norms > 0)
+            similarities[cols, rows] = 0.0
         
-        movie_info = movie_metadata.get(movie_id, {
-            'title': f'Movie {movie_id}',
-            'genres': ''
-        })
+        with stage('genre_batch', 'top_k'):
+            tops = [
+                top_k_indices(similarities[:, row], n_recs, index['movie_ids'])
+                if custom_ratings and profile_norms[row] > 0 else ()
+                for row, custom_ratings in enumerate(block)
+            ]
         
-        recommendations.append({
-            'movieId': int(movie_id),
+        with stage('genre_batch', 'serialization'):
+            for row, (custom_ratings, top) in enumerate(zip(block, tops)):
+                if len(top) == 0:
+                    continue
+                target_mean = np.mean(list(custom_ratings.values()))
+                column = similarities[:, row]
+                recommendations = results[start + row]
+                for pos in top:
+                    predicted_rating = target_mean + (float(column[pos]) * (5.0 - target_mean))
+                    predicted_rating = max(0.0, min(5.0, predicted_rating))
+                    recommendations.append(format_recommendation(index['movie_ids'][pos], predicted_rating, movie_metadata))
+    
+    return results
+
+def get_item_based_recommendations(custom_ratings, data_bundle, n_recs=5, mask=None):
+    """Get recommendations by merging the precomputed neighbor lists of the rated movies."""
+    index = data_bundle.get('item_index')
+    if index is None or not custom_ratings:
+        return []
+    
+    store = data_bundle['rating_store']
+    with stage('item', 'profile'):
+        rated_idx, ratings = [], []
+        for movie_id, rating in custom_ratings.items():
+            idx = store.movie_index(movie_id)
+            if idx >= 0:
+                rated_idx.append(idx)
+                ratings.append(rating)
+    if not rated_idx:
+        return []
+    
+    with stage('item', 'scoring'):
+        movies, predictions, weights = index.predict(rated_idx, ratings)
+        if mask is not None:
+            keep = mask[movies]
+            movies, predictions, weights = movies[keep], predictions[keep], weights[keep]
+    with stage('item', 'top_k'):
+        order = np.lexsort((store.movie_ids[movies], -weights, -predictions))[:n_recs]
+    with stage('item', 'serialization'):
+        movie_metadata = data_bundle['movie_metadata']
+        return [
+            format_recommendation(store.movie_ids[movies[i]], predictions[i], movie_metadata)
+            for i in order
+        ]
+
+def get_factor_based_recommendations(custom_ratings, data_bundle, n_recs=5, mask=None):
+    """Get recommendations by folding the ratings into the matrix factorization model."""
+    factors = data_bundle.get('factors')
+    if factors is None or not custom_ratings:
+        return []
+    with stage('als', 'profile'):
+        profile = factors.fold_in(list(custom_ratings.keys()), list(custom_ratings.values()))
+    if profile is None:
+        return []
+    return _factor_recommendations(profile, list(custom_ratings.keys()), data_bundle, n_recs, 'als', mask)
+
+def _factor_recommendations(profile, rated_movie_ids, data_bundle, n_recs, path, mask=None):
+    """
+    Score the catalog for one (factors, bias) profile and format the top
+    n_recs unrated movies. With a mask only the movies it passes are scored.
+    """
+    factors = data_bundle['factors']
+    with stage(path, 'scoring'):
+        rated = factors.movie_positions(rated_movie_ids)[0]
+        allowed = None
+        if mask is not None:
+            allowed = factors.movie_positions(data_bundle['rating_store'].movie_ids[mask])[0]
+        positions, scores = factors.score_candidates(*profile, n_recs + len(rated), allowed)
+        scores[np.isin(positions, rated)] = -np.inf
+    with stage(path, 'top_k'):
+        top = top_k_indices(scores, n_recs, factors.movie_ids[positions])
+    with stage(path, 'serialization'):
+        movie_metadata = data_bundle['movie_metadata']
+        return [
+            format_recommendation(factors.movie_ids[positions[i]], np.clip(scores[i], 0.5, 5.0), movie_metadata)
+            for i in top
+        ]
+
+def _factor_recommendations_batch(profiles, rated_movie_ids, data_bundle, n_recs, path,
+                                  max_block_bytes=128 * 2**20):
+    """
+    _factor_recommendations for many profiles, scoring each block of them with
+    one matrix-matrix product (or one ANN search each, when the model has an
+    index). Entries whose profile is None come back as None.
+    """
+    factors = data_bundle['factors']
+    if factors.ann is not None:
+        return [
+            _factor_recommendations(profile, rated, data_bundle, n_recs, path) if profile is not None else None
+            for profile, rated in zip(profiles, rated_movie_ids)
+        ]
+    movie_metadata = data_bundle['movie_metadata']
+    results = [None] * len(profiles)
+    rows = [i for i, profile in enumerate(profiles) if profile is not None]
+    block_size = max(1, int(max_block_bytes // (4 * max(len(factors.movie_ids), 1))))
+    
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        with stage(path, 'scoring'):
+            scores = factors.scores_batch([profiles[i][0] for i in block], [profiles[i][1] for i in block])
+            for col, i in enumerate(block):
+                scores[factors.movie_positions(rated_movie_ids[i])[0], col] = -np.inf
+        with stage(path, 'top_k'):
+            tops = [top_k_indices(scores[:, col], n_recs, factors.movie_ids) for col in range(len(block))]
+        with stage(path, 'serialization'):
+            for col, (i, top) in enumerate(zip(block, tops)):
+                results[i] = [
+                    format_recommendation(factors.movie_ids[pos], np.clip(scores[pos, col], 0.5, 5.0), movie_metadata)
+                    for pos in top
+                ]
+    return results
+
+def recommend_for_ratings(custom_ratings, data_bundle, n_recs=5, use_cache=True, movie_filter=None):
+    """
+    Recommend for ad-hoc ratings.
+    
+    Folds the ratings into the matrix factorization model when one is loaded,
+    otherwise uses the item-item neighbor index, padding with genre matches
+    when either yields fewer than n_recs movies. Only movies passing
+    movie_filter (a filters.MovieFilter) are scored. Results are cached per
+    (movieId, rating) set, n_recs and filter for the current data version.
+    """
+    if not use_cache:
+        return _recommend_for_ratings(custom_ratings, data_bundle, n_recs, movie_filter)
+    
+    version = data_bundle.get('version')
+    _result_cache.bind(version)
+    key = _cache_key(custom_ratings, n_recs, movie_filter)
+    recommendations = _result_cache.get(key, version)
+    if recommendations is None:
+        recommendations = _recommend_for_ratings(custom_ratings, data_bundle, n_recs, movie_filter)
+        _result_cache.put(key, recommendations, version)
+    return list(recommendations)
+
+def _cache_key(custom_ratings, n_recs, movie_filter=None):
+    key = tuple(sorted((int(m), float(r)) for m, r in custom_ratings.items())), n_recs
+    return key if movie_filter is None else key + (movie_filter,)
+
+def _recommend_for_ratings(custom_ratings, data_bundle, n_recs, movie_filter=None):
+    mask = filter_mask(data_bundle, movie_filter)
+    if data_bundle.get('factors') is not None:
+        recommendations = get_factor_based_recommendations(custom_ratings, data_bundle, n_recs, mask)
+    else:
+        recommendations = get_item_based_recommendations(custom_ratings, data_bundle, n_recs, mask)
+    if len(recommendations) < n_recs:
+        seen = {r['movieId'] for r in recommendations}
+        for rec in get_recommendations_from_ratings(custom_ratings, data_bundle, n_recs + len(seen), mask):
+            if rec['movieId'] not in seen:
+                recommendations.append(rec)
+                if len(recommendations) >= n_recs:
+                    break
+    return recommendations
+
+def recommend_for_ratings_batch(rating_sets, data_bundle, n_recs=5, use_cache=True):
+    """recommend_for_ratings for many rating sets, scoring cache misses together."""
+    results = [None] * len(rating_sets)
+    version = data_bundle.get('version')
+    if use_cache:
+        _result_cache.bind(version)
+        for i, custom_ratings in enumerate(rating_sets):
+            cached = _result_cache.get(_cache_key(custom_ratings, n_recs), version)
+            if cached is not None:
+                results[i] = list(cached)
+    
+    missing = [i for i, r in enumerate(results) if r is None]
+    computed = _recommend_for_ratings_batch([rating_sets[i] for i in missing], data_bundle, n_recs)
+    for i, recommendations in zip(missing, computed):
+        results[i] = recommendations
+        if use_cache:
+            _result_cache.put(_cache_key(rating_sets[i], n_recs), list(recommendations), version)
+    return results
+
+def _recommend_for_ratings_batch(rating_sets, data_bundle, n_recs):
+    results = [[] for _ in rating_sets]
+    index = data_bundle.get('item_index')
+    factors = data_bundle.get('factors')
+    if rating_sets and factors is not None:
+        with stage('als_batch', 'profile'):
+            profiles = [factors.fold_in(list(r.keys()), list(r.values())) for r in rating_sets]
+        scored = _factor_recommendations_batch(
+            profiles, [list(r.keys()) for r in rating_sets], data_bundle, n_recs, 'als_batch'
+        )
+        results = [recommendations or [] for recommendations in scored]
+    elif rating_sets and index is not None:
+        store = data_bundle['rating_store']
+        movie_metadata = data_bundle['movie_metadata']
+        rows, cols, ratings = _rating_set_coordinates(rating_sets, store.movie_ids)
+        if len(rows):
+            with stage('item_batch', 'scoring'):
+                denominator, numerator = index.predict_batch(rows, cols, ratings)
+            with stage('item_batch', 'top_k'):
+                ranked = []
+                for row in range(denominator.shape[0]):
+                    start, end = denominator.indptr[row], denominator.indptr[row + 1]
+                    weights = denominator.data[start:end]
+                    keep = weights > 0
+                    movies, weights = denominator.indices[start:end][keep], weights[keep]
+                    predictions = np.clip(numerator[start:end][keep] / weights, 0.5, 5.0)
+                    order = np.lexsort((movies, -weights, -predictions))[:n_recs]
+                    ranked.append((movies[order], predictions[order]))
+            with stage('item_batch', 'serialization'):
+                for row, (movies, predictions) in enumerate(ranked):
+                    results[row] = [
+                        format_recommendation(store.movie_ids[m], p, movie_metadata)
+                        for m, p in zip(movies, predictions)
+                    ]
+    
+    short = [i for i, r in enumerate(results) if len(r) < n_recs]
+    padding = get_recommendations_from_ratings_batch([rating_sets[i] for i in short], data_bundle, 2 * n_recs)
+    for i, extra in zip(short, padding):
+        seen = {r['movieId'] for r in results[i]}
+        for rec in extra:
+            if len(results[i]) >= n_recs:
+                break
+            if rec['movieId'] not in seen:
+                results[i].append(rec)
+    return results
+
+def get_similar_movies(movie_id, data_bundle, limit=10):
+    """Get the most similar movies from the item-item neighbor index."""
+    index = data_bundle.get('item_index')
+    store = data_bundle['rating_store']
+    idx = store.movie_index(movie_id)
+    if index is None or idx < 0:
+        return []
+    
+    movie_metadata = data_bundle['movie_metadata']
+    similar = []
+    for neighbor, similarity in zip(*index.similar(idx, limit)):
+        neighbor_id = int(store.movie_ids[neighbor])
+        movie_info = movie_metadata.get(neighbor_id, {'title': f'Movie {neighbor_id}', 'genres': ''})
+        similar.append({
+            'movieId': neighbor_id,
             'title': movie_info['title'],
             'genres': movie_info['genres'],
-            'predictedRating': round(float(predicted_rating), 2)
+            'similarity': round(float(similarity), 4)
         })
-    
-    recommendations.sort(key=lambda x: x['predictedRating'], reverse=True)
-    return recommendations[:n_recs]
+    return similar
+
+def get_user_cf_model(data_bundle):
+    """Return the bundle's user-user CF model, building it on first use."""
+    model = data_bundle.get('user_cf')
+    if model is None:
+        model = UserCFModel(data_bundle['rating_store'])
+        data_bundle['user_cf'] = model
+    return model
+
+def _precomputed_recommendations(user_id, data_bundle, n_recs):
+    precomputed = data_bundle.get('precomputed_recs')
+    if precomputed is None:
+        return None
+    rows = precomputed.get(user_id, n_recs)
+    _precomputed_lookups['misses' if rows is None else 'hits'] += 1
+    if rows is None:
+        return None
+    movie_metadata = data_bundle['movie_metadata']
+    return [format_recommendation(m, p, movie_metadata) for m, p in zip(*rows)]
 
-def get_recommendations(target_user_id, data_bundle, k_neighbors=30, min_overlap=5, n_recs=5):
-    """Get recommendations for existing user (for backward compatibility)."""
-    user_ratings = data_bundle['user_ratings']
-    target_ratings = user_ratings.get(target_user_id, {})
+def get_recommendations(target_user_id, data_bundle, k_neighbors=30, min_overlap=5, n_recs=5,
+                        use_cache=True, use_precomputed=True, movie_filter=None):
+    """
+    Get recommendations for an existing user with user-user collaborative filtering.
     
-    if not target_ratings:
+    Finds the k most similar users sharing at least min_overlap rated movies and
+    predicts the user's mean plus the similarity-weighted neighbor deviations.
+    Falls back to genre matching when no usable neighborhood exists. When a
+    matrix factorization model is loaded, the user's factors (folded in from
+    their ratings if the model has not seen them) score the catalog instead.
+    Rows materialized by build_recommendations.py are served when present.
+    
+    Ratings ingested since the last compaction are merged into the user's
+    profile: folded into their factors, or into their centered row for
+    user-user CF. Users known only from such ratings get item-based
+    recommendations.
+    
+    With a movie_filter, only the movies passing it are scored (and
+    precomputed rows, ranked over the whole catalog, are not used).
+    """
+    store = data_bundle['rating_store']
+    user_idx = store.user_index(target_user_id)
+    delta = data_bundle.get('delta')
+    pending = delta.user_row(target_user_id) if delta is not None else {}
+    if user_idx < 0:
+        if pending:
+            return recommend_for_ratings(pending, data_bundle, n_recs, use_cache=False, movie_filter=movie_filter)
         return []
     
-    return get_recommendations_from_ratings(target_ratings, data_bundle, n_recs)
+    mask = filter_mask(data_bundle, movie_filter)
+    if use_precomputed and mask is None and not pending:
+        recommendations = _precomputed_recommendations(target_user_id, data_bundle, n_recs)
+        if recommendations is not None:
+            return recommendations
+    
+    return _user_recommendations(
+        target_user_id, user_idx, data_bundle, k_neighbors, min_overlap, n_recs, use_cache, mask, pending
+    )
+
+def _user_factor_profile(factors, store, user_id, user_idx, pending=None):
+    """
+    A user's (factors, bias) and rated movie IDs, folding the user in if the
+    model has not seen them or has pending {movieId: rating} ratings.
+    """
+    movies, ratings = store.user_row(user_idx)
+    rated_movie_ids = store.movie_ids[movies]
+    if pending:
+        merged = dict(zip(rated_movie_ids.tolist(), ratings.tolist()))
+        merged.update(pending)
+        rated_movie_ids = np.fromiter(merged.keys(), dtype=np.int64, count=len(merged))
+        return factors.fold_in(rated_movie_ids, list(merged.values())), rated_movie_ids
+    profile = factors.user_vector(user_id)
+    if profile is None:
+        profile = factors.fold_in(rated_movie_ids, ratings)
+    return profile, rated_movie_ids
+
+def _user_recommendations(user_id, user_idx, data_bundle, k_neighbors, min_overlap, n_recs, use_cache,
+                          mask=None, pending=None):
+    store = data_bundle['rating_store']
+    factors = data_bundle.get('factors')
+    if factors is not None:
+        with stage('als', 'profile'):
+            profile, rated_movie_ids = _user_factor_profile(factors, store, user_id, user_idx, pending)
+        if profile is not None:
+            return _factor_recommendations(profile, rated_movie_ids, data_bundle, n_recs, 'als', mask)
+    
+    model = get_user_cf_model(data_bundle)
+    pending_idx = None
+    if pending:
+        pending_idx = {store.movie_index(m): r for m, r in pending.items()}
+        pending_idx.pop(-1, None)
+    with stage('user_cf', 'neighbors'):
+        neighbor_idx, similarities = model.neighbors(
+            user_idx, max(k_neighbors, 1), min_overlap, use_cache, pending_idx
+        )
+    
+    if len(neighbor_idx) > 0:
+        with stage('user_cf', 'scoring'):
+            movies, predictions, support = model.predict(user_idx, neighbor_idx, similarities, pending=pending_idx)
+            if mask is not None:
+                keep = mask[movies]
+                movies, predictions, support = movies[keep], predictions[keep], support[keep]
+        with stage('user_cf', 'top_k'):
+            order = np.lexsort((store.movie_ids[movies], -support, -predictions))[:n_recs]
+        if len(order) > 0:
+            with stage('user_cf', 'serialization'):
+                movie_metadata = data_bundle['movie_metadata']
+                return [
+                    format_recommendation(store.movie_ids[movies[i]], predictions[i], movie_metadata)
+                    for i in order
+                ]
+    
+    logger.info(f"No neighborhood for user {user_id}, falling back to genre matching")
+    target_ratings = data_bundle['user_ratings'].get(user_id, {})
+    return get_recommendations_from_ratings(target_ratings, data_bundle, n_recs, mask)
+
+def get_recommendations_batch(user_ids, data_bundle, k_neighbors=30, min_overlap=5, n_recs=5, use_precomputed=True):
+    """
+    get_recommendations for many users, scored with matrix-matrix products.
+    
+    Returns a dict of userId -> recommendations; unknown users are left out.
+    """
+    store = data_bundle['rating_store']
+    delta = data_bundle.get('delta')
+    results = {}
+    pending = []
+    for user_id in user_ids:
+        user_id = int(user_id)
+        if user_id in results:
+            continue
+        if delta is not None and delta.user_row(user_id):
+            results[user_id] = get_recommendations(
+                user_id, data_bundle, k_neighbors, min_overlap, n_recs, use_precomputed=use_precomputed
+            )
+            continue
+        if store.user_index(user_id) < 0:
+            continue
+        recommendations = _precomputed_recommendations(user_id, data_bundle, n_recs) if use_precomputed else None
+        if recommendations is not None:
+            results[user_id] = recommendations
+        else:
+            pending.append(user_id)
+    
+    factors = data_bundle.get('factors')
+    if pending and factors is not None:
+        with stage('als_batch', 'profile'):
+            profiles, rated_movie_ids = zip(*(
+                _user_factor_profile(factors, store, u, store.user_index(u)) for u in pending
+            ))
+        scored = _factor_recommendations_batch(profiles, rated_movie_ids, data_bundle, n_recs, 'als_batch')
+        results.update((u, recs) for u, recs in zip(pending, scored) if recs is not None)
+        pending = [u for u, recs in zip(pending, scored) if recs is None]
+    
+    if pending:
+        model = get_user_cf_model(data_bundle)
+        movie_metadata = data_bundle['movie_metadata']
+        with stage('user_cf_batch', 'scoring'):
+            scored = model.recommend_batch(
+                [store.user_index(u) for u in pending], max(k_neighbors, 1), min_overlap, n_recs
+            )
+        fallback = []
+        with stage('user_cf_batch', 'serialization'):
+            for user_id, (movies, predictions) in zip(pending, scored):
+                if len(movies) > 0:
+                    results[user_id] = [
+                        format_recommendation(store.movie_ids[m], p, movie_metadata)
+                        for m, p in zip(movies, predictions)
+                    ]
+                else:
+                    fallback.append(user_id)
+        
+        user_ratings = data_bundle['user_ratings']
+        genre_based = get_recommendations_from_ratings_batch([user_ratings[u] for u in fallback], data_bundle, n_recs)
+        results.update(zip(fallback, genre_based))
+    
+    return results
 
 def clear_cache():
-    """Clear cache (kept for API compatibility)."""
-    pass
+    """Clear cached recommendation results and user neighborhoods."""
+    _result_cache.clear()
+    clear_neighbor_caches()
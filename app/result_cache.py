@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+ENTRY_OVERHEAD_BYTES = 256  # Rough per-entry cost of the key, tuple and dict slot
+RETIRED_GRACE_SECONDS = 300  # How long requests may still arrive from a replaced bundle
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with an entry limit, an approximate memory bound and
+    an optional TTL.
+
+    Entries are stored per data version, and the cache is bound to the
+    newest one: binding a new version drops every entry, and a put for
+    any other version is ignored, so a result computed on an old bundle is
+    never served from the new one. While a bundle swap is in progress,
+    requests still running on the replaced bundle bind its version again;
+    a version retired less than RETIRED_GRACE_SECONDS ago does not take
+    the binding back.
+    """
+
+    def __init__(self, max_entries=4096, max_bytes=32 * 2**20, ttl=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._version = None
+        self._retired = OrderedDict()  # version -> when it was replaced
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def configure(self, max_entries=None, max_bytes=None, ttl=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict()
+
+    def bind(self, version):
+        """Make version the current one, dropping all entries, unless it is current or recently replaced."""
+        with self._lock:
+            if version == self._version:
+                return
+            now = time.monotonic()
+            while self._retired and next(iter(self._retired.values())) < now - RETIRED_GRACE_SECONDS:
+                self._retired.popitem(last=False)
+            if version in self._retired:
+                return
+            if self._version is not None:
+                self._retired[self._version] = now
+            self._retired.pop(version, None)
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key, version=None):
+        """Return the value cached for key at this data version, or None on a miss."""
+        key = (version, key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version=None, size=None):
+        """
+        Cache a value computed at a data version; ignored unless that version
+        is the bound one. Pass `size` in bytes for values that are not JSON-like.
+        """
+        size = estimate_size(value) if size is None else size + ENTRY_OVERHEAD_BYTES
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        key = (version, key)
+        with self._lock:
+            if version != self._version:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxEntries': self.max_entries,
+                'maxBytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+def estimate_size(value):
+    """Approximate memory cost of a JSON-like value."""
+    return len(json.dumps(value, separators=(',', ':'), default=str)) + ENTRY_OVERHEAD_BYTES
@@ -1,29 +1,166 @@
-from flask import render_template, jsonify, request
-from app.recommender import get_recommendations
+from flask import Response, render_template, jsonify, request
+from functools import partial
+import hmac
+from app import metrics
+from app.serving import Overloaded, offload
+from app.filters import filter_mask, parse_filter
+from app.ingest import parse_rating
+from app.movie_stats import RANKING_MODES
+from app.pagination import (
+    NDJSON_CHUNK_LINES, InvalidCursor, history_cursor, history_start, json_line, ndjson_chunks,
+    user_history, user_page,
+)
+from app.recommender import (
+    cache_stats, configure_cache, get_recommendations,
+    get_recommendations_batch, get_similar_movies, recommend_for_ratings, recommend_for_ratings_batch,
+)
+from app.trending import DAY_SECONDS, trending
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+MAX_CUSTOM_RATINGS = 5
+MAX_INGEST_RATINGS = 1000
+
+
+def parse_custom_ratings(ratings, movie_ids):
+    """
+    Validate a list of {movieId, rating} objects.
+    
+    Returns (custom_ratings, None) on success, or (None, (error, status)).
+    """
+    if not isinstance(ratings, list) or len(ratings) == 0:
+        return None, ('ratings must be a non-empty array', 400)
+    
+    if len(ratings) > MAX_CUSTOM_RATINGS:
+        return None, (f'Maximum {MAX_CUSTOM_RATINGS} ratings allowed', 400)
+    
+    custom_ratings = {}
+    for item in ratings:
+        if not isinstance(item, dict) or 'movieId' not in item or 'rating' not in item:
+            return None, ('Each rating must have movieId and rating', 400)
+        
+        movie_id = int(item['movieId'])
+        rating = float(item['rating'])
+        
+        if rating < 0 or rating > 5:
+            return None, ('Rating must be between 0 and 5', 400)
+        
+        if movie_id not in movie_ids:
+            return None, (f'Movie {movie_id} not found', 404)
+        
+        custom_ratings[movie_id] = rating
+    return custom_ratings, None
+
+
+def wants_ndjson():
+    """Whether the client asked for NDJSON (?format=ndjson or Accept: application/x-ndjson)."""
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def page_limit(config, streaming=False):
+    """
+    Page size from ?limit=, capped at API_MAX_PAGE_SIZE.
+    
+    Without a limit, JSON responses get API_PAGE_SIZE items and NDJSON
+    responses stream everything (returns None).
+    """
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        return None if streaming else config.get('API_PAGE_SIZE', 1000)
+    return max(1, min(limit, config.get('API_MAX_PAGE_SIZE', 10000)))
+
+
+def _user_line(user_id):
+    return f'{{"userId":{user_id}}}\n'
+
+
+def ndjson_response(chunks, next_cursor=None):
+    response = Response(chunks, mimetype='application/x-ndjson')
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
 def init_app(app):
     """Initialize routes for the Flask app."""
     
-    # Load data on startup (will be called from app.py)
-    pass
+    # Size the shared result cache; the data itself is loaded by app.lifecycle
+    configure_cache(
+        max_entries=app.config.get('RESULT_CACHE_SIZE'),
+        max_bytes=app.config.get('RESULT_CACHE_MAX_BYTES'),
+        ttl=app.config.get('RESULT_CACHE_TTL'),
+    )
+    
+    @app.errorhandler(Overloaded)
+    def overloaded(e):
+        """Backpressure from the compute pool: ask the client to retry."""
+        response = jsonify({'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
     
     @app.route('/')
     def index():
         """Serve the main frontend page."""
         return render_template('index.html')
     
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        """Liveness: the process is up and answering requests."""
+        return jsonify({'status': 'ok'})
+    
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        """Readiness: 200 once data is loaded (including during a reload), else 503."""
+        status = app.config['data_lifecycle'].status()
+        return jsonify(status), 200 if status['ready'] else 503
+    
+    @app.route('/admin/reload', methods=['POST'])
+    def admin_reload():
+        """Load the data again in the background and swap it in when complete."""
+        token = app.config.get('ADMIN_TOKEN')
+        if token:
+            if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+                return jsonify({'error': 'Invalid or missing admin token'}), 401
+        elif request.remote_addr not in ('127.0.0.1', '::1'):
+            return jsonify({'error': 'Set ADMIN_TOKEN to reload from other hosts'}), 403
+        
+        if not app.config['data_lifecycle'].start():
+            return jsonify({'error': 'A data load is already running'}), 409
+        return jsonify({'status': 'reloading'}), 202
+    
     @app.route('/api/users', methods=['GET'])
     def get_users():
-        """Get list of all user IDs."""
+        """Get user IDs in ascending order, a page at a time or streamed as NDJSON."""
         data_bundle = app.config.get('data_bundle')
         if not data_bundle:
             return jsonify({'error': 'Data not loaded'}), 500
         
-        users = sorted(data_bundle['user_ids'])
-        return jsonify({'users': users})
+        streaming = wants_ndjson()
+        limit = page_limit(app.config, streaming)
+        cursor = request.args.get('cursor')
+        try:
+            users, next_cursor = user_page(data_bundle, cursor, limit or NDJSON_CHUNK_LINES)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if not streaming:
+            return jsonify({'users': users, 'nextCursor': next_cursor})
+        if limit is not None:
+            return ndjson_response(ndjson_chunks([users], _user_line), next_cursor)
+        
+        def pages(users, cursor):
+            # Later pages are read lazily from the bundle captured for this request
+            yield users
+            while cursor is not None:
+                users, cursor = user_page(data_bundle, cursor, NDJSON_CHUNK_LINES)
+                yield users
+        
+        return ndjson_response(ndjson_chunks(pages(users, next_cursor), _user_line))
     
     @app.route('/api/movies/<int:movie_id>', methods=['GET'])
     def get_movie(movie_id):
@@ -36,38 +173,77 @@ def init_app(app):
         if not movie_info:
             return jsonify({'error': 'Movie not found'}), 404
         
-        return jsonify({
+        return app.config['http_cache'].respond(data_bundle, ('movie', movie_id), lambda: {
             'movieId': movie_id,
             'title': movie_info.get('title', f'Movie {movie_id}'),
             'genres': movie_info.get('genres', '')
         })
     
+    @app.route('/api/movies/<int:movie_id>/similar', methods=['GET'])
+    def get_similar(movie_id):
+        """Get the movies most similar to a movie from the item-item index."""
+        data_bundle = app.config.get('data_bundle')
+        if not data_bundle:
+            return jsonify({'error': 'Data not loaded'}), 500
+        
+        if movie_id not in data_bundle['movie_metadata']:
+            return jsonify({'error': 'Movie not found'}), 404
+        
+        try:
+            limit = min(int(request.args.get('limit', 10)), 50)
+        except (TypeError, ValueError):
+            limit = 10
+        
+        return jsonify({
+            'movieId': movie_id,
+            'similar': get_similar_movies(movie_id, data_bundle, limit=max(limit, 1))
+        })
+    
     @app.route('/api/recommendations', methods=['GET'])
     def get_recommendations_endpoint():
-        """Get movie recommendations for a user."""
+        """
+        Get movie recommendations for a user.
+        
+        Query params: userId, limit (max MAX_RECOMMENDATIONS) and the filters
+        genre (comma-separated, movies must have all), year_min, year_max and
+        min_count (ratings), applied before scoring.
+        """
         data_bundle = app.config.get('data_bundle')
         if not data_bundle:
             return jsonify({'error': 'Data not loaded. Please ensure ratings.csv and movies.csv exist.'}), 500
         
         user_id = request.args.get('userId', type=int)
         limit = request.args.get('limit', default=app.config.get('N_RECOMMENDATIONS', 20), type=int)
+        max_limit = app.config.get('MAX_RECOMMENDATIONS', 100)
         
         if user_id is None:
             return jsonify({'error': 'userId parameter required'}), 400
         
-        if limit < 1 or limit > 5:
-            return jsonify({'error': 'limit must be between 1 and 5'}), 400
+        if limit < 1 or limit > max_limit:
+            return jsonify({'error': f'limit must be between 1 and {max_limit}'}), 400
+        
+        try:
+            movie_filter = parse_filter(
+                data_bundle['movie_filters'], request.args.get('genre'), request.args.get('year_min'),
+                request.args.get('year_max'), request.args.get('min_count'),
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         if user_id not in data_bundle['user_ids']:
             return jsonify({'error': f'User {user_id} not found'}), 404
         
         try:
-            recommendations = get_recommendations(
+            recommendations = offload(
+                app, ('recommendations', id(data_bundle), user_id, limit, movie_filter),
+                get_recommendations,
                 user_id,
                 data_bundle,
                 k_neighbors=app.config.get('K_NEIGHBORS', 30),
                 min_overlap=app.config.get('MIN_OVERLAP', 5),
-                n_recs=limit
+                n_recs=limit,
+                use_cache=app.config.get('ENABLE_SIMILARITY_CACHE', True),
+                movie_filter=movie_filter
             )
             
             if not recommendations:
@@ -77,15 +253,96 @@ def init_app(app):
                 })
             
             return jsonify({'recommendations': recommendations})
+        except Overloaded:
+            raise
         except Exception as e:
             logger.error(f"Error generating recommendations: {e}")
             import traceback
             logger.error(traceback.format_exc())
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/api/recommendations/batch', methods=['POST'])
+    def get_recommendations_batch_endpoint():
+        """
+        Get recommendations for many users and/or rating sets in one request.
+        
+        Body: {"userIds": [...], "ratingSets": [[{movieId, rating}, ...], ...], "limit": n}.
+        Users and rating sets are each scored together with matrix-matrix products.
+        """
+        data_bundle = app.config.get('data_bundle')
+        if not data_bundle:
+            return jsonify({'error': 'Data not loaded'}), 500
+        
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'JSON body required'}), 400
+        
+        user_ids = data.get('userIds') or []
+        rating_sets = data.get('ratingSets') or []
+        if not isinstance(user_ids, list) or not isinstance(rating_sets, list):
+            return jsonify({'error': 'userIds and ratingSets must be arrays'}), 400
+        if not user_ids and not rating_sets:
+            return jsonify({'error': 'userIds or ratingSets required'}), 400
+        
+        max_size = app.config.get('BATCH_MAX_SIZE', 1000)
+        if len(user_ids) + len(rating_sets) > max_size:
+            return jsonify({'error': f'Maximum {max_size} users and rating sets per request'}), 400
+        
+        try:
+            limit = int(data.get('limit', app.config.get('N_RECOMMENDATIONS', 5)))
+            user_ids = [int(u) for u in user_ids]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'limit and userIds must be integers'}), 400
+        max_limit = app.config.get('MAX_RECOMMENDATIONS', 100)
+        if limit < 1 or limit > max_limit:
+            return jsonify({'error': f'limit must be between 1 and {max_limit}'}), 400
+        
+        parsed_sets = []
+        for i, ratings in enumerate(rating_sets):
+            try:
+                custom_ratings, error = parse_custom_ratings(ratings, data_bundle['movie_ids'])
+            except (TypeError, ValueError):
+                custom_ratings, error = None, ('movieId and rating must be numbers', 400)
+            if error:
+                return jsonify({'error': f'ratingSets[{i}]: {error[0]}'}), error[1]
+            parsed_sets.append(custom_ratings)
+        
+        def score():
+            by_user = get_recommendations_batch(
+                user_ids,
+                data_bundle,
+                k_neighbors=app.config.get('K_NEIGHBORS', 30),
+                min_overlap=app.config.get('MIN_OVERLAP', 5),
+                n_recs=limit
+            )
+            by_set = recommend_for_ratings_batch(
+                parsed_sets,
+                data_bundle,
+                n_recs=limit,
+                use_cache=app.config.get('ENABLE_RESULT_CACHE', True)
+            )
+            return by_user, by_set
+        
+        try:
+            by_user, by_set = offload(app, None, score)
+        except Overloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating batch recommendations: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return jsonify({'error': str(e)}), 500
+        
+        users = [{'userId': u, 'recommendations': by_user[u]} for u in dict.fromkeys(user_ids) if u in by_user]
+        return jsonify({
+            'users': users,
+            'ratingSets': [{'recommendations': recs} for recs in by_set],
+            'notFound': [u for u in dict.fromkeys(user_ids) if u not in by_user],
+        })
+    
     @app.route('/api/user-history', methods=['GET'])
     def get_user_history():
-        """Get rating history for a user."""
+        """Get a user's ratings, highest first, a page at a time or streamed as NDJSON."""
         data_bundle = app.config.get('data_bundle')
         if not data_bundle:
             return jsonify({'error': 'Data not loaded'}), 500
@@ -94,29 +351,51 @@ def init_app(app):
         if user_id is None:
             return jsonify({'error': 'userId parameter required'}), 400
         
-        if user_id not in data_bundle['user_ratings']:
+        history = user_history(data_bundle, user_id)
+        if history is None:
             return jsonify({'error': f'User {user_id} not found'}), 404
+        movie_ids, ratings = history
         
-        user_ratings = data_bundle['user_ratings'][user_id]
-        history = []
+        streaming = wants_ndjson()
+        limit = page_limit(app.config, streaming)
+        try:
+            start = history_start(movie_ids, ratings, request.args.get('cursor'))
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        end = len(movie_ids) if limit is None else min(start + limit, len(movie_ids))
+        next_cursor = history_cursor(movie_ids, ratings, end)
         
-        for movie_id, rating in user_ratings.items():
-            movie_info = data_bundle['movie_metadata'].get(movie_id, {})
-            history.append({
-                'movieId': movie_id,
-                'title': movie_info.get('title', f'Movie {movie_id}'),
-                'genres': movie_info.get('genres', ''),
-                'rating': rating
-            })
+        movie_metadata = data_bundle['movie_metadata']
         
-        # Sort by rating (highest first)
-        history.sort(key=lambda x: x['rating'], reverse=True)
+        def entries(first, last):
+            movie_info = movie_metadata.get
+            for movie_id, rating in zip(movie_ids[first:last].tolist(), ratings[first:last].tolist()):
+                info = movie_info(movie_id, {})
+                yield {
+                    'movieId': movie_id,
+                    'title': info.get('title', f'Movie {movie_id}'),
+                    'genres': info.get('genres', ''),
+                    'rating': rating
+                }
         
-        return jsonify({'history': history})
+        if streaming:
+            pages = (entries(i, min(i + NDJSON_CHUNK_LINES, end)) for i in range(start, end, NDJSON_CHUNK_LINES))
+            return ndjson_response(ndjson_chunks(pages, json_line), next_cursor)
+        return jsonify({
+            'history': list(entries(start, end)),
+            'total': len(movie_ids),
+            'nextCursor': next_cursor,
+        })
     
     @app.route('/api/custom-recommendations', methods=['POST'])
     def get_custom_recommendations():
-        """Get recommendations based on custom movie ratings."""
+        """
+        Get recommendations based on custom movie ratings.
+        
+        Body: {"ratings": [{movieId, rating}, ...], "limit": n} plus optional
+        filters applied before scoring: "genre" (comma-separated or a list;
+        movies must have all), "yearMin", "yearMax" and "minCount" (ratings).
+        """
         data_bundle = app.config.get('data_bundle')
         if not data_bundle:
             return jsonify({'error': 'Data not loaded'}), 500
@@ -126,44 +405,104 @@ def init_app(app):
             if not data or 'ratings' not in data:
                 return jsonify({'error': 'ratings array required'}), 400
             
-            ratings = data['ratings']
-            if not isinstance(ratings, list) or len(ratings) == 0:
-                return jsonify({'error': 'ratings must be a non-empty array'}), 400
-            
-            if len(ratings) > 5:
-                return jsonify({'error': 'Maximum 5 ratings allowed'}), 400
+            custom_ratings, error = parse_custom_ratings(data['ratings'], data_bundle['movie_ids'])
+            if error:
+                return jsonify({'error': error[0]}), error[1]
             
-            custom_ratings = {}
-            for item in ratings:
-                if 'movieId' not in item or 'rating' not in item:
-                    return jsonify({'error': 'Each rating must have movieId and rating'}), 400
-                
-                movie_id = int(item['movieId'])
-                rating = float(item['rating'])
-                
-                if rating < 0 or rating > 5:
-                    return jsonify({'error': 'Rating must be between 0 and 5'}), 400
-                
-                if movie_id not in data_bundle['movie_ids']:
-                    return jsonify({'error': f'Movie {movie_id} not found'}), 404
-                
-                custom_ratings[movie_id] = rating
+            max_limit = app.config.get('MAX_RECOMMENDATIONS', 100)
+            try:
+                limit = int(data.get('limit', app.config.get('N_RECOMMENDATIONS', 5)))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'limit must be an integer'}), 400
+            try:
+                movie_filter = parse_filter(
+                    data_bundle['movie_filters'], data.get('genre'), data.get('yearMin'),
+                    data.get('yearMax'), data.get('minCount'),
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if limit < 1 or limit > max_limit:
+                return jsonify({'error': f'limit must be between 1 and {max_limit}'}), 400
             
-            from app.recommender import get_recommendations_from_ratings
-            recommendations = get_recommendations_from_ratings(
+            recommendations = offload(
+                app, ('custom', id(data_bundle), frozenset(custom_ratings.items()), limit, movie_filter),
+                recommend_for_ratings,
                 custom_ratings,
                 data_bundle,
-                n_recs=5
+                n_recs=limit,
+                use_cache=app.config.get('ENABLE_RESULT_CACHE', True),
+                movie_filter=movie_filter
             )
             
             return jsonify({'recommendations': recommendations})
             
+        except Overloaded:
+            raise
         except Exception as e:
             logger.error(f"Error generating custom recommendations: {e}")
             import traceback
             logger.error(traceback.format_exc())
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/api/ratings', methods=['POST'])
+    def add_ratings():
+        """
+        Ingest new ratings without reloading the data.
+        
+        Body: {"ratings": [{userId, movieId, rating, timestamp?}, ...]} or a single
+        rating object. Ratings are logged, applied to aggregates and user
+        histories immediately, and compacted into the store in the background.
+        """
+        data_bundle = app.config.get('data_bundle')
+        if not data_bundle:
+            return jsonify({'error': 'Data not loaded'}), 500
+        
+        ingestor = app.config.get('ingestor')
+        if ingestor is None:
+            return jsonify({'error': 'Rating ingestion is disabled'}), 503
+        
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and 'ratings' not in data:
+            data = {'ratings': [data]}
+        if not isinstance(data, dict) or not isinstance(data['ratings'], list) or not data['ratings']:
+            return jsonify({'error': 'ratings must be a non-empty array'}), 400
+        
+        if len(data['ratings']) > MAX_INGEST_RATINGS:
+            return jsonify({'error': f'Maximum {MAX_INGEST_RATINGS} ratings per request'}), 400
+        
+        ratings = []
+        for item in data['ratings']:
+            if not isinstance(item, dict) or not all(k in item for k in ('userId', 'movieId', 'rating')):
+                return jsonify({'error': 'Each rating must have userId, movieId and rating'}), 400
+            try:
+                ratings.append(parse_rating(
+                    item['userId'], item['movieId'], item['rating'], item.get('timestamp'), data_bundle['movie_ids']
+                ))
+            except KeyError as e:
+                return jsonify({'error': e.args[0]}), 404
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+        
+        pending = ingestor.ingest(ratings)
+        return jsonify({'accepted': len(ratings), 'pending': pending})
+    
+    @app.route('/api/cache-stats', methods=['GET'])
+    def get_cache_stats():
+        """Get recommendation result and HTTP response cache counters."""
+        stats = {'resultCache': cache_stats(), 'httpCache': app.config['http_cache'].stats()}
+        ingestor = app.config.get('ingestor')
+        if ingestor is not None:
+            stats['ingestion'] = ingestor.stats()
+        return jsonify(stats)
+    
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Request, recommender stage, data load and cache metrics in the Prometheus text format."""
+        body = metrics.REGISTRY.render(
+            extra_collectors=[partial(metrics.ingestion_metrics, app.config.get('ingestor'))]
+        )
+        return Response(body, content_type=metrics.CONTENT_TYPE)
+    
     @app.route('/api/search-movies', methods=['GET'])
     def search_movies():
         """Search for movies by title."""
@@ -176,61 +515,155 @@ def init_app(app):
             return jsonify({'movies': []})
         
         try:
-            limit = min(int(request.args.get('limit', 20)), 50)
+            limit = max(min(int(request.args.get('limit', 20)), 50), 1)
         except (TypeError, ValueError):
             limit = 20
         
-        results = []
-        metadata = data_bundle.get('movie_metadata') or {}
-        for movie_id, movie_info in metadata.items():
-            try:
-                title = str(movie_info.get('title', '')).lower()
-                if query in title:
-                    results.append({
-                        'movieId': int(movie_id),
-                        'title': movie_info.get('title', f'Movie {movie_id}'),
-                        'genres': movie_info.get('genres', '')
-                    })
-                    if len(results) >= limit:
-                        break
-            except (TypeError, ValueError):
-                continue
+        def render():
+            results = []
+            metadata = data_bundle.get('movie_metadata') or {}
+            for movie_id, _ in data_bundle['search_index'].search(query, limit=limit):
+                movie_info = metadata.get(movie_id, {})
+                results.append({
+                    'movieId': movie_id,
+                    'title': movie_info.get('title', f'Movie {movie_id}'),
+                    'genres': movie_info.get('genres', '')
+                })
+            return {'movies': results}
         
-        return jsonify({'movies': results})
+        return app.config['http_cache'].respond(data_bundle, ('search', query, limit), render)
 
     @app.route('/api/top-movies', methods=['GET'])
     def top_movies():
-        """Return globally top-rated movies by average rating."""
+        """
+        Return top movies from the precomputed per-movie aggregates.
+        
+        Query params: limit (max 50), min_count (default TOP_MOVIES_MIN_COUNT),
+        genre (comma-separated, movies must have all), year_min, year_max and
+        mode (average | bayesian | count).
+        """
         data_bundle = app.config.get('data_bundle')
         if not data_bundle:
             return jsonify({'error': 'Data not loaded'}), 500
 
-        movie_ratings = data_bundle.get('movie_ratings') or {}
+        stats = data_bundle['movie_stats']
         movie_metadata = data_bundle.get('movie_metadata') or {}
 
         try:
             limit = min(int(request.args.get('limit', 10)), 50)
         except (TypeError, ValueError):
             limit = 10
+        try:
+            min_count = int(request.args.get('min_count', app.config.get('TOP_MOVIES_MIN_COUNT', 10)))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'min_count must be an integer'}), 400
+
+        mode = request.args.get('mode', 'average')
+        if mode not in RANKING_MODES:
+            return jsonify({'error': f"mode must be one of: {', '.join(RANKING_MODES)}"}), 400
+
+        # Validated here: a matching If-None-Match is answered without calling render()
+        try:
+            movie_filter = parse_filter(
+                data_bundle['movie_filters'], request.args.get('genre'), request.args.get('year_min'),
+                request.args.get('year_max'),
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        mask = filter_mask(data_bundle, movie_filter)
+
+        def render():
+            movies = []
+            for idx in stats.top(limit, min_count=min_count, mask=mask, mode=mode):
+                movie_id = int(stats.movie_ids[idx])
+                info = movie_metadata.get(movie_id, {})
+                movies.append({
+                    'movieId': movie_id,
+                    'title': info.get('title', f'Movie {movie_id}'),
+                    'genres': info.get('genres', ''),
+                    'avgRating': round(float(stats.means[idx]), 2),
+                    'weightedRating': round(float(stats.bayesian[idx]), 2),
+                    'ratingCount': int(stats.counts[idx]),
+                })
+            return {'movies': movies}
+
+        # Aggregates move with every ingested rating, so the ETag counts them too
+        return app.config['http_cache'].respond(
+            data_bundle, ('top', limit, min_count, mode, movie_filter), render, movie_stats=stats,
+        )
+
+    @app.route('/api/trending', methods=['GET'])
+    def trending_movies():
+        """
+        Return the movies rated most in a recent window, newer ratings weighted more.
+        
+        Query params: limit (max 50), days (window, default TRENDING_WINDOW_DAYS),
+        half_life (days, default TRENDING_HALF_LIFE_DAYS, 0 = no decay),
+        min_count (ratings in the window), genre (comma-separated, movies must
+        have all), year_min, year_max and as_of (Unix time the window ends;
+        default the newest rating).
+        """
+        data_bundle = app.config.get('data_bundle')
+        if not data_bundle:
+            return jsonify({'error': 'Data not loaded'}), 500
+        index = data_bundle.get('trending')
+        if index is None:
+            return jsonify({'error': 'Trending is unavailable: the ratings were loaded without timestamps'}), 503
+
+        try:
+            limit = min(int(request.args.get('limit', 10)), 50)
+        except (TypeError, ValueError):
+            limit = 10
+        try:
+            days = float(request.args.get('days', app.config.get('TRENDING_WINDOW_DAYS', 30)))
+            half_life = float(request.args.get('half_life', app.config.get('TRENDING_HALF_LIFE_DAYS', 7)))
+            min_count = int(request.args.get('min_count', app.config.get('TRENDING_MIN_COUNT', 1)))
+            as_of = request.args.get('as_of')
+            as_of = int(as_of) if as_of is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'days and half_life must be numbers, min_count and as_of integers'}), 400
+        if not (np.isfinite(days) and np.isfinite(half_life)) or days <= 0 or half_life < 0:
+            return jsonify({'error': 'days must be positive and half_life not negative'}), 400
+
+        try:
+            movie_filter = parse_filter(
+                data_bundle['movie_filters'], request.args.get('genre'), request.args.get('year_min'),
+                request.args.get('year_max'),
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        mask = filter_mask(data_bundle, movie_filter)
 
-        min_count = 10  # minimum ratings per movie to be considered
+        # Ratings accepted since the last compaction come from the delta's per-bucket totals
+        store = data_bundle['rating_store']
+        delta = data_bundle.get('delta')
+        pending = None
+        newest = delta.newest_timestamp() if delta is not None else None
+        if newest is not None:
+            buckets, movie_ids, counts, sums = delta.bucket_totals()
+            pending = (buckets, np.searchsorted(store.movie_ids, movie_ids), counts, sums)
+        if as_of is None:
+            as_of = max(index.last_timestamp or 0, newest + 1 if newest is not None else 0)
 
-        stats = []
-        for movie_id, ratings_by_user in movie_ratings.items():
-            if not ratings_by_user:
-                continue
-            count = len(ratings_by_user)
-            if count < min_count:
-                continue
-            avg = sum(ratings_by_user.values()) / count
+        positions, (decayed, decayed_sums, counts) = trending(
+            index, as_of, days * DAY_SECONDS, half_life * DAY_SECONDS,
+            limit=limit, min_count=min_count, mask=mask, pending=pending,
+        )
+        movie_metadata = data_bundle.get('movie_metadata') or {}
+        movies = []
+        for idx in positions:
+            movie_id = int(store.movie_ids[idx])
             info = movie_metadata.get(movie_id, {})
-            stats.append({
-                'movieId': int(movie_id),
+            movies.append({
+                'movieId': movie_id,
                 'title': info.get('title', f'Movie {movie_id}'),
                 'genres': info.get('genres', ''),
-                'avgRating': round(float(avg), 2),
-                'ratingCount': count,
+                'score': round(float(decayed[idx]), 3),
+                'ratingCount': int(counts[idx]),
+                'avgRating': round(float(decayed_sums[idx] / decayed[idx]), 2),
             })
 
-        stats.sort(key=lambda m: (m['avgRating'], m['ratingCount']), reverse=True)
-        return jsonify({'movies': stats[:limit]})
+        return jsonify({
+            'movies': movies,
+            'window': {'start': int(as_of - days * DAY_SECONDS), 'end': as_of, 'days': days, 'halfLifeDays': half_life},
+        })
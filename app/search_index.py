@@ -0,0 +1,349 @@
+import numpy as np
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+PREFIX_SCAN_MAX = 256     # Prefixes matching more entries than this get precomputed results
+PREFIX_RESULTS = 100      # Ranks kept per precomputed prefix (searches ask for at most 2 x limit)
+SCAN_CANDIDATES = 1000    # Posting entries (most popular first) read per trigram by infix and fuzzy matching
+FUZZY_MIN_SHARED = 0.6    # Fraction of query trigrams a fuzzy match must share
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_YEAR_SUFFIX = re.compile(r'\s*\(\d{4}(?:-\d{0,4})?\)\s*$')
+_TRAILING_ARTICLE = re.compile(r'^(?P<name>.+), (?P<article>The|A|An|Les|La|Le|El|Il|Der|Die|Das|Los|Las)(?P<rest>\s*\(.*)?$')
+
+# Match tiers, best first
+TIER_EXACT, TIER_TITLE_PREFIX, TIER_TOKEN_PREFIX, TIER_INFIX, TIER_FUZZY = range(5)
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces."""
+    text = str(text)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(_NON_ALNUM.sub(' ', text.lower()).split())
+
+
+def title_variants(title):
+    """Normalized forms a title can be searched by, e.g. 'Matrix, The' as 'the matrix'."""
+    variants = [normalize(title)]
+    match = _TRAILING_ARTICLE.match(str(title))
+    if match:
+        variants.append(normalize(f"{match.group('article')} {match.group('name')}{match.group('rest') or ''}"))
+    return variants
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Title search index built once at load time.
+
+    Movies are numbered by popularity rank (0 = most rated), so every posting
+    list is a set of ranks and "best by popularity" is simply "smallest".
+    Prefix lookups binary-search sorted title and token arrays; prefixes
+    shared by many entries have their best ranks precomputed. Infix and
+    typo-tolerant lookups go through trigram postings, reading only their
+    most popular SCAN_CANDIDATES entries, so query time does not grow with
+    the catalog. Normalized text is always ASCII, so keys are stored as
+    fixed-width byte strings and the whole index is plain arrays.
+    """
+
+    def __init__(self, movie_metadata, popularity):
+        catalog = sorted(movie_metadata)
+        counts = [popularity.get(m, 0) for m in catalog]
+
+        names = [normalize(movie_metadata[m].get('title', '')) for m in catalog]
+        order = sorted(range(len(catalog)), key=lambda i: (-counts[i], names[i], catalog[i]))
+        self.movie_ids = np.array([catalog[i] for i in order], dtype=np.int64)
+        self.titles = np.array([names[i].encode('ascii') for i in order], dtype=bytes)
+
+        exact = defaultdict(list)
+        title_entries = []
+        token_entries = []
+        postings = defaultdict(list)
+        for rank, movie_id in enumerate(self.movie_ids.tolist()):
+            variants = title_variants(movie_metadata[movie_id].get('title', ''))
+            for variant in variants:
+                title_entries.append((variant, rank))
+                exact[_YEAR_SUFFIX.sub('', variant)].append(rank)
+            for token in set(' '.join(variants).split()):
+                token_entries.append((token, rank))
+            for gram in trigrams(names[order[rank]]):
+                postings[gram].append(rank)
+
+        title_entries.sort()
+        token_entries.sort()
+        self._exact = Postings.from_dict({name: sorted(set(ranks)) for name, ranks in exact.items()})
+        self._title_keys = _keys([t for t, _ in title_entries])
+        self._title_ranks = np.array([r for _, r in title_entries], dtype=np.int32)
+        self._token_keys = _keys([t for t, _ in token_entries])
+        self._token_ranks = np.array([r for _, r in token_entries], dtype=np.int32)
+        self._trigrams = Postings.from_dict(postings)
+
+        self._token_prefixes = _heavy_prefixes(self._token_keys, self._token_ranks)
+        self._title_prefixes = _heavy_prefixes(self._title_keys, self._title_ranks)
+
+    @classmethod
+    def from_store(cls, movie_metadata, store):
+        """Build with rating counts from a RatingStore as popularity."""
+        return cls(movie_metadata, dict(zip(store.movie_ids.tolist(), store.movie_counts().tolist())))
+
+    def to_arrays(self):
+        """Index state as a dict of arrays, for snapshots."""
+        arrays = {
+            'movie_ids': self.movie_ids,
+            'titles': self.titles,
+            'title_keys': self._title_keys,
+            'title_ranks': self._title_ranks,
+            'token_keys': self._token_keys,
+            'token_ranks': self._token_ranks,
+        }
+        for name in ('exact', 'trigrams', 'token_prefixes', 'title_prefixes'):
+            postings = getattr(self, f'_{name}')
+            arrays[f'{name}_keys'] = postings.keys_array
+            arrays[f'{name}_indptr'] = postings.indptr
+            arrays[f'{name}_ranks'] = postings.ranks
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild an index from to_arrays() output without copying the arrays."""
+        index = cls.__new__(cls)
+        index.movie_ids = arrays['movie_ids']
+        index.titles = arrays['titles']
+        index._title_keys = arrays['title_keys']
+        index._title_ranks = arrays['title_ranks']
+        index._token_keys = arrays['token_keys']
+        index._token_ranks = arrays['token_ranks']
+        for name in ('exact', 'trigrams', 'token_prefixes', 'title_prefixes'):
+            setattr(index, f'_{name}', Postings(
+                arrays[f'{name}_keys'], arrays[f'{name}_indptr'], arrays[f'{name}_ranks']
+            ))
+        return index
+
+    def _prefix_ranks(self, keys, ranks, heavy, prefix, limit):
+        """The `limit` best ranks of the entries whose key starts with prefix."""
+        best = heavy.get(prefix)
+        if best is not None and (limit <= len(best) or len(best) < PREFIX_RESULTS):
+            return best[:limit]
+        lo, hi = _prefix_range(keys, prefix)
+        return _best(np.unique(ranks[lo:hi]), limit)
+
+    def _title_prefix_ranks(self, prefix, limit):
+        return self._prefix_ranks(self._title_keys, self._title_ranks, self._title_prefixes, prefix, limit)
+
+    def _token_matches(self, tokens, limit):
+        if len(tokens) == 1:
+            return self._prefix_ranks(self._token_keys, self._token_ranks, self._token_prefixes, tokens[0], limit)
+        # Candidates come from the token matching the fewest entries, the other tokens are checked on the titles
+        ranges = [_prefix_range(self._token_keys, token) for token in tokens]
+        rarest = min(range(len(tokens)), key=lambda i: ranges[i][1] - ranges[i][0])
+        lo, hi = ranges[rarest]
+        if hi - lo <= PREFIX_SCAN_MAX:
+            candidates, complete = np.unique(self._token_ranks[lo:hi]), True
+        else:
+            candidates = self._token_prefixes[tokens[rarest]]
+            complete = len(candidates) < PREFIX_RESULTS
+        others = [token.encode('ascii') for i, token in enumerate(tokens) if i != rarest]
+        matches = []
+        for rank in candidates.tolist():
+            words = self.titles[rank].split()
+            if all(any(word.startswith(token) for word in words) for token in others):
+                matches.append(rank)
+                if len(matches) >= limit:
+                    return np.array(matches, dtype=np.int32)
+        if complete:
+            return np.array(matches, dtype=np.int32)
+
+        # Every token is very common: intersect their full rank sets
+        matches = None
+        for lo, hi in sorted(ranges, key=lambda r: r[1] - r[0]):
+            ranks = np.unique(self._token_ranks[lo:hi])
+            matches = ranks if matches is None else np.intersect1d(matches, ranks, assume_unique=True)
+            if len(matches) == 0:
+                break
+        return _best(matches, limit)
+
+    def _infix_matches(self, query, limit):
+        """
+        Titles containing the query, most popular first. Candidates are the
+        first SCAN_CANDIDATES entries of the query's rarest trigram, narrowed
+        by the other trigrams and checked against the titles until `limit`
+        match, so less popular titles past that point are not searched.
+        """
+        postings = [self._trigrams.get(g) for g in trigrams(query)]
+        if not postings or any(p is None for p in postings):
+            return np.empty(0, dtype=np.int32)
+        postings.sort(key=len)
+        candidates = postings[0][:SCAN_CANDIDATES]
+        for posting in postings[1:]:
+            candidates = candidates[_contains(posting, candidates)]
+            if len(candidates) == 0:
+                break
+        needle = query.encode('ascii')
+        matches = []
+        for rank in candidates.tolist():
+            if needle in self.titles[rank]:
+                matches.append(rank)
+                if len(matches) >= limit:
+                    break
+        return np.array(matches, dtype=np.int32)
+
+    def _fuzzy_matches(self, query, limit):
+        """
+        Titles sharing most of the query's trigrams, by shared count then
+        popularity. Candidates are the first SCAN_CANDIDATES entries of each
+        posting; their shared counts are then looked up in the full postings.
+        """
+        query_grams = trigrams(query)
+        postings = [self._trigrams[g] for g in query_grams if g in self._trigrams]
+        if not postings:
+            return np.empty(0, dtype=np.int32)
+        ranks = np.unique(np.concatenate([posting[:SCAN_CANDIDATES] for posting in postings]))
+        shared = np.zeros(len(ranks), dtype=np.int32)
+        for posting in postings:
+            shared += _contains(posting, ranks)
+        keep = shared >= max(1, int(np.ceil(FUZZY_MIN_SHARED * len(query_grams))))
+        ranks, shared = ranks[keep], shared[keep]
+        return ranks[np.lexsort((ranks, -shared))][:limit]
+
+    def search(self, query, limit=20):
+        """
+        Return up to `limit` (movieId, tier) pairs ranked by match quality, then popularity.
+
+        Tiers: exact title, title prefix, every query word prefixes a title word,
+        substring, and trigram (typo-tolerant) matches.
+        """
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+
+        # Each tier is fetched lazily, asking for enough to survive dedup
+        tiers = [
+            (TIER_EXACT, lambda n: self._exact.get(query)),
+            (TIER_TITLE_PREFIX, lambda n: self._title_prefix_ranks(query, n)),
+            (TIER_TOKEN_PREFIX, lambda n: self._token_matches(query.split(), n)),
+        ]
+        if len(query) >= 3:
+            tiers.append((TIER_INFIX, lambda n: self._infix_matches(query, n)))
+            tiers.append((TIER_FUZZY, lambda n: self._fuzzy_matches(query, n)))
+
+        results = []
+        seen = set()
+        for tier, fetch in tiers:
+            if len(results) >= limit:
+                break
+            ranks = fetch(limit + len(seen))
+            if ranks is None:
+                continue
+            for rank in ranks.tolist():
+                if rank not in seen:
+                    seen.add(rank)
+                    results.append((int(self.movie_ids[rank]), tier))
+                    if len(results) >= limit:
+                        break
+        return results
+
+
+def _best(ranks, limit):
+    """The `limit` smallest (most popular) ranks, in order."""
+    if len(ranks) > limit:
+        ranks = np.partition(ranks, limit - 1)[:limit]
+    return np.sort(ranks)
+
+
+def _heavy_prefixes(keys, ranks):
+    """
+    Postings of the best PREFIX_RESULTS ranks for every prefix matching more
+    than PREFIX_SCAN_MAX of the sorted keys. Other prefixes are answered
+    from the keys directly, at bounded cost.
+    """
+    heavy = {}
+    lengths = np.char.str_len(keys) if len(keys) else np.zeros(0, dtype=np.int64)
+    n = 1
+    while True:
+        # Keys shorter than n have no prefix of length n; dropping them keeps the rest sorted
+        positions = np.flatnonzero(lengths >= n)
+        if len(positions) <= PREFIX_SCAN_MAX:
+            break
+        prefixes = keys[positions].astype(f'S{n}')
+        starts = np.flatnonzero(np.r_[True, prefixes[1:] != prefixes[:-1]])
+        ends = np.r_[starts[1:], len(prefixes)]
+        large = np.flatnonzero(ends - starts > PREFIX_SCAN_MAX)
+        if len(large) == 0:
+            break  # Longer prefixes match subsets of these
+        for i in large.tolist():
+            # Keys sharing a prefix are contiguous in the sorted keys
+            lo, hi = positions[starts[i]], positions[ends[i] - 1] + 1
+            heavy[prefixes[starts[i]].decode('ascii')] = _best(np.unique(ranks[lo:hi]), PREFIX_RESULTS)
+        n += 1
+    return Postings.from_dict(heavy)
+
+
+def _contains(sorted_ranks, values):
+    """Mask over values of those present in sorted_ranks."""
+    pos = np.minimum(np.searchsorted(sorted_ranks, values), len(sorted_ranks) - 1)
+    return sorted_ranks[pos] == values
+
+
+def _keys(strings):
+    """Sorted normalized strings as a fixed-width byte array."""
+    return np.array([s.encode('ascii') for s in strings], dtype=bytes) if strings else np.empty(0, dtype='S1')
+
+
+def _prefix_range(keys, prefix):
+    """[lo, hi) positions of the sorted keys starting with prefix."""
+    prefix = prefix.encode('ascii')
+    lo = int(np.searchsorted(keys, prefix, side='left'))
+    hi = int(np.searchsorted(keys, prefix + b'\xff', side='left'))
+    return lo, hi
+
+
+class Postings(Mapping):
+    """Read-only str -> rank array mapping over sorted byte-string keys and CSR rank lists."""
+
+    def __init__(self, keys, indptr, ranks):
+        self.keys_array = keys
+        self.indptr = indptr
+        self.ranks = ranks
+
+    @classmethod
+    def from_dict(cls, postings):
+        keys = sorted(postings)
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(postings[k]) for k in keys], out=indptr[1:])
+        ranks = np.concatenate([np.asarray(postings[k], dtype=np.int32) for k in keys]) if keys else []
+        return cls(_keys(keys), indptr, np.asarray(ranks, dtype=np.int32))
+
+    def _index(self, key):
+        try:
+            key = key.encode('ascii')
+        except (AttributeError, UnicodeEncodeError):
+            return -1
+        pos = int(np.searchsorted(self.keys_array, key))
+        if pos < len(self.keys_array) and self.keys_array[pos] == key:
+            return pos
+        return -1
+
+    def __getitem__(self, key):
+        pos = self._index(key)
+        if pos < 0:
+            raise KeyError(key)
+        return self.ranks[self.indptr[pos]:self.indptr[pos + 1]]
+
+    def __contains__(self, key):
+        return self._index(key) >= 0
+
+    def __iter__(self):
+        return (k.decode('ascii') for k in self.keys_array.tolist())
+
+    def __len__(self):
+        return len(self.keys_array)
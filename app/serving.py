@@ -0,0 +1,164 @@
+"""
+Production serving: a bounded compute pool for recommendation work and an
+ASGI front end for the Flask app.
+
+Routes hand CPU-heavy scoring to the ComputePool; it runs at most `workers`
+computations at once, lets `max_queue` more wait, answers anything beyond that
+with Overloaded (a 503), and lets concurrent identical requests share one
+computation. AsgiApp serves the WSGI app under an ASGI server (a2wsgi does
+the protocol translation), so connections are accepted and cheap requests
+(search, metadata, metrics) keep being answered while scoring is busy.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from app.metrics import COMPUTE_PENDING, OFFLOADED
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    WSGIMiddleware = None
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """The compute pool is full or the computation timed out; the client should retry later."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ComputePool:
+    """
+    Bounded thread pool with single-flight request coalescing.
+
+    NumPy, SciPy and BLAS release the GIL in the scoring kernels, so threads
+    share the cores without copying the data bundle into worker processes.
+    """
+
+    def __init__(self, workers=None, max_queue=32, timeout=30.0):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='compute')
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._pending = 0
+
+    def run(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the pool and wait for its result.
+
+        Calls with the same (hashable) key while one is in flight wait for
+        that computation instead of starting another; key=None never
+        coalesces. Raises Overloaded when workers plus queue are full or the
+        result takes longer than the timeout.
+        """
+        submitted = False
+        with self._lock:
+            future = self._inflight.get(key) if key is not None else None
+            if future is not None:
+                OFFLOADED.labels('coalesced').inc()
+            else:
+                if self._pending >= self.workers + self.max_queue:
+                    OFFLOADED.labels('rejected').inc()
+                    raise Overloaded(f'Server busy: {self._pending} computations pending')
+                self._pending += 1
+                COMPUTE_PENDING.set(self._pending)
+                OFFLOADED.labels('computed').inc()
+                future = self._executor.submit(fn, *args, **kwargs)
+                if key is not None:
+                    self._inflight[key] = future
+                submitted = True
+        if submitted:
+            # Outside the lock: a future that already finished runs the callback right here
+            future.add_done_callback(lambda f: self._done(key, f))
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            OFFLOADED.labels('timeout').inc()
+            raise Overloaded(f'Computation did not finish within {self.timeout}s') from None
+
+    def _done(self, key, future):
+        with self._lock:
+            self._pending -= 1
+            COMPUTE_PENDING.set(self._pending)
+            if key is not None and self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'maxQueue': self.max_queue, 'pending': self._pending}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def init_app(app):
+    """Create the app's compute pool (SERVING_WORKERS = 0 computes on the request thread)."""
+    workers = app.config.get('SERVING_WORKERS')
+    pool = None
+    if workers != 0:
+        pool = ComputePool(
+            workers=workers,
+            max_queue=app.config.get('SERVING_MAX_QUEUE', 32),
+            timeout=app.config.get('SERVING_TIMEOUT', 30.0),
+        )
+    app.config['compute_pool'] = pool
+    return pool
+
+
+def offload(app, key, fn, *args, **kwargs):
+    """Run fn through the app's compute pool, or inline when it has none."""
+    pool = app.config.get('compute_pool')
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.run(key, fn, *args, **kwargs)
+
+
+class AsgiApp:
+    """
+    ASGI front end for a WSGI app (uvicorn asgi:app).
+
+    HTTP requests go through a2wsgi, which streams request and response
+    bodies between the event loop and a pool of `threads` threads running
+    the WSGI app; on_startup and on_shutdown run from the lifespan protocol.
+    Each request holds one of those threads until it is answered, including
+    while it waits on the compute pool, so keep threads comfortably above
+    SERVING_WORKERS + SERVING_MAX_QUEUE: the remainder is what keeps cheap
+    requests flowing while every compute slot is busy.
+    """
+
+    def __init__(self, wsgi_app, threads=64, on_startup=None, on_shutdown=None):
+        if WSGIMiddleware is None:
+            raise ImportError('ASGI serving needs a2wsgi: pip install -r requirements-serving.txt')
+        self.http = WSGIMiddleware(wsgi_app, workers=threads)
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        else:
+            await self.http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            hook = {'lifespan.startup': self.on_startup, 'lifespan.shutdown': self.on_shutdown}.get(message['type'])
+            try:
+                if hook is not None:
+                    await asyncio.to_thread(hook)
+            except Exception as e:
+                logger.error(f"{message['type']} failed: {e}")
+                await send({'type': f"{message['type']}.failed", 'message': str(e)})
+            else:
+                await send({'type': f"{message['type']}.complete"})
+            if message['type'] == 'lifespan.shutdown':
+                self.http.executor.shutdown(wait=False)
+                return
@@ -0,0 +1,240 @@
+"""
+Sharded genre scoring across a pool of worker processes.
+
+One request's genre matching is a matrix-vector product over the whole
+catalog plus a top-k, which runs on one core. With SHARDED_SCORING_WORKERS
+set, the genre matrix, row norms and movie IDs are copied once per bundle
+into a multiprocessing.shared_memory segment, and a persistent process pool
+scores contiguous shards of the catalog in parallel: each worker maps the
+segment (no copy), scores its rows and returns its own top k. The parent
+merges the partial lists with the same (score, movie ID) order, which gives
+exactly the single-process result.
+
+Catalogs below SHARDED_SCORING_MIN_MOVIES are scored inline, since the
+round trip to the workers costs more than the product itself. Larger ones
+are cut into one shard per SHARD_MIN_MOVIES movies, up to one per worker.
+"""
+import atexit
+import logging
+import multiprocessing
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from app.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAX_PUBLISHED = 2  # Segments kept mapped: the current bundle's and the one it replaced
+
+# Module-level scorer used by the recommender, set by init_app
+_scorer = None
+
+
+def get_sharded_scorer():
+    """The app's ShardedGenreScorer, or None when sharded scoring is off."""
+    return _scorer
+
+
+def _layout(n_movies, n_genres):
+    """Byte offsets of (matrix, norms, movie IDs) in a segment, each 8-byte aligned."""
+    matrix = n_movies * n_genres * 4
+    norms = n_movies * 4
+    offsets = (0, _align(matrix), _align(matrix) + _align(norms))
+    return offsets, offsets[2] + n_movies * 8
+
+
+def _align(n):
+    return (n + 7) // 8 * 8
+
+
+def _views(buffer, n_movies, n_genres):
+    offsets, _ = _layout(n_movies, n_genres)
+    return (
+        np.ndarray((n_movies, n_genres), dtype=np.float32, buffer=buffer, offset=offsets[0]),
+        np.ndarray(n_movies, dtype=np.float32, buffer=buffer, offset=offsets[1]),
+        np.ndarray(n_movies, dtype=np.int64, buffer=buffer, offset=offsets[2]),
+    )
+
+
+def shard_top_k(matrix, norms, movie_ids, user_vector, user_norm, k, excluded, mask):
+    """
+    (positions, similarities) of the k best movies of one shard, ranked like
+    recommender.top_k_indices: positive cosine similarity at 6 decimals, then movie ID.
+    """
+    scale = norms * user_norm
+    similarities = np.divide(
+        matrix @ user_vector, scale, out=np.zeros(len(scale), dtype=np.float32), where=scale > 0
+    )
+    similarities[excluded] = 0.0
+    if mask is not None:
+        similarities[~mask] = 0.0
+    rounded = np.round(similarities, 6)
+    candidates = np.flatnonzero(rounded > 0)
+    if len(candidates) > k:
+        kth = -np.partition(-rounded[candidates], k - 1)[k - 1]
+        candidates = candidates[rounded[candidates] >= kth]
+    order = np.lexsort((movie_ids[candidates], -rounded[candidates]))[:k]
+    return candidates[order], similarities[candidates[order]]
+
+
+# Worker process state: segment name -> (SharedMemory, array views)
+_attached = {}
+
+
+def _score_task(task):
+    name, n_movies, n_genres, lo, hi, user_vector, user_norm, k, excluded, mask = task
+    if name not in _attached:
+        while len(_attached) >= MAX_PUBLISHED:
+            _attached.pop(next(iter(_attached)))[0].close()
+        segment = shared_memory.SharedMemory(name=name)
+        _attached[name] = (segment, _views(segment.buf, n_movies, n_genres))
+    matrix, norms, movie_ids = _attached[name][1]
+    positions, similarities = shard_top_k(
+        matrix[lo:hi], norms[lo:hi], movie_ids[lo:hi], user_vector, user_norm, k, excluded, mask,
+    )
+    return positions + lo, similarities
+
+
+def _release(segment):
+    segment.close()
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class ShardedGenreScorer:
+    """Process pool scoring catalog shards against genre matrices published to shared memory."""
+
+    def __init__(self, workers, min_movies=100_000, shard_min_movies=50_000, timeout=30.0):
+        self.workers = max(1, int(workers))
+        self.min_movies = min_movies
+        self.shard_min_movies = max(1, shard_min_movies)
+        self.timeout = timeout
+        # Fork workers while the app has no other threads yet; spawned workers would
+        # re-import the entry script (and load the data) in every process
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        # Workers must share this process's resource tracker: one of their own would
+        # unlink the segments it saw them attach when the worker exits
+        resource_tracker.ensure_running()
+        self._pool = multiprocessing.get_context(method).Pool(self.workers)
+        self._lock = threading.Lock()
+        self._published = {}  # id(genre matrix) -> (matrix, SharedMemory)
+        self.tasks = 0
+        self.fallbacks = 0
+
+    def applies(self, n_movies):
+        return self._pool is not None and self.min_movies is not None and n_movies >= self.min_movies
+
+    def shards(self, n_movies):
+        """Contiguous (start, end) row ranges: one per shard_min_movies movies, at most one per worker."""
+        n_shards = max(1, min(self.workers, n_movies // self.shard_min_movies))
+        bounds = np.linspace(0, n_movies, n_shards + 1).astype(np.int64)
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def _publish(self, index):
+        """The shared-memory segment holding this genre index, creating it on first use."""
+        matrix = index['matrix']
+        with self._lock:
+            published = self._published.get(id(matrix))
+            if published is not None and published[0] is matrix:
+                return published[1]
+            n_movies, n_genres = matrix.shape
+            _, size = _layout(n_movies, n_genres)
+            segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            shared_matrix, shared_norms, shared_ids = _views(segment.buf, n_movies, n_genres)
+            shared_matrix[:] = matrix
+            shared_norms[:] = index['norms']
+            shared_ids[:] = index['movie_ids']
+            del shared_matrix, shared_norms, shared_ids
+            while len(self._published) >= MAX_PUBLISHED:
+                # Workers still mapping an older segment keep it until they detach
+                _, old = self._published.pop(next(iter(self._published)))
+                _release(old)
+            self._published[id(matrix)] = (matrix, segment)
+            logger.info(f"Published {n_movies}-movie genre matrix ({size / 1e6:.1f} MB) for sharded scoring")
+            return segment
+
+    def top_k(self, index, user_vector, user_norm, k, excluded=None, mask=None):
+        """
+        (positions, similarities) of the k best movies of the genre index
+        for a user vector, with `excluded` positions and movies outside
+        `mask` scoring 0. Returns None if the workers fail or time out.
+        """
+        n_movies, n_genres = index['matrix'].shape
+        segment = self._publish(index)
+        excluded = np.asarray(excluded if excluded is not None else [], dtype=np.int64)
+        tasks = []
+        for lo, hi in self.shards(n_movies):
+            local = excluded[(excluded >= lo) & (excluded < hi)] - lo
+            tasks.append((
+                segment.name, n_movies, n_genres, lo, hi, user_vector, user_norm, k, local,
+                mask[lo:hi] if mask is not None else None,
+            ))
+        try:
+            parts = self._pool.map_async(_score_task, tasks, chunksize=1).get(self.timeout)
+        except Exception as e:
+            self.fallbacks += 1
+            logger.warning(f"Sharded scoring failed ({e!r}); scoring inline")
+            return None
+        self.tasks += len(tasks)
+
+        positions = np.concatenate([p for p, _ in parts])
+        similarities = np.concatenate([s for _, s in parts])
+        rounded = np.round(similarities, 6)
+        order = np.lexsort((index['movie_ids'][positions], -rounded))[:k]
+        return positions[order], similarities[order]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        with self._lock:
+            for _, segment in self._published.values():
+                _release(segment)
+            self._published.clear()
+
+
+def _sharding_metrics():
+    if _scorer is None:
+        return []
+    return [
+        ('sharded_scoring_tasks_total', 'counter', 'Catalog shards scored by worker processes.',
+         [({}, _scorer.tasks)]),
+        ('sharded_scoring_fallbacks_total', 'counter', 'Sharded scorings that failed and ran inline.',
+         [({}, _scorer.fallbacks)]),
+    ]
+
+
+REGISTRY.register_collector(_sharding_metrics)
+
+
+def shutdown():
+    global _scorer
+    if _scorer is not None:
+        _scorer.close()
+        _scorer = None
+
+
+def init_app(app):
+    """
+    Start the sharded scoring pool when SHARDED_SCORING_WORKERS is set.
+
+    Call before any threads are started: the workers are forked from this process.
+    """
+    global _scorer
+    workers = app.config.get('SHARDED_SCORING_WORKERS')
+    if not workers or _scorer is not None:
+        return _scorer
+    _scorer = ShardedGenreScorer(
+        workers,
+        min_movies=app.config.get('SHARDED_SCORING_MIN_MOVIES', 100_000),
+        shard_min_movies=app.config.get('SHARD_MIN_MOVIES', 50_000),
+        timeout=app.config.get('SERVING_TIMEOUT', 30),
+    )
+    atexit.register(shutdown)
+    logger.info(f"Sharded genre scoring on {_scorer.workers} processes")
+    return _scorer
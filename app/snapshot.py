@@ -0,0 +1,266 @@
+import numpy as np
+import json
+import logging
+import os
+import shutil
+import time
+from collections import defaultdict
+from collections.abc import Mapping, Sequence
+
+from app.collaborative import UserCFModel
+from app.filters import MovieFilterIndex
+from app.item_index import ItemNeighborIndex
+from app.movie_stats import MovieStats
+from app.rating_store import IdSet, RatingStore, user_ratings_view, movie_ratings_view
+from app.search_index import SearchIndex
+from app.trending import TrendingIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 5
+MANIFEST_NAME = 'manifest.json'
+
+# Input files whose size and mtime a snapshot must match to be used
+SOURCE_KEYS = ('RATINGS_CSV', 'MOVIES_CSV', 'CACHE_RATINGS_PARQUET', 'CACHE_MOVIES_PARQUET')
+# Settings baked into the snapshot's precomputed structures, with their defaults
+PARAM_DEFAULTS = {
+    'BAYES_PRIOR_COUNT': 25, 'ITEM_NEIGHBORS': 50, 'ITEM_SHRINKAGE': 25.0, 'TRENDING_BUCKET_SECONDS': 86400,
+}
+
+STORE_FIELDS = (
+    'user_ids', 'movie_ids', 'user_indptr', 'user_movie_idx', 'user_values',
+    'movie_indptr', 'movie_user_idx', 'movie_values',
+)
+
+
+class StringArray(Sequence):
+    """Read-only list of strings packed into one UTF-8 byte array plus offsets."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def tolist(self):
+        data = self.blob.tobytes()
+        bounds = self.offsets.tolist()
+        return [data[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(len(bounds) - 1)]
+
+
+class MovieMetadataView(Mapping):
+    """Read-only movieId -> {title, genres} mapping decoded on access from packed strings."""
+
+    def __init__(self, movie_ids, titles, genres):
+        self._ids = movie_ids
+        self._titles = titles
+        self._genres = genres
+
+    def _index(self, movie_id):
+        try:
+            movie_id = int(movie_id)
+        except (TypeError, ValueError):
+            return -1
+        pos = int(np.searchsorted(self._ids, movie_id))
+        if pos < len(self._ids) and self._ids[pos] == movie_id:
+            return pos
+        return -1
+
+    def __getitem__(self, movie_id):
+        pos = self._index(movie_id)
+        if pos < 0:
+            raise KeyError(movie_id)
+        return {'title': self._titles[pos], 'genres': self._genres[pos]}
+
+    def __contains__(self, movie_id):
+        return self._index(movie_id) >= 0
+
+    def __iter__(self):
+        return iter(self._ids.tolist())
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def snapshot_sources(config):
+    """Size and mtime of each input file, as recorded in the manifest."""
+    sources = {}
+    for key in SOURCE_KEYS:
+        path = config.get(key)
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            sources[key] = [stat.st_size, stat.st_mtime_ns]
+        else:
+            sources[key] = None
+    return sources
+
+
+def snapshot_params(config):
+    return {key: config.get(key, default) for key, default in PARAM_DEFAULTS.items()}
+
+
+def _bundle_arrays(data):
+    """Arrays (and string lists) to persist, grouped by bundle component."""
+    store = data['rating_store']
+    metadata = data['movie_metadata']
+    metadata_ids = np.array(sorted(metadata), dtype=np.int32)
+    genre_index = data['genre_index']
+    stats = data['movie_stats']
+    item_index = data['item_index']
+    groups = {
+        'store': {name: getattr(store, name) for name in STORE_FIELDS},
+        'metadata': {
+            'movie_ids': metadata_ids,
+            'titles': [metadata[m]['title'] for m in metadata_ids.tolist()],
+            'genres': [metadata[m]['genres'] for m in metadata_ids.tolist()],
+        },
+        'genre_index': {
+            'genres': list(genre_index['genres']),
+            'movie_ids': genre_index['movie_ids'],
+            'matrix': genre_index['matrix'],
+            'norms': genre_index['norms'],
+        },
+        'movie_stats': {'counts': stats.counts, 'sums': stats.sums},
+        'user_cf': data['user_cf'].to_arrays(),
+        'item_index': {
+            'movie_ids': item_index.movie_ids,
+            'neighbors': item_index.neighbors,
+            'similarities': item_index.similarities,
+        },
+        'search_index': data['search_index'].to_arrays(),
+        'history': {'order': data['history_order']},
+        'filters': data['movie_filters'].to_arrays(),
+    }
+    if data.get('trending') is not None:
+        groups['trending'] = data['trending'].to_arrays()
+    return groups
+
+
+def save_snapshot(data, path, config):
+    """
+    Write the bundle's arrays as .npy files plus a manifest.
+
+    The snapshot is written to a temporary directory and renamed into place, so
+    readers never see a partial snapshot. Processes that already mapped the old
+    files keep using them until they reload.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    arrays, strings = [], []
+    for group, fields in _bundle_arrays(data).items():
+        for name, value in fields.items():
+            key = f'{group}.{name}'
+            if isinstance(value, (list, StringArray)):
+                packed = value if isinstance(value, StringArray) else StringArray.from_list(value)
+                np.save(os.path.join(tmp_path, f'{key}.blob.npy'), packed.blob)
+                np.save(os.path.join(tmp_path, f'{key}.offsets.npy'), packed.offsets)
+                strings.append(key)
+            else:
+                np.save(os.path.join(tmp_path, f'{key}.npy'), np.ascontiguousarray(value))
+                arrays.append(key)
+
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'data_version': data['version'],
+        'created': time.time(),
+        'sources': snapshot_sources(config),
+        'params': snapshot_params(config),
+        'arrays': arrays,
+        'strings': strings,
+    }
+    with open(os.path.join(tmp_path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    old_path = None
+    if os.path.exists(path):
+        old_path = f"{path}.old-{os.getpid()}"
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    if old_path:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_snapshot(path, config):
+    """
+    Open a snapshot with memory-mapped arrays and rebuild the data bundle around them.
+
+    Returns None if there is no snapshot, or it was written by another format
+    version, from different input files or with different parameters.
+    """
+    manifest_path = os.path.join(path, MANIFEST_NAME) if path else None
+    if not manifest_path or not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        logger.info(f"Ignoring snapshot in {path}: format version {manifest.get('format_version')}")
+        return None
+    if manifest.get('sources') != snapshot_sources(config):
+        logger.info(f"Ignoring snapshot in {path}: input files changed")
+        return None
+    if manifest.get('params') != snapshot_params(config):
+        logger.info(f"Ignoring snapshot in {path}: parameters changed")
+        return None
+
+    groups = defaultdict(dict)
+    for key in manifest['arrays']:
+        group, name = key.split('.', 1)
+        # Plain ndarray views of the mapping; np.memmap adds overhead to every slice
+        groups[group][name] = np.asarray(np.load(os.path.join(path, f'{key}.npy'), mmap_mode='r'))
+    for key in manifest['strings']:
+        group, name = key.split('.', 1)
+        groups[group][name] = StringArray(
+            np.asarray(np.load(os.path.join(path, f'{key}.blob.npy'), mmap_mode='r')),
+            np.asarray(np.load(os.path.join(path, f'{key}.offsets.npy'), mmap_mode='r')),
+        )
+    return _bundle_from_arrays(groups, manifest)
+
+
+def _bundle_from_arrays(groups, manifest):
+    store = RatingStore(**groups['store'])
+
+    metadata = groups['metadata']
+    movie_metadata = MovieMetadataView(metadata['movie_ids'], metadata['titles'], metadata['genres'])
+
+    genre_index = dict(groups['genre_index'])
+    genre_index['genres'] = genre_index['genres'].tolist()
+    genre_index['genre_to_col'] = {genre: i for i, genre in enumerate(genre_index['genres'])}
+
+    item = groups['item_index']
+    return {
+        'version': manifest['data_version'],
+        'rating_store': store,
+        'user_ratings': user_ratings_view(store),
+        'movie_ratings': movie_ratings_view(store),
+        'movie_metadata': movie_metadata,
+        'user_ids': IdSet(store.user_ids),
+        'movie_ids': IdSet(store.movie_ids),
+        'genre_index': genre_index,
+        'movie_stats': MovieStats(
+            store.movie_ids, groups['movie_stats']['counts'], groups['movie_stats']['sums'],
+            manifest['params']['BAYES_PRIOR_COUNT'],
+        ),
+        'user_cf': UserCFModel.from_arrays(store, groups['user_cf']),
+        'search_index': SearchIndex.from_arrays(groups['search_index']),
+        'item_index': ItemNeighborIndex(item['movie_ids'], item['neighbors'], item['similarities']),
+        'history_order': groups['history']['order'],
+        'movie_filters': MovieFilterIndex.from_arrays(groups['filters']),
+        'trending': TrendingIndex.from_arrays(groups['trending']) if 'trending' in groups else None,
+    }
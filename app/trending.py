@@ -0,0 +1,159 @@
+"""
+Time-bucketed per-movie rating aggregates for trending lists.
+
+Ratings are counted per movie in fixed buckets (a day or a week of rating
+timestamps) and stored as a sparse buckets x movies matrix in CSR layout:
+row b holds the movies rated in bucket first_bucket + b, with their rating
+count and sum. A trending query slices the rows inside its window, weights
+each row by its age and sums per movie with one bincount, so its cost
+depends on the activity inside the window, not on the total number of
+ratings.
+"""
+import numpy as np
+
+DAY_SECONDS = 86400
+
+
+class TrendingIndex:
+    """Rating counts and sums per (time bucket, movie), aligned with RatingStore.movie_ids."""
+
+    def __init__(self, bucket_seconds, n_movies, first_bucket, indptr, movie_idx, counts, sums):
+        self.bucket_seconds = int(bucket_seconds)
+        self.n_movies = int(n_movies)
+        self.first_bucket = int(first_bucket)
+        self.indptr = indptr
+        self.movie_idx = movie_idx
+        self.counts = counts
+        self.sums = sums
+
+    @classmethod
+    def from_ratings(cls, movie_idx, timestamps, ratings, n_movies, bucket_seconds=DAY_SECONDS):
+        """Aggregate ratings given as store movie positions, Unix timestamps and values."""
+        buckets = np.asarray(timestamps, dtype=np.int64) // bucket_seconds
+        return cls._aggregate(
+            bucket_seconds, n_movies, buckets, np.asarray(movie_idx, dtype=np.int64),
+            np.ones(len(buckets), dtype=np.int64), np.asarray(ratings, dtype=np.float64),
+        )
+
+    @classmethod
+    def _aggregate(cls, bucket_seconds, n_movies, buckets, movie_idx, counts, sums):
+        if len(buckets) == 0:
+            empty = np.zeros(0, dtype=np.int32)
+            return cls(bucket_seconds, n_movies, 0, np.zeros(1, dtype=np.int64), empty,
+                       empty.astype(np.uint32), empty.astype(np.float32))
+        first = int(buckets.min())
+        n_buckets = int(buckets.max()) - first + 1
+        # One key per (bucket, movie), sorted bucket-major: the CSR order
+        keys, inverse = np.unique((buckets - first) * n_movies + movie_idx, return_inverse=True)
+        rows = keys // n_movies
+        indptr = np.zeros(n_buckets + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_buckets), out=indptr[1:])
+        return cls(
+            bucket_seconds, n_movies, first, indptr,
+            (keys % n_movies).astype(np.int32),
+            np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.uint32),
+            np.bincount(inverse, weights=sums, minlength=len(keys)).astype(np.float32),
+        )
+
+    def merged(self, movie_idx, timestamps, ratings):
+        """A new index with more ratings added (e.g. those merged by a compaction)."""
+        rows = np.repeat(np.arange(self.n_buckets, dtype=np.int64), np.diff(self.indptr))
+        buckets = np.concatenate([rows + self.first_bucket, np.asarray(timestamps, dtype=np.int64) // self.bucket_seconds])
+        return self._aggregate(
+            self.bucket_seconds, self.n_movies, buckets,
+            np.concatenate([self.movie_idx.astype(np.int64), np.asarray(movie_idx, dtype=np.int64)]),
+            np.concatenate([self.counts.astype(np.int64), np.ones(len(movie_idx), dtype=np.int64)]),
+            np.concatenate([self.sums.astype(np.float64), np.asarray(ratings, dtype=np.float64)]),
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(
+            int(arrays['params'][0]), int(arrays['params'][1]), int(arrays['params'][2]),
+            arrays['indptr'], arrays['movie_idx'], arrays['counts'], arrays['sums'],
+        )
+
+    def to_arrays(self):
+        return {
+            'params': np.array([self.bucket_seconds, self.n_movies, self.first_bucket], dtype=np.int64),
+            'indptr': self.indptr,
+            'movie_idx': self.movie_idx,
+            'counts': self.counts,
+            'sums': self.sums,
+        }
+
+    @property
+    def n_buckets(self):
+        return len(self.indptr) - 1
+
+    @property
+    def last_timestamp(self):
+        """End of the newest bucket, or None if the index is empty."""
+        if self.n_buckets == 0:
+            return None
+        return (self.first_bucket + self.n_buckets) * self.bucket_seconds
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.movie_idx.nbytes + self.counts.nbytes + self.sums.nbytes
+
+    def window(self, end, window_seconds, half_life_seconds=None, pending=None):
+        """
+        Per-movie (decayed count, decayed rating sum, rating count) over the
+        buckets in (end - window_seconds, end].
+
+        A rating in a bucket ending `age` seconds before `end` counts
+        0.5 ** (age / half_life_seconds); without a half-life every rating in
+        the window counts 1. `pending` adds ratings not yet in the index,
+        already aggregated as (buckets, movie positions, rating counts,
+        rating sums) arrays with this index's bucket_seconds.
+        """
+        end_bucket = (int(end) - 1) // self.bucket_seconds
+        start_bucket = end_bucket - max(int(np.ceil(window_seconds / self.bucket_seconds)), 1) + 1
+        lo_row = min(max(start_bucket - self.first_bucket, 0), self.n_buckets)
+        hi_row = min(max(end_bucket - self.first_bucket + 1, 0), self.n_buckets)
+
+        lo, hi = self.indptr[lo_row], self.indptr[hi_row]
+        buckets = np.repeat(np.arange(lo_row, hi_row, dtype=np.int64) + self.first_bucket,
+                            np.diff(self.indptr[lo_row:hi_row + 1]))
+        movies, counts, sums = self.movie_idx[lo:hi], self.counts[lo:hi], self.sums[lo:hi]
+        if pending is not None and len(pending[0]):
+            pending_buckets = np.asarray(pending[0], dtype=np.int64)
+            keep = (pending_buckets >= start_bucket) & (pending_buckets <= end_bucket)
+            buckets = np.concatenate([buckets, pending_buckets[keep]])
+            movies = np.concatenate([movies, np.asarray(pending[1], dtype=np.int32)[keep]])
+            counts = np.concatenate([counts, np.asarray(pending[2], dtype=np.uint32)[keep]])
+            sums = np.concatenate([sums, np.asarray(pending[3], dtype=np.float32)[keep]])
+
+        if half_life_seconds:
+            # Ages are measured bucket to bucket, so a whole bucket shares one weight
+            weights = 0.5 ** ((end_bucket - buckets) * (self.bucket_seconds / half_life_seconds))
+        else:
+            weights = np.ones(len(buckets))
+        raw = np.bincount(movies, weights=counts, minlength=self.n_movies)
+        decayed = np.bincount(movies, weights=counts * weights, minlength=self.n_movies)
+        decayed_sums = np.bincount(movies, weights=sums * weights, minlength=self.n_movies)
+        return decayed, decayed_sums, raw.astype(np.int64)
+
+
+def trending(index, end, window_seconds, half_life_seconds=None, limit=10, min_count=1, mask=None, pending=None):
+    """
+    Positions of the top movies by decayed rating count in the window, best
+    first (ties by decayed mean rating, then position), with the window's
+    (decayed counts, decayed sums, counts). Movies whose weights all
+    underflow to 0 (a half-life far shorter than their age) are skipped.
+    """
+    decayed, decayed_sums, counts = index.window(end, window_seconds, half_life_seconds, pending)
+    eligible = (counts >= max(min_count, 1)) & (decayed > 0)
+    if mask is not None:
+        eligible &= mask
+    candidates = np.flatnonzero(eligible)
+    if limit <= 0:
+        candidates = candidates[:0]
+    elif len(candidates) > limit:
+        # Keep everything tied with the limit-th score so the tie-breaks stay exact
+        kth = -np.partition(-decayed[candidates], limit - 1)[limit - 1]
+        candidates = candidates[decayed[candidates] >= kth]
+    means = decayed_sums[candidates] / decayed[candidates]
+    order = np.lexsort((candidates, -np.round(means, 6), -np.round(decayed[candidates], 6)))
+    return candidates[order[:limit]], (decayed, decayed_sums, counts)
@@ -0,0 +1,39 @@
+"""
+ASGI entry point for production serving:
+
+    pip install -r requirements-serving.txt
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Data is loaded on a background thread while the server starts accepting
+connections; /readyz returns 200 once it is in, and SIGHUP or POST
+/admin/reload swaps in freshly loaded data without a restart. Run a single
+uvicorn worker per process: the compute pool already spreads scoring over the
+cores, and with a snapshot (SNAPSHOT_DIR) extra processes share the
+memory-mapped data.
+"""
+import logging
+
+from app import create_app, lifecycle, sharding
+from app.serving import AsgiApp
+
+logging.basicConfig(level=logging.INFO)
+
+flask_app = create_app()
+lifecycle.install_signal_handler(flask_app)
+
+
+def _shutdown():
+    ingestor = flask_app.config.get('ingestor')
+    if ingestor is not None:
+        ingestor.stop()
+    pool = flask_app.config.get('compute_pool')
+    if pool is not None:
+        pool.shutdown()
+    sharding.shutdown()
+
+
+app = AsgiApp(
+    flask_app,
+    threads=flask_app.config.get('SERVING_THREADS', 64),
+    on_shutdown=_shutdown,
+)
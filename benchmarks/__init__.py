@@ -0,0 +1 @@
+"""Synthetic datasets and performance benchmarks (python -m benchmarks.run)."""
@@ -0,0 +1,640 @@
+#!/usr/bin/env python3
+"""
+Load-test the HTTP API with scripted user sessions at stepped concurrency
+and write throughput and latency percentiles per endpoint as JSON.
+
+Each virtual user runs sessions of a scenario picked from the mix, back to
+back, over keep-alive connections (up to six at a time, like a browser):
+
+  rate_and_recommend  the web page: top movies on focus, debounced
+                      search-as-you-type, movie details of every rated
+                      movie, then /api/custom-recommendations
+  returning_user      /api/recommendations, /api/user-history and similar movies
+  browse              /api/top-movies in each ranking mode, /api/trending,
+                      movie details
+
+Sessions honor Cache-Control and revalidate with If-None-Match like a
+browser (--no-http-cache turns that off). A custom scenario is a
+module:function coroutine taking (session, rng, catalog). Movie titles and
+user IDs are read from the target itself, so any deployment can be tested.
+
+Without --url the app is started locally in its own process (--serve flask
+or asgi, the latter needs requirements-serving.txt), optionally on a
+synthetic dataset (--scale) and with config overrides (--set
+SERVING_WORKERS=0). With
+--baseline, p50/p95/p99 and throughput are compared against an earlier run.
+
+Usage: python -m benchmarks.loadtest [--url http://host:5001] [--concurrency 1,8,32]
+       [--duration 30] [--mix rate_and_recommend=3,returning_user=1]
+       [--output loadtest.json] [--baseline old.json]
+"""
+import argparse
+import ast
+import asyncio
+import gzip
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+# Run from project root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run import DEFAULT_DATA_DIR, DEFAULT_THRESHOLD, dataset_dir, environment, load_config, summarize
+from benchmarks.synthetic import SCALES, dataset_params, ensure_dataset
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = (1, 4, 16, 64)
+DEFAULT_MIX = 'rate_and_recommend=3,returning_user=1,browse=1'
+MAX_CONNECTIONS = 6          # Per session, as browsers allow per host
+SEARCH_DEBOUNCE = 0.3        # Seconds the page waits after a keystroke before searching
+SEARCH_MIN_CHARS = 2         # The page does not search shorter queries
+MAX_CUSTOM_RATINGS = 5       # The page accepts at most this many ratings
+TITLE_YEAR = re.compile(r'\s*\(\d{4}(?:\s*[-–]\s*\d{4})?\)\s*$')
+TITLE_ARTICLE = re.compile(r', (The|A|An)$')
+MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class HttpConnection:
+    """One HTTP/1.1 keep-alive connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, headers, body=b''):
+        """(status, response headers, body) of one request."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        if body or method == 'POST':
+            lines.append(f'Content-Length: {len(body)}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by the server')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if status in (204, 304) or method == 'HEAD':
+            data = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await self.reader.read()
+            self.close()
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, response_headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Recorder:
+    """Latency and status samples per endpoint, kept for requests inside the measured window."""
+
+    def __init__(self):
+        self.window = (float('inf'), float('inf'))
+        self.samples = defaultdict(list)   # endpoint -> [seconds]
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.browser_cache_hits = defaultdict(int)
+        self.started = 0
+
+    def start(self, now):
+        if self.window[0] <= now <= self.window[1]:
+            self.started += 1
+
+    def add(self, endpoint, start, seconds, status):
+        if start < self.window[0] or start + seconds > self.window[1]:
+            return
+        self.samples[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    def add_cache_hit(self, endpoint, now):
+        if self.window[0] <= now <= self.window[1]:
+            self.browser_cache_hits[endpoint] += 1
+
+    def report(self):
+        seconds = self.window[1] - self.window[0]
+        endpoints = {}
+        for endpoint in sorted(self.samples):
+            samples = self.samples[endpoint]
+            statuses = self.statuses[endpoint]
+            errors = sum(n for status, n in statuses.items() if not 200 <= status < 400)
+            endpoints[endpoint] = dict(
+                summarize(samples),
+                throughput_rps=round(len(samples) / seconds, 2),
+                errors=errors,
+                statuses={str(status): n for status, n in sorted(statuses.items())},
+                browser_cache_hits=self.browser_cache_hits.get(endpoint, 0),
+            )
+        every = [s for samples in self.samples.values() for s in samples]
+        overall = dict(
+            summarize(every) if every else {'calls': 0},
+            throughput_rps=round(len(every) / seconds, 2),
+            errors=sum(e['errors'] for e in endpoints.values()),
+            # Started in the window but not answered by its end (slower than the rest of the window)
+            unfinished=self.started - len(every),
+        )
+        return {'seconds': round(seconds, 3), 'overall': overall, 'endpoints': endpoints}
+
+
+class Session:
+    """
+    One browser session: a small pool of keep-alive connections and an HTTP
+    cache honoring max-age and ETags.
+    """
+
+    def __init__(self, host, port, recorder, timeout=30.0, think_scale=1.0, http_cache=True):
+        self.host = host
+        self.port = port
+        self.recorder = recorder
+        self.timeout = timeout
+        self.think_scale = think_scale
+        self.http_cache = http_cache
+        self._idle = []
+        self._open = []
+        self._slots = asyncio.Semaphore(MAX_CONNECTIONS)
+        self._cache = {}  # path -> (fresh until, ETag, body)
+
+    async def think(self, seconds):
+        if seconds > 0 and self.think_scale > 0:
+            await asyncio.sleep(seconds * self.think_scale)
+
+    async def get(self, path, endpoint):
+        return await self.request('GET', path, endpoint)
+
+    async def post(self, path, endpoint, payload):
+        return await self.request('POST', path, endpoint, payload)
+
+    async def request(self, method, path, endpoint, payload=None):
+        """The decoded JSON body (None on errors), recording the latency under `endpoint`."""
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        cached = self._cache.get(path) if method == 'GET' and self.http_cache else None
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self.recorder.add_cache_hit(endpoint, time.monotonic())
+                return json.loads(cached[2])
+            if cached[1]:
+                headers['If-None-Match'] = cached[1]
+        body = b''
+        if payload is not None:
+            body = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else self._connect()
+            start = time.monotonic()
+            self.recorder.start(start)
+            try:
+                status, response_headers, data = await asyncio.wait_for(
+                    connection.request(method, path, headers, body), self.timeout,
+                )
+            except asyncio.CancelledError:
+                connection.close()
+                raise
+            except Exception as e:
+                connection.close()
+                logger.debug(f"{method} {path} failed: {e!r}")
+                self.recorder.add(endpoint, start, time.monotonic() - start, 0)
+                self._idle.append(connection)
+                return None
+            self.recorder.add(endpoint, start, time.monotonic() - start, status)
+            self._idle.append(connection)
+
+        if status == 304 and cached is not None:
+            data = cached[2]
+        elif response_headers.get('content-encoding') == 'gzip':
+            data = gzip.decompress(data)
+        if status not in (200, 304):
+            return None
+        if self.http_cache and method == 'GET':
+            max_age = MAX_AGE.search(response_headers.get('cache-control', ''))
+            etag = response_headers.get('etag')
+            if max_age or etag:
+                fresh_until = time.monotonic() + (int(max_age.group(1)) if max_age else 0)
+                self._cache[path] = (fresh_until, etag, data)
+        return json.loads(data) if data else None
+
+    def _connect(self):
+        connection = HttpConnection(self.host, self.port)
+        self._open.append(connection)
+        return connection
+
+    def close(self):
+        for connection in self._open:
+            connection.close()
+
+
+def search_query(title, rng):
+    """What a user types for a title: its words without the year or a trailing article."""
+    name = TITLE_ARTICLE.sub('', TITLE_YEAR.sub('', title)).lower()
+    return name[:rng.randint(min(3, len(name)), max(min(len(name), 14), 1))]
+
+
+async def rate_and_recommend(session, rng, catalog):
+    """The web page: rate a few movies found through top movies or search, then get recommendations."""
+    ratings = {}
+    for _ in range(rng.randint(1, MAX_CUSTOM_RATINGS)):
+        # Focusing the empty search box shows the top movies
+        top = await session.get('/api/top-movies?limit=10', '/api/top-movies')
+        await session.think(rng.uniform(0.5, 2.0))
+        if top and top.get('movies') and rng.random() < 0.3:
+            movie_id = rng.choice(top['movies'])['movieId']
+        else:
+            movie_id = await _type_search(session, rng, catalog)
+        if movie_id is None or movie_id in ratings:
+            continue
+        await session.think(rng.uniform(1.0, 3.0))
+        ratings[movie_id] = round(rng.uniform(0.5, 5.0) * 2) / 2
+        # The rating list reloads the details of every rated movie
+        await asyncio.gather(*(
+            session.get(f'/api/movies/{m}', '/api/movies/<id>') for m in ratings
+        ))
+    if ratings:
+        await session.think(rng.uniform(0.5, 2.0))
+        await session.post('/api/custom-recommendations', '/api/custom-recommendations', {
+            'ratings': [{'movieId': m, 'rating': r} for m, r in ratings.items()],
+        })
+
+
+async def _type_search(session, rng, catalog):
+    """Type a title key by key; a pause of SEARCH_DEBOUNCE sends the prefix typed so far."""
+    title, movie_id = rng.choice(catalog['titles'])
+    query = search_query(title, rng)
+    searches = []
+    for i in range(1, len(query) + 1):
+        # Mostly quick keystrokes, now and then a pause long enough to fire a search
+        gap = rng.uniform(0.35, 1.0) if rng.random() < 0.15 else rng.uniform(0.06, 0.25)
+        if i == len(query):
+            gap = max(gap, SEARCH_DEBOUNCE)
+        if gap >= SEARCH_DEBOUNCE and len(query[:i].strip()) >= SEARCH_MIN_CHARS:
+            await session.think(SEARCH_DEBOUNCE)
+            path = '/api/search-movies?' + urllib.parse.urlencode({'q': query[:i].strip(), 'limit': 10})
+            searches.append(asyncio.ensure_future(session.get(path, '/api/search-movies')))
+            await session.think(gap - SEARCH_DEBOUNCE)
+        else:
+            await session.think(gap)
+    results = await asyncio.gather(*searches)
+    movies = (results[-1] or {}).get('movies') if results else None
+    if movies:
+        return next((m['movieId'] for m in movies if m['movieId'] == movie_id), movies[0]['movieId'])
+    return None
+
+
+async def returning_user(session, rng, catalog):
+    """An existing user's recommendations, rating history and movies similar to a recommendation."""
+    if not catalog['users']:
+        return
+    user_id = rng.choice(catalog['users'])
+    recommendations = await session.get(f'/api/recommendations?userId={user_id}&limit=10', '/api/recommendations')
+    await session.think(rng.uniform(1.0, 4.0))
+    await session.get(f'/api/user-history?userId={user_id}&limit=20', '/api/user-history')
+    recommended = (recommendations or {}).get('recommendations') or []
+    if recommended:
+        await session.think(rng.uniform(1.0, 4.0))
+        movie_id = rng.choice(recommended)['movieId']
+        await session.get(f'/api/movies/{movie_id}/similar?limit=10', '/api/movies/<id>/similar')
+
+
+async def browse(session, rng, catalog):
+    """Top lists in each ranking mode, trending and the details of a few listed movies."""
+    listed = []
+    for mode in rng.sample(['average', 'bayesian', 'count'], rng.randint(1, 3)):
+        top = await session.get(f'/api/top-movies?limit=50&mode={mode}', '/api/top-movies')
+        listed += [m['movieId'] for m in (top or {}).get('movies', [])]
+        await session.think(rng.uniform(1.0, 3.0))
+    if catalog['trending']:
+        trending = await session.get('/api/trending?limit=10', '/api/trending')
+        listed += [m['movieId'] for m in (trending or {}).get('movies', [])]
+        await session.think(rng.uniform(1.0, 3.0))
+    for movie_id in rng.sample(listed, min(len(listed), rng.randint(1, 3))):
+        await session.get(f'/api/movies/{movie_id}', '/api/movies/<id>')
+        await session.think(rng.uniform(0.5, 2.0))
+
+
+SCENARIOS = {
+    'rate_and_recommend': rate_and_recommend,
+    'returning_user': returning_user,
+    'browse': browse,
+}
+
+
+def resolve_scenario(name):
+    """A built-in scenario, or a module:function coroutine taking (session, rng, catalog)."""
+    if name in SCENARIOS:
+        return SCENARIOS[name]
+    if ':' in name:
+        module, function = name.split(':', 1)
+        return getattr(importlib.import_module(module), function)
+    raise ValueError(f"Unknown scenario '{name}' (built in: {', '.join(SCENARIOS)})")
+
+
+def parse_mix(spec):
+    """[(name, scenario, weight)] from 'name=weight,name,...' (weight 1 by default)."""
+    mix = []
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.strip().rpartition('=') if '=' in part else (part.strip(), '', '1')
+        mix.append((name, resolve_scenario(name), float(weight)))
+    if not mix:
+        raise ValueError('The scenario mix is empty')
+    return mix
+
+
+def fetch_json(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def discover(base_url, n_users=1000):
+    """Titles, user IDs and trending availability of the target, for the scenarios to draw from."""
+    titles = {}
+    for mode in ('count', 'bayesian', 'average'):
+        top = fetch_json(f'{base_url}/api/top-movies?limit=50&min_count=1&mode={mode}')
+        for movie in top['movies']:
+            titles[movie['movieId']] = movie['title']
+    users = fetch_json(f'{base_url}/api/users?limit={n_users}').get('users', [])
+    try:
+        fetch_json(f'{base_url}/api/trending?limit=1')
+        trending = True
+    except urllib.error.HTTPError:
+        trending = False
+    if not titles:
+        raise RuntimeError(f'{base_url} has no movies to search for')
+    return {'titles': [(title, movie_id) for movie_id, title in titles.items()], 'users': users, 'trending': trending}
+
+
+async def run_step(host, port, mix, catalog, concurrency, duration, warmup, seed, **session_args):
+    """Run `concurrency` virtual users for warmup + duration seconds and report the measured window."""
+    recorder = Recorder()
+    names, scenarios, weights = zip(*mix)
+    sessions = defaultdict(int)
+
+    async def user(index):
+        rng = random.Random(seed * 1_000_003 + concurrency * 1009 + index)
+        while True:
+            i = rng.choices(range(len(scenarios)), weights)[0]
+            session = Session(host, port, recorder, **session_args)
+            try:
+                await scenarios[i](session, rng, catalog)
+                if recorder.window[0] <= time.monotonic() <= recorder.window[1]:
+                    sessions[names[i]] += 1
+            finally:
+                session.close()
+            # Let the other users run even if a scenario had nothing to wait for
+            await asyncio.sleep(0)
+
+    start = time.monotonic()
+    recorder.window = (start + warmup, start + warmup + duration)
+    tasks = [asyncio.ensure_future(user(i)) for i in range(concurrency)]
+    done, _ = await asyncio.wait(tasks, timeout=warmup + duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for task in done:
+        # A scenario raising (other than on cancellation) is a bug in the scenario
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return dict(recorder.report(), sessions=dict(sessions))
+
+
+def _serve(kind, port, data_dir, overrides):
+    """Run the app on 127.0.0.1:port. Runs in its own process."""
+    logging.basicConfig(level=logging.WARNING)
+    # Werkzeug logs every request at INFO on its own handler
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    from app import create_app
+
+    app = create_app(load=False)
+    if data_dir:
+        app.config.update(load_config(data_dir))
+    app.config.update(overrides)
+    app.config['data_lifecycle'].start()
+    if kind == 'asgi':
+        import uvicorn
+        from app.serving import AsgiApp
+        uvicorn.run(AsgiApp(app, threads=app.config.get('SERVING_THREADS', 64)),
+                    host='127.0.0.1', port=port, log_level='warning')
+    else:
+        from werkzeug.serving import make_server
+        make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(base_url, process, timeout):
+    """Poll /readyz until the served app has loaded its data."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and not process.is_alive():
+            raise RuntimeError(f'The app exited with code {process.exitcode}')
+        try:
+            with urllib.request.urlopen(f'{base_url}/readyz', timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'{base_url} was not ready after {timeout}s')
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Relative change of latency percentiles and throughput for every endpoint
+    at every concurrency level present in both runs. Positive latency changes
+    are slower, negative throughput changes are fewer requests per second.
+    """
+    comparison = {}
+    regressions = []
+    for level, step in results['steps'].items():
+        base_step = baseline.get('steps', {}).get(level)
+        if not base_step:
+            continue
+        for endpoint, current in dict(step['endpoints'], overall=step['overall']).items():
+            previous = base_step['overall'] if endpoint == 'overall' else base_step['endpoints'].get(endpoint)
+            if not previous:
+                continue
+            entry = {}
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+                if previous.get(metric) and current.get(metric) is not None:
+                    entry[metric] = round(current[metric] / previous[metric] - 1, 4)
+            comparison.setdefault(level, {})[endpoint] = entry
+            if entry.get('p95_ms', 0) > threshold:
+                regressions.append(f"c={level} {endpoint} p95_ms {entry['p95_ms']:+.1%}")
+            if endpoint == 'overall' and entry.get('throughput_rps', 0) < -threshold:
+                regressions.append(f"c={level} throughput {entry['throughput_rps']:+.1%}")
+    return comparison, regressions
+
+
+def parse_overrides(pairs):
+    """App config overrides from KEY=VALUE strings (values as Python literals, else strings)."""
+    overrides = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            overrides[key.strip()] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[key.strip()] = value
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default=None, help='server to test; without it the app is started locally')
+    parser.add_argument('--serve', choices=('flask', 'asgi'), default='flask',
+                        help='how to start the local app: threaded Werkzeug server or asgi.py under uvicorn')
+    parser.add_argument('--scale', default=None,
+                        help=f"serve a synthetic dataset ({', '.join(SCALES)} or a rating count) instead of ratings.csv")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='where synthetic datasets are kept')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='app config override for the local app (repeatable)')
+    parser.add_argument('--concurrency', default=','.join(map(str, DEFAULT_CONCURRENCY)),
+                        help='comma-separated virtual user counts, run in order')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per concurrency level')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds before each level')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='scenario weights, e.g. rate_and_recommend=3,returning_user=1 (or module:function)')
+    parser.add_argument('--think-scale', type=float, default=1.0,
+                        help='multiplier of think and typing times (0 sends requests back to back)')
+    parser.add_argument('--no-http-cache', action='store_true',
+                        help='ignore Cache-Control and ETags instead of caching like a browser')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds before a request counts as failed')
+    parser.add_argument('--ready-timeout', type=float, default=600, help='seconds to wait for the local app to load')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the sessions and the synthetic dataset')
+    parser.add_argument('--output', default='loadtest_results.json', help='JSON file to write')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative p95 increase or throughput drop reported as a regression')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    mix = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    overrides = parse_overrides(args.set)
+    process = None
+    target = {'url': args.url}
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        data_dir = None
+        if args.scale:
+            scale = args.scale.strip().lower()
+            params = dataset_params(scale) if scale in SCALES else dataset_params(n_ratings=int(float(scale)), seed=args.seed)
+            params['seed'] = args.seed
+            data_dir = dataset_dir(args.data_dir, params)
+            target['dataset'] = ensure_dataset(data_dir, params)['actual']
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        target.update(url=base_url, serve=args.serve, scale=args.scale, config=overrides)
+        # Spawned, so the server neither shares this process's GIL nor inherits its state
+        process = multiprocessing.get_context('spawn').Process(
+            target=_serve, args=(args.serve, port, data_dir, overrides), daemon=True,
+        )
+        process.start()
+        logger.info(f"Started the {args.serve} app at {base_url}; waiting for its data")
+
+    try:
+        wait_ready(base_url, process, args.ready_timeout)
+        catalog = discover(base_url)
+        parsed = urllib.parse.urlsplit(base_url)
+        host, port = parsed.hostname, parsed.port or 80
+        results = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': environment(),
+            'target': target,
+            'settings': {
+                'concurrency': levels, 'duration': args.duration, 'warmup': args.warmup,
+                'mix': {name: weight for name, _, weight in mix}, 'think_scale': args.think_scale,
+                'http_cache': not args.no_http_cache, 'timeout': args.timeout, 'seed': args.seed,
+            },
+            'steps': {},
+        }
+        for level in levels:
+            logger.info(f"{level} virtual users for {args.warmup:g}s + {args.duration:g}s")
+            step = asyncio.run(run_step(
+                host, port, mix, catalog, level, args.duration, args.warmup, args.seed,
+                timeout=args.timeout, think_scale=args.think_scale, http_cache=not args.no_http_cache,
+            ))
+            results['steps'][str(level)] = step
+            overall = step['overall']
+            if overall['calls']:
+                logger.info(f"  {overall['throughput_rps']:.1f} req/s, p50 {overall['p50_ms']:.1f}ms "
+                            f"p95 {overall['p95_ms']:.1f}ms p99 {overall['p99_ms']:.1f}ms, {overall['errors']} errors")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results['baseline'] = {'path': args.baseline, 'created': baseline.get('created'),
+                               'target': baseline.get('target'), 'environment': baseline.get('environment')}
+        if (baseline.get('target') or {}).get('dataset') != target.get('dataset'):
+            logger.warning("The baseline was run against a different dataset; latencies may not be comparable")
+        results['comparison'], regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        exit_code = 1 if regressions else 0
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for level, step in results['steps'].items():
+        print(f"concurrency {level}: {step['overall']['throughput_rps']:.1f} req/s, "
+              f"{step['overall']['errors']} errors, {step['overall']['unfinished']} unfinished, "
+              f"sessions {step['sessions']}")
+        for endpoint, bench in dict(step['endpoints'], overall=step['overall']).items():
+            if not bench.get('calls'):
+                continue
+            print(f"  {endpoint:<30} {bench['calls']:>7} req {bench['throughput_rps']:>8.1f}/s  "
+                  f"p50 {bench['p50_ms']:>9.2f}ms  p95 {bench['p95_ms']:>9.2f}ms  p99 {bench['p99_ms']:>9.2f}ms  "
+                  f"errors {bench['errors']}")
+    print(f"Results written to {args.output}")
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
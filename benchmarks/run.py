@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Time load_data, custom recommendations, search and top movies on synthetic
+datasets and write the results as JSON.
+
+Each scale runs in a fresh process so timings and memory figures do not leak
+between scales. Latencies are measured without tracing; peak memory comes from
+a separate tracemalloc pass over the same calls. With --baseline, medians and
+peaks are compared against an earlier results file.
+
+Usage: python -m benchmarks.run [--scales 100k,1m] [--output results.json] [--baseline old.json]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# Run from project root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import SCALES, dataset_params, ensure_dataset
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'movie_recommender_bench')
+DEFAULT_SCALES = ('100k', '1m', '10m', '25m')
+DEFAULT_THRESHOLD = 0.15  # Relative slowdown or memory growth reported as a regression
+CUSTOM_RATINGS_PER_SET = 5
+
+
+def summarize(seconds):
+    """Latency summary in milliseconds."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    return {
+        'calls': len(ms),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'min_ms': round(float(ms.min()), 4),
+        'max_ms': round(float(ms.max()), 4),
+    }
+
+
+def time_calls(fn, inputs, warmup=5):
+    for args in inputs[:warmup]:
+        fn(*args)
+    durations = []
+    for args in inputs:
+        start = time.perf_counter()
+        fn(*args)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def traced_peak_mb(fn, inputs):
+    """Peak traced allocation, in MB, while running fn over inputs."""
+    tracemalloc.start()
+    try:
+        for args in inputs:
+            fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1e6, 2)
+
+
+def max_rss_mb():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1e6 if sys.platform == 'darwin' else 1e3), 1)
+
+
+def dataset_dir(root, params):
+    """Directory of the synthetic dataset generated with these parameters."""
+    return os.path.join(root, f"{params['n_ratings']}-{params['n_users']}-{params['n_movies']}-seed{params['seed']}")
+
+
+def load_config(data_dir):
+    """App config pointed at a synthetic dataset, with every on-disk cache disabled."""
+    from app import config as app_config
+    config = {k: getattr(app_config, k) for k in dir(app_config) if k.isupper()}
+    config.update({
+        'RATINGS_CSV': os.path.join(data_dir, 'ratings.csv'),
+        'MOVIES_CSV': os.path.join(data_dir, 'movies.csv'),
+        'CACHE_RATINGS_PARQUET': None,
+        'CACHE_MOVIES_PARQUET': None,
+        'SNAPSHOT_DIR': None,
+        'ITEM_INDEX_PATH': None,
+        'FACTORS_PATH': None,
+        'ANN_INDEX_DIR': None,
+        'PRECOMPUTED_RECS_PARQUET': None,
+        'RATINGS_WAL_PATH': None,
+        'INGEST_TAIL_PATH': None,
+    })
+    return config
+
+
+def sample_inputs(data, n_calls, seed):
+    """Repeatable custom rating sets, search queries and top-movies requests."""
+    rng = np.random.default_rng(seed)
+    stats = data['movie_stats']
+    rated = np.flatnonzero(stats.counts > 0)
+    popularity = stats.counts[rated] / stats.counts[rated].sum()
+
+    rating_sets = []
+    for _ in range(n_calls):
+        picks = rng.choice(rated, size=min(CUSTOM_RATINGS_PER_SET, len(rated)), replace=False, p=popularity)
+        rating_sets.append({
+            int(stats.movie_ids[i]): float(r)
+            for i, r in zip(picks, rng.integers(1, 11, size=len(picks)) / 2)
+        })
+
+    metadata = data['movie_metadata']
+    titles = [metadata[int(m)]['title'] for m in rng.choice(stats.movie_ids[rated], size=n_calls)]
+    queries = []
+    for i, title in enumerate(titles):
+        words = title.split(' (')[0].split()
+        kind = i % 4
+        if kind == 0:
+            queries.append(words[0][:3])                    # short prefix
+        elif kind == 1:
+            queries.append(' '.join(words[:2]))             # word match
+        elif kind == 2:
+            queries.append(words[-1][1:])                   # substring
+        else:
+            word = words[0]
+            queries.append(word[:-1] + 'x' if len(word) > 3 else word)  # typo
+    queries = [q.lower() for q in queries]
+
+    genres = data['genre_index']['genres']
+    top_requests = []
+    for i in range(n_calls):
+        params = {'limit': (10, 50)[i % 2], 'mode': ('average', 'bayesian', 'count')[i % 3]}
+        if genres and i % 4 == 3:
+            params['genre'] = genres[int(rng.integers(len(genres)))]
+        top_requests.append(params)
+
+    return rating_sets, queries, top_requests
+
+
+def run_scale(scale_name, params, data_dir, repeat, n_calls, seed):
+    """Benchmark one dataset. Runs in its own process."""
+    from app import create_app
+    from app.data_loader import load_data
+    from app.recommender import get_recommendations_from_ratings
+    from app.snapshot import save_snapshot
+
+    logging.getLogger('app').setLevel(logging.WARNING)
+    manifest = ensure_dataset(data_dir, params)
+    config = load_config(data_dir)
+    results = {'dataset': manifest['actual'], 'benchmarks': {}}
+    bench = results['benchmarks']
+
+    # Cold load from CSV: one traced run for peak memory, then timed runs
+    tracemalloc.start()
+    data = load_data(config)
+    peak = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+    tracemalloc.stop()
+    rss = max_rss_mb()
+    load_times = time_calls(load_data, [(config,)] * repeat, warmup=0)
+    bench['load_data'] = dict(summarize(load_times), peak_mb=peak, max_rss_mb=rss)
+    logger.info(f"[{scale_name}] load_data p50 {bench['load_data']['p50_ms'] / 1000:.2f}s, peak {peak} MB")
+
+    # Warm load from a memory-mapped snapshot of the same data
+    with tempfile.TemporaryDirectory(dir=data_dir) as snapshot_root:
+        snapshot_config = dict(config, SNAPSHOT_DIR=os.path.join(snapshot_root, 'snapshot'))
+        save_snapshot(data, snapshot_config['SNAPSHOT_DIR'], snapshot_config)
+        snapshot_args = [(snapshot_config,)] * repeat
+        bench['load_data_snapshot'] = dict(
+            summarize(time_calls(load_data, snapshot_args, warmup=1)),
+            peak_mb=traced_peak_mb(load_data, snapshot_args[:1]),
+        )
+
+    rating_sets, queries, top_requests = sample_inputs(data, n_calls, seed)
+    app = create_app(load=False)
+    app.config['data_bundle'] = data
+    client = app.test_client()
+
+    def custom(ratings):
+        get_recommendations_from_ratings(ratings, data, n_recs=5)
+
+    def search(query):
+        response = client.get('/api/search-movies', query_string={'q': query})
+        assert response.status_code == 200, response.status_code
+
+    def top_movies(query):
+        response = client.get('/api/top-movies', query_string=query)
+        assert response.status_code == 200, response.status_code
+
+    for name, fn, inputs in (
+        ('get_recommendations_from_ratings', custom, [(r,) for r in rating_sets]),
+        ('search', search, [(q,) for q in queries]),
+        ('top_movies', top_movies, [(q,) for q in top_requests]),
+    ):
+        bench[name] = dict(summarize(time_calls(fn, inputs)), peak_mb=traced_peak_mb(fn, inputs[:50]))
+        logger.info(f"[{scale_name}] {name} p50 {bench[name]['p50_ms']:.3f}ms p95 {bench[name]['p95_ms']:.3f}ms")
+
+    return results
+
+
+def _run_scale_in_child(args, queue):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    try:
+        queue.put(('ok', run_scale(*args)))
+    except BaseException as e:
+        queue.put(('error', f'{type(e).__name__}: {e}'))
+        raise
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import pandas as pd
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Relative change of p50 latency and peak memory for every benchmark present
+    in both runs. Positive numbers are slower / larger.
+    """
+    comparison = {}
+    regressions = []
+    for scale, scale_results in results['scales'].items():
+        base_scale = baseline.get('scales', {}).get(scale)
+        if not base_scale:
+            continue
+        if base_scale.get('dataset') != scale_results.get('dataset'):
+            logger.warning(f"[{scale}] baseline was run on a different dataset; skipping comparison")
+            continue
+        for name, current in scale_results['benchmarks'].items():
+            previous = base_scale['benchmarks'].get(name)
+            if not previous:
+                continue
+            entry = {}
+            for metric in ('p50_ms', 'p95_ms', 'peak_mb'):
+                if previous.get(metric) and current.get(metric) is not None:
+                    entry[metric] = round(current[metric] / previous[metric] - 1, 4)
+            comparison.setdefault(scale, {})[name] = entry
+            for metric in ('p50_ms', 'peak_mb'):
+                if entry.get(metric, 0) > threshold:
+                    regressions.append(f"{scale} {name} {metric} {entry[metric]:+.1%}")
+    return comparison, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', default=','.join(DEFAULT_SCALES),
+                        help=f"comma-separated scales ({', '.join(SCALES)}) or rating counts")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='where synthetic datasets are kept')
+    parser.add_argument('--repeat', type=int, default=3, help='timed load_data runs per scale')
+    parser.add_argument('--calls', type=int, default=200, help='calls per request benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='dataset and input sampling seed')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file to write')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative p50 or peak memory increase reported as a regression')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'settings': {'repeat': args.repeat, 'calls': args.calls, 'seed': args.seed},
+        'scales': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    for scale in args.scales.split(','):
+        scale = scale.strip().lower()
+        params = dataset_params(scale) if scale in SCALES else dataset_params(n_ratings=int(float(scale)), seed=args.seed)
+        params['seed'] = args.seed
+        data_dir = dataset_dir(args.data_dir, params)
+
+        queue = context.Queue()
+        process = context.Process(
+            target=_run_scale_in_child,
+            args=((scale, params, data_dir, args.repeat, args.calls, args.seed), queue),
+        )
+        process.start()
+        while True:
+            try:
+                status, payload = queue.get(timeout=1)
+                break
+            except queue_module.Empty:
+                # Killed without reporting (e.g. out of memory)
+                if not process.is_alive():
+                    status, payload = 'error', f'worker exited with code {process.exitcode}'
+                    break
+        process.join()
+        if status != 'ok':
+            logger.error(f"[{scale}] failed: {payload}")
+            results['scales'][scale] = {'error': payload}
+            continue
+        results['scales'][scale] = payload
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results['baseline'] = {'path': args.baseline, 'created': baseline.get('created'),
+                               'environment': baseline.get('environment')}
+        results['comparison'], regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        exit_code = 1 if regressions else 0
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for scale, scale_results in results['scales'].items():
+        for name, bench in scale_results.get('benchmarks', {}).items():
+            print(f"{scale:>5} {name:<34} p50 {bench['p50_ms']:>10.3f}ms  p95 {bench['p95_ms']:>10.3f}ms  "
+                  f"peak {bench['peak_mb']:>8.1f}MB")
+    print(f"Results written to {args.output}")
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Synthetic MovieLens-shaped datasets.
+
+Users have a heavy-tailed number of ratings (at least MIN_USER_RATINGS each),
+movie popularity follows a Zipf-like curve, and ratings are half stars built
+from a global mean plus user and movie biases. Output is a ratings.csv sorted
+by user then movie and a movies.csv with "Title (year)" titles and pipe-separated
+genres, like the MovieLens files the app loads. The same parameters and seed
+always produce the same files.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# User, movie and rating counts of the MovieLens releases of each size
+SCALES = {
+    '100k': {'n_ratings': 100_000, 'n_users': 943, 'n_movies': 1_682},
+    '1m': {'n_ratings': 1_000_000, 'n_users': 6_040, 'n_movies': 3_706},
+    '10m': {'n_ratings': 10_000_000, 'n_users': 69_878, 'n_movies': 10_677},
+    '25m': {'n_ratings': 25_000_000, 'n_users': 162_541, 'n_movies': 62_423},
+}
+
+# Share of genre labels in MovieLens 25M
+DEFAULT_GENRE_WEIGHTS = {
+    'Drama': 0.25, 'Comedy': 0.17, 'Thriller': 0.08, 'Romance': 0.07, 'Action': 0.07,
+    'Horror': 0.05, 'Crime': 0.05, 'Documentary': 0.05, 'Adventure': 0.04, 'Sci-Fi': 0.03,
+    'Children': 0.03, 'Fantasy': 0.03, 'Mystery': 0.03, 'Animation': 0.02, 'War': 0.015,
+    'Musical': 0.01, 'Western': 0.01, 'Film-Noir': 0.003, 'IMAX': 0.002,
+}
+
+MIN_USER_RATINGS = 20
+ZIPF_EXPONENT = 0.9
+UNIFORM_SHARE = 0.05       # Share of draws spread evenly over the catalog (keeps the tail reachable)
+MAX_SAMPLING_ROUNDS = 10
+RATINGS_PER_BLOCK = 1_000_000
+MANIFEST_NAME = 'dataset.json'
+
+_SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tos', 'va', 'del', 'ni', 'sur', 'ta', 'bel', 'or', 'qui', 'zan', 'mo', 'ex']
+
+
+def dataset_params(scale=None, n_ratings=None, n_users=None, n_movies=None,
+                   genre_weights=None, genres_per_movie=1.8, seed=0):
+    """
+    Full generator parameters, starting from a named scale and overriding any
+    count given explicitly. Unset user and movie counts scale with n_ratings
+    like the 1M release.
+    """
+    params = dict(SCALES[scale]) if scale else {}
+    if n_ratings is not None:
+        params['n_ratings'] = int(n_ratings)
+    if 'n_ratings' not in params:
+        raise ValueError("Either scale or n_ratings is required")
+    ratio = params['n_ratings'] / SCALES['1m']['n_ratings']
+    if n_users is not None:
+        params['n_users'] = int(n_users)
+    params.setdefault('n_users', max(int(SCALES['1m']['n_users'] * ratio), 1))
+    if n_movies is not None:
+        params['n_movies'] = int(n_movies)
+    params.setdefault('n_movies', max(int(SCALES['1m']['n_movies'] * ratio ** 0.5), 1))
+    params['genre_weights'] = dict(genre_weights or DEFAULT_GENRE_WEIGHTS)
+    params['genres_per_movie'] = genres_per_movie
+    params['seed'] = seed
+    return params
+
+
+def _titles(rng, n_movies):
+    words = np.array([
+        (a + b + c).capitalize()
+        for a in _SYLLABLES for b in _SYLLABLES for c in ('', 'n', 'r', 's')
+    ])
+    n_words = rng.integers(1, 5, size=n_movies)
+    years = rng.integers(1920, 2021, size=n_movies)
+    picks = rng.integers(0, len(words), size=n_words.sum())
+    bounds = np.concatenate(([0], np.cumsum(n_words)))
+    return [
+        f"{' '.join(words[picks[bounds[i]:bounds[i + 1]]])} ({years[i]})"
+        for i in range(n_movies)
+    ]
+
+
+def _genres(rng, n_movies, genre_weights, genres_per_movie):
+    names = list(genre_weights)
+    weights = np.array([genre_weights[g] for g in names], dtype=np.float64)
+    weights /= weights.sum()
+    counts = np.clip(1 + rng.poisson(max(genres_per_movie - 1, 0), size=n_movies), 1, len(names))
+    result = []
+    for count in counts:
+        chosen = np.sort(rng.choice(len(names), size=count, replace=False, p=weights))
+        result.append('|'.join(names[i] for i in chosen))
+    return result
+
+
+def _user_counts(rng, n_users, n_movies, n_ratings):
+    """
+    Ratings per user: the minimum plus a lognormal share of the rest, with no
+    user rating more than half the catalog.
+    """
+    cap = max(n_movies // 2, 1)
+    floor = min(MIN_USER_RATINGS, cap, max(n_ratings // max(n_users, 1), 1))
+    weights = rng.lognormal(0.0, 1.2, size=n_users)
+    counts = np.full(n_users, floor, dtype=np.int64)
+    remaining = min(n_ratings, cap * n_users) - counts.sum()
+    while remaining > 0:
+        share = weights * (counts < cap)
+        add = np.minimum(np.floor(share / share.sum() * remaining).astype(np.int64), cap - counts)
+        if not add.any():
+            # Rounding remainder goes to the most active users with room left
+            add[np.argsort(-share)[:remaining]] = 1
+        counts += add
+        remaining -= add.sum()
+    return counts
+
+
+def _sample_movies(rng, counts, cdf):
+    """
+    Distinct movie positions for a block of users, drawn by popularity.
+
+    Returns (user, movie) position arrays sorted by user then movie. Users
+    whose draws keep colliding after MAX_SAMPLING_ROUNDS end up with fewer
+    ratings than asked for.
+    """
+    n_movies = len(cdf)
+    users = np.empty(0, dtype=np.int64)
+    movies = np.empty(0, dtype=np.int64)
+    need = counts.copy()
+    for _ in range(MAX_SAMPLING_ROUNDS):
+        draws = np.where(need > 0, np.ceil(need * 1.2).astype(np.int64) + 2, 0)
+        new_users = np.repeat(np.arange(len(counts)), draws)
+        new_movies = np.minimum(np.searchsorted(cdf, rng.random(len(new_users)), side='right'), n_movies - 1)
+        users = np.concatenate((users, new_users))
+        movies = np.concatenate((movies, new_movies))
+
+        # Drop repeated pairs, keeping earlier draws, then cap each user at their count
+        _, first = np.unique(users * n_movies + movies, return_index=True)
+        first.sort()
+        users, movies = users[first], movies[first]
+        order = np.argsort(users, kind='stable')
+        users, movies = users[order], movies[order]
+        rank = np.arange(len(users)) - np.searchsorted(users, users)
+        keep = rank < counts[users]
+        users, movies = users[keep], movies[keep]
+
+        need = counts - np.bincount(users, minlength=len(counts))
+        if not need.any():
+            break
+
+    order = np.lexsort((movies, users))
+    return users[order], movies[order]
+
+
+def generate(out_dir, params):
+    """
+    Write ratings.csv, movies.csv and a dataset.json manifest to out_dir.
+
+    Returns the manifest: the parameters plus the actual user, movie and
+    rating counts.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(params['seed'])
+    n_users, n_movies, n_ratings = params['n_users'], params['n_movies'], params['n_ratings']
+
+    # Sparse, increasing IDs like MovieLens
+    movie_ids = np.sort(rng.choice(np.arange(1, n_movies * 3 + 1), size=n_movies, replace=False))
+    movies_df = pd.DataFrame({
+        'movieId': movie_ids,
+        'title': _titles(rng, n_movies),
+        'genres': _genres(rng, n_movies, params['genre_weights'], params['genres_per_movie']),
+    })
+    movies_df.to_csv(os.path.join(out_dir, 'movies.csv'), index=False)
+
+    # Popularity over a random ordering of the catalog, mixed with a uniform share
+    ranks = rng.permutation(n_movies)
+    popularity = 1.0 / (ranks + 10.0) ** ZIPF_EXPONENT
+    popularity = (1 - UNIFORM_SHARE) * popularity / popularity.sum() + UNIFORM_SHARE / n_movies
+    cdf = np.cumsum(popularity)
+    cdf /= cdf[-1]
+
+    movie_bias = rng.normal(0.0, 0.6, size=n_movies) - 0.3 * (ranks < n_movies * 0.05)
+    user_bias = rng.normal(0.0, 0.5, size=n_users)
+    counts = _user_counts(rng, n_users, n_movies, n_ratings)
+    timestamp_start = 946684800  # 2000-01-01
+
+    ratings_path = os.path.join(out_dir, 'ratings.csv')
+    written = 0
+    block_starts = np.searchsorted(np.cumsum(counts), np.arange(0, counts.sum(), RATINGS_PER_BLOCK), side='right')
+    block_starts = np.unique(np.concatenate((block_starts, [n_users])))
+    with open(ratings_path, 'w') as f:
+        f.write('userId,movieId,rating,timestamp\n')
+        for start, end in zip(block_starts[:-1], block_starts[1:]):
+            users, movies = _sample_movies(rng, counts[start:end], cdf)
+            users += start
+            raw = 3.5 + user_bias[users] - movie_bias[movies] + rng.normal(0.0, 0.8, size=len(users))
+            ratings = np.clip(np.round(raw * 2) / 2, 0.5, 5.0)
+            timestamps = timestamp_start + rng.integers(0, 20 * 365 * 86400, size=len(users))
+            pd.DataFrame({
+                'userId': users + 1,
+                'movieId': movie_ids[movies],
+                'rating': ratings,
+                'timestamp': timestamps,
+            }).to_csv(f, header=False, index=False, float_format='%.1f')
+            written += len(users)
+            logger.info(f"{written}/{n_ratings} ratings written")
+
+    manifest = dict(params, actual={'n_users': int(n_users), 'n_movies': int(n_movies), 'n_ratings': int(written)})
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def ensure_dataset(out_dir, params):
+    """Reuse the dataset in out_dir if it was generated with the same parameters, else (re)generate it."""
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if {k: manifest.get(k) for k in params} == json.loads(json.dumps(params)):
+            return manifest
+    logger.info(f"Generating {params['n_ratings']} synthetic ratings in {out_dir}")
+    return generate(out_dir, params)
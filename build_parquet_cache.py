@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 """
 Build Parquet cache from ratings.csv and movies.csv.
-Run once to create cache_ratings.parquet and cache_movies.parquet.
-After that, the web app will load from Parquet on startup (faster).
+Run once to create cache_ratings.parquet, cache_movies.parquet (with
+cache_manifest.json fingerprinting the CSVs they came from), the
+item-item neighbor index (cache_item_neighbors.npz) and the memory-mapped
+snapshot (cache_snapshot/).
+After that, the web app will load from the cache on startup (faster).
 """
 import os
 import sys
@@ -10,15 +13,11 @@ import sys
 # Run from project root
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app.config import RATINGS_CSV, MOVIES_CSV, CACHE_RATINGS_PARQUET, CACHE_MOVIES_PARQUET
+from app import config as app_config
 
 def main():
-    config = {
-        'RATINGS_CSV': RATINGS_CSV,
-        'MOVIES_CSV': MOVIES_CSV,
-        'CACHE_RATINGS_PARQUET': CACHE_RATINGS_PARQUET,
-        'CACHE_MOVIES_PARQUET': CACHE_MOVIES_PARQUET,
-    }
+    # The snapshot records the settings it was built with, so pass the full config
+    config = {k: getattr(app_config, k) for k in dir(app_config) if k.isupper()}
     from app.data_loader import load_data
     print("Building Parquet cache from CSV...")
     load_data(config)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Precompute top-N recommendations for every user and write them to Parquet.
+Users are split into chunks and scored in a process pool with the batch
+collaborative filtering path. /api/recommendations serves these rows while
+the file matches the loaded data and CF parameters.
+
+Usage: python build_recommendations.py [--top-n 20] [--workers 4]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+# Run from project root
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import config as app_config
+
+logger = logging.getLogger(__name__)
+
+_bundle = None
+_config = None
+
+
+def _init_worker(config):
+    """Load the data bundle once per worker (spawn start method only)."""
+    global _bundle, _config
+    if _bundle is None:
+        from app.data_loader import load_data
+        _bundle = load_data(config)
+    _config = config
+
+
+def _score_chunk(args):
+    from app.recommender import get_recommendations_batch
+    user_ids, top_n = args
+    results = get_recommendations_batch(
+        user_ids,
+        _bundle,
+        k_neighbors=_config.get('K_NEIGHBORS', 30),
+        min_overlap=_config.get('MIN_OVERLAP', 5),
+        n_recs=top_n,
+        use_precomputed=False,
+    )
+    rows = ([], [], [], [])
+    for user_id in user_ids:
+        for rank, rec in enumerate(results.get(user_id, []), start=1):
+            rows[0].append(user_id)
+            rows[1].append(rank)
+            rows[2].append(rec['movieId'])
+            rows[3].append(rec['predictedRating'])
+    return len(user_ids), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--top-n', type=int, default=app_config.PRECOMPUTED_TOP_N,
+                        help='recommendations per user')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes')
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help='users scored per task')
+    parser.add_argument('--output', default=app_config.PRECOMPUTED_RECS_PARQUET,
+                        help='Parquet file to write')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    global _bundle, _config
+    from app.data_loader import load_data, precomputed_metadata
+    from app.precomputed import PrecomputedWriter
+
+    config = {k: getattr(app_config, k) for k in dir(app_config) if k.isupper()}
+    # Keep the file being replaced out of the bundle so every user is scored fresh
+    config['PRECOMPUTED_RECS_PARQUET'] = None
+    _bundle = load_data(config)
+    _config = config
+
+    user_ids = np.sort(_bundle['rating_store'].user_ids).tolist()
+    chunks = [(user_ids[i:i + args.chunk_size], args.top_n) for i in range(0, len(user_ids), args.chunk_size)]
+    metadata = dict(precomputed_metadata(_bundle, config), top_n=args.top_n)
+    writer = PrecomputedWriter(args.output, metadata)
+
+    # fork shares the loaded bundle with workers copy-on-write; spawn reloads it
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    pool = None
+    if args.workers > 1:
+        context = multiprocessing.get_context(method)
+        if method == 'spawn':
+            pool = context.Pool(args.workers, initializer=_init_worker, initargs=(config,))
+        else:
+            pool = context.Pool(args.workers)
+
+    start = time.time()
+    done = 0
+    logger.info(f"Scoring {len(user_ids)} users in {len(chunks)} chunks with {args.workers} workers")
+    try:
+        results = pool.imap(_score_chunk, chunks) if pool is not None else map(_score_chunk, chunks)
+        for n_users, rows in results:
+            writer.write(*rows)
+            done += n_users
+            logger.info(f"{done}/{len(user_ids)} users ({time.time() - start:.1f}s)")
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        writer.abort()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    writer.close()
+    print(f"Wrote recommendations for {done} users to {args.output} in {time.time() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
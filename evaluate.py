@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Evaluate the recommenders offline on a timestamp split of ratings.csv.
+Each scorer recommends for the test users from their earlier ratings only;
+the report gives precision/recall/NDCG@k, RMSE, catalog coverage and
+per-user scoring latency.
+
+Scorers: content (genre matching), item (item-item neighbors), custom (what
+/api/custom-recommendations serves), user_cf (user-user neighbors), als
+(a factor model trained on the split), popular (Bayesian average), or a
+module:function with the signature recommend(user_id, ratings, data_bundle, n).
+
+Usage: python evaluate.py [--scorers content,item,user_cf] [--k 10]
+       [--test-fraction 0.2] [--split global|user] [--max-users 2000]
+       [--workers 4] [--output report.json]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+# Run from project root
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import config as app_config
+from app.evaluation import DEFAULT_SCORERS, SPLITS
+
+logger = logging.getLogger(__name__)
+
+
+def _optional(value, spec):
+    """Format a metric that is None when nothing was measured."""
+    return format(value, spec) if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scorers', default=','.join(DEFAULT_SCORERS),
+                        help='comma-separated scorers to evaluate')
+    parser.add_argument('--k', type=int, default=10,
+                        help='recommendations per user')
+    parser.add_argument('--test-fraction', type=float, default=0.2,
+                        help='share of the ratings held out as the test set')
+    parser.add_argument('--split', choices=SPLITS, default='global',
+                        help="hold out the latest ratings overall ('global') or of each user ('user')")
+    parser.add_argument('--relevant', type=float, default=4.0,
+                        help='test ratings at or above this count as relevant')
+    parser.add_argument('--min-train-ratings', type=int, default=5,
+                        help='skip test users with fewer training ratings')
+    parser.add_argument('--max-users', type=int, default=None,
+                        help='evaluate a random sample of this many test users')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the user sample')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='scoring processes')
+    parser.add_argument('--chunk-size', type=int, default=100,
+                        help='users per task sent to a worker')
+    parser.add_argument('--output', default=None,
+                        help='also write the report to this JSON file')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    from app.evaluation import evaluate
+
+    config = {k: getattr(app_config, k) for k in dir(app_config) if k.isupper()}
+    report = evaluate(
+        config,
+        scorers=[s.strip() for s in args.scorers.split(',') if s.strip()],
+        k=args.k,
+        test_fraction=args.test_fraction,
+        split=args.split,
+        relevant_rating=args.relevant,
+        min_train_ratings=args.min_train_ratings,
+        max_users=args.max_users,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+    )
+
+    split = report['split']
+    print(f"{split['method']} split: {split['train_ratings']} training / {split['test_ratings']} test ratings, "
+          f"{split['test_users']} test users, k={split['k']}, {args.workers} workers, {report['seconds']}s")
+    print(f"{'scorer':<12}{'P@k':>8}{'R@k':>8}{'NDCG@k':>8}{'RMSE':>8}{'cover':>8}"
+          f"{'ms/user':>9}{'p95 ms':>9}{'users/s':>9}")
+    for name, result in report['scorers'].items():
+        throughput = result['users_per_second_per_worker']
+        print(f"{name:<12}{result['precision_at_k']:>8.4f}{result['recall_at_k']:>8.4f}"
+              f"{result['ndcg_at_k']:>8.4f}{_optional(result['rmse'], '.4f'):>8}{_optional(result['coverage'], '.4f'):>8}"
+              f"{result['latency_ms']['mean']:>9.2f}{_optional(result['latency_ms']['p95'], '.2f'):>9}"
+              f"{_optional(throughput * args.workers if throughput else None, '.0f'):>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
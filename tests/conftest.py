@@ -0,0 +1,49 @@
+import os
+import sys
+
+# Run from project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from app.data_loader import build_bundle
+from app.rating_store import RatingStore
+
+GENRES = ['Action', 'Comedy', 'Drama', 'Sci-Fi', 'Thriller']
+
+
+def make_bundle(n_users=40, n_movies=24, per_user=14, seed=0):
+    """A small random bundle: every user rates per_user movies on the half-star scale."""
+    rng = np.random.default_rng(seed)
+    users, movies, ratings = [], [], []
+    for user_id in range(1, n_users + 1):
+        rated = rng.choice(n_movies, per_user, replace=False) + 1
+        users.extend([user_id] * per_user)
+        movies.extend(rated.tolist())
+        ratings.extend((rng.integers(1, 11, per_user) / 2).tolist())
+    metadata = {
+        movie_id: {
+            'title': f'Movie {movie_id} ({1990 + movie_id})',
+            'genres': '|'.join(GENRES[(movie_id + i) % len(GENRES)] for i in range(1 + movie_id % 2)),
+        }
+        for movie_id in range(1, n_movies + 1)
+    }
+    store = RatingStore.from_arrays(users, movies, ratings, catalog_movie_ids=list(metadata))
+    data = build_bundle(store, metadata)
+    data['item_index'] = None
+    return data
+
+
+@pytest.fixture
+def bundle():
+    return make_bundle()
+
+
+@pytest.fixture
+def client(bundle):
+    from app import create_app
+
+    app = create_app(load=False)
+    app.config['data_bundle'] = bundle
+    return app.test_client()
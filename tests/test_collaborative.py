@@ -0,0 +1,47 @@
+import numpy as np
+
+from app.collaborative import UserCFModel
+from app.rating_store import RatingStore
+
+from conftest import make_bundle
+
+
+# Which of three rating templates each other user copies; the 18th neighbor falls inside a tie
+GROUPS = [0, 2, 2, 0, 2, 1, 2, 2, 1, 1, 1, 2, 2, 2, 2, 0, 1, 1, 2, 1, 0, 1, 1, 0]
+TEMPLATES = [[4.5, 4.0, 2.5, 1.0, 3.0], [4.0, 4.5, 1.5, 2.0, 3.0], [3.5, 2.5, 3.0, 1.0, 4.0]]
+
+
+def _tied_store():
+    """User 1 plus users copying one of three templates, so candidates tie in groups."""
+    users, movies, ratings = [1, 1, 1, 1], [1, 2, 3, 4], [5.0, 4.0, 2.0, 1.0]
+    for user_id, group in enumerate(GROUPS, start=2):
+        users += [user_id] * 5
+        movies += [1, 2, 3, 4, 5]
+        ratings += TEMPLATES[group]
+    return RatingStore.from_arrays(users, movies, ratings)
+
+
+def test_tied_neighbors_go_to_lower_index_in_both_paths():
+    model = UserCFModel(_tied_store())
+    everyone, all_similarities = model.neighbors(0, len(GROUPS), 2, use_cache=False)
+    assert len(everyone) == len(GROUPS) and len(set(np.round(all_similarities, 6))) == 3
+    expected = everyone[np.lexsort((everyone, -np.round(all_similarities, 6)))][:18]
+
+    neighbors, similarities = model.neighbors(0, 18, 2, use_cache=False)
+    assert neighbors.tolist() == expected.tolist()
+    weights = model._exact_weights(np.array([0]), 18, 2)
+    assert sorted(weights.indices.tolist()) == sorted(expected.tolist())
+    assert np.allclose(np.sort(weights.data), np.sort(similarities))
+
+
+def test_batch_matches_single_user_path():
+    data = make_bundle(n_users=60, per_user=10, seed=3)
+    model = UserCFModel(data['rating_store'])
+    users = np.arange(data['rating_store'].n_users)
+    batch = model.recommend_batch(users, 8, 3, 5)
+    for user, (movies, predictions) in zip(users, batch):
+        neighbors, similarities = model.neighbors(user, 8, 3, use_cache=False)
+        single_movies, single_predictions, support = model.predict(user, neighbors, similarities)
+        order = np.lexsort((single_movies, -support, -single_predictions))[:5]
+        assert movies.tolist() == single_movies[order].tolist()
+        assert np.allclose(predictions, single_predictions[order], atol=1e-5)
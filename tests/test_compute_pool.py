@@ -0,0 +1,67 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from app.metrics import OFFLOADED
+from app.serving import ComputePool, Overloaded
+
+
+def _finished(fn, *args, **kwargs):
+    future = Future()
+    future.set_result(fn(*args, **kwargs))
+    return future
+
+
+def _run_in_thread(pool, key, fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(pool.run(key, fn)), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), 'ComputePool.run deadlocked'
+    return result[0]
+
+
+@pytest.mark.parametrize('key', [None, 'same'])
+def test_finished_computation_releases_its_slot(key):
+    pool = ComputePool(workers=1, max_queue=0)
+    # A future that is already done runs its done-callback as soon as it is attached
+    pool._executor.submit = _finished
+    try:
+        assert _run_in_thread(pool, key, lambda: 42) == 42
+        assert _run_in_thread(pool, key, lambda: 43) == 43
+        assert pool.stats()['pending'] == 0 and not pool._inflight
+    finally:
+        pool.shutdown()
+
+
+def test_identical_calls_share_one_computation():
+    pool = ComputePool(workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    coalesced = OFFLOADED.labels('coalesced')
+    before = coalesced.value
+    results = []
+    first = threading.Thread(target=lambda: results.append(pool.run('key', compute)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(pool.run('key', compute)))
+    second.start()
+    deadline = time.monotonic() + 5
+    while coalesced.value == before and time.monotonic() < deadline:
+        time.sleep(0.001)
+    with pytest.raises(Overloaded):
+        pool.run('other', compute)
+    release.set()
+    first.join(5)
+    second.join(5)
+    pool.shutdown()
+    assert results == ['done', 'done'] and len(calls) == 1
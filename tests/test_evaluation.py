@@ -0,0 +1,25 @@
+from app.evaluation import _accumulate, _empty_total, _summarize
+
+
+def test_summary_without_test_users():
+    summary = _summarize(_empty_total(), catalog_movies=100)
+    assert summary['users'] == 0
+    assert summary['precision_at_k'] == 0.0
+    assert summary['rmse'] is None
+    assert summary['latency_ms']['p95'] is None
+
+
+def test_accumulate_adds_chunks():
+    totals = {'popular': _empty_total()}
+    chunk = {
+        'precision': 0.5, 'recall': 0.25, 'ndcg': 0.5, 'ranked_users': 1,
+        'squared_error': 2.0, 'predictions': 2, 'latencies': [0.001], 'recommended': {1, 2},
+    }
+    _accumulate(totals, {'popular': chunk})
+    _accumulate(totals, {'popular': dict(chunk, recommended={2, 3})})
+    summary = _summarize(totals['popular'], catalog_movies=10)
+    assert summary['ranked_users'] == 2
+    assert summary['precision_at_k'] == 0.5
+    assert summary['rmse'] == 1.0
+    assert summary['coverage'] == 0.3
+    assert chunk['recommended'] == {1, 2}
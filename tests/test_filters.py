@@ -0,0 +1,129 @@
+import pytest
+
+from app import create_app
+from app.filters import MovieFilter, filter_mask, parse_filter
+
+from conftest import make_bundle
+from test_trending import END, _with_trending
+
+RATINGS = [{'movieId': 1, 'rating': 5}, {'movieId': 2, 'rating': 1}, {'movieId': 7, 'rating': 4}]
+
+
+@pytest.fixture
+def data():
+    return _with_trending(make_bundle(n_users=60, n_movies=60, per_user=20))
+
+
+@pytest.fixture
+def client(data):
+    app = create_app(load=False)
+    app.config['data_bundle'] = data
+    return app.test_client()
+
+
+def _year(movie):
+    return int(movie['title'][-5:-1])
+
+
+def _ids(movies):
+    return [movie['movieId'] for movie in movies]
+
+
+FILTERS = [
+    ({'genre': 'drama'}, lambda m, count: 'Drama' in m['genres'].split('|')),
+    ({'genre': 'Comedy,Action'}, lambda m, count: {'Comedy', 'Action'} <= set(m['genres'].split('|'))),
+    ({'year_min': 2010, 'year_max': 2030}, lambda m, count: 2010 <= _year(m) <= 2030),
+    ({'min_count': 22}, lambda m, count: count >= 22),
+]
+
+
+def test_parse_filter(data):
+    index = data['movie_filters']
+    assert parse_filter(index) is None
+    assert parse_filter(index, ' , ', '', None, 0) is None
+    assert parse_filter(index, 'sci-fi,DRAMA', '1990', None, '3') == MovieFilter(('Drama', 'Sci-Fi'), 1990, None, 3)
+    with pytest.raises(ValueError, match="Unknown genre 'Nope'"):
+        parse_filter(index, 'Drama,Nope')
+    with pytest.raises(ValueError):
+        parse_filter(index, year_min='soon')
+
+    mask = filter_mask(data, MovieFilter(('Drama',), 2000, 2020, 20))
+    store, stats = data['rating_store'], data['movie_stats']
+    expected = [
+        movie_id for i, movie_id in enumerate(store.movie_ids.tolist())
+        if 'Drama' in data['movie_metadata'][movie_id]['genres'] and 2000 <= 1990 + movie_id <= 2020
+        and stats.counts[i] >= 20
+    ]
+    assert store.movie_ids[mask].tolist() == expected
+
+
+@pytest.mark.parametrize('params, keep', FILTERS)
+def test_recommendations_are_filtered_before_top_k(client, data, params, keep):
+    full = client.get('/api/recommendations?userId=1&limit=100').get_json()['recommendations']
+    counts = dict(zip(data['rating_store'].movie_ids.tolist(), data['movie_stats'].counts.tolist()))
+    expected = [m for m in full if keep(m, counts[m['movieId']])]
+    assert 0 < len(expected) < len(full)
+
+    limit = min(len(expected), 8)
+    query = '&'.join(f'{k}={v}' for k, v in params.items())
+    response = client.get(f'/api/recommendations?userId=1&limit={limit}&{query}')
+    assert response.status_code == 200
+    # A post-filtered page would hold only the matches among the unfiltered top `limit`
+    assert _ids(response.get_json()['recommendations']) == _ids(expected[:limit])
+
+
+@pytest.mark.parametrize('params, keep', FILTERS)
+def test_custom_recommendations_are_filtered_before_top_k(client, data, params, keep):
+    full = client.post('/api/custom-recommendations', json={'ratings': RATINGS, 'limit': 100}).get_json()
+    full = full['recommendations']
+    counts = dict(zip(data['rating_store'].movie_ids.tolist(), data['movie_stats'].counts.tolist()))
+    expected = [m for m in full if keep(m, counts[m['movieId']])]
+    assert 0 < len(expected) < len(full)
+
+    names = {'genre': 'genre', 'year_min': 'yearMin', 'year_max': 'yearMax', 'min_count': 'minCount'}
+    body = {'ratings': RATINGS, 'limit': 8, **{names[k]: v for k, v in params.items()}}
+    response = client.post('/api/custom-recommendations', json=body)
+    assert response.status_code == 200
+    assert _ids(response.get_json()['recommendations']) == _ids(expected[:8])
+
+
+def test_limits_above_five(client):
+    assert len(client.get('/api/recommendations?userId=1&limit=20').get_json()['recommendations']) == 20
+    response = client.post('/api/custom-recommendations', json={'ratings': RATINGS, 'limit': 20})
+    assert len(response.get_json()['recommendations']) == 20
+    assert client.get('/api/recommendations?userId=1&limit=101').status_code == 400
+
+
+@pytest.mark.parametrize('params, keep', FILTERS[:3])
+def test_top_movies_and_trending_use_the_filter_index(client, data, params, keep):
+    query = '&'.join(f'{k}={v}' for k, v in params.items())
+    full = client.get('/api/top-movies?limit=50&min_count=1').get_json()['movies']
+    expected = [m for m in full if keep(m, m['ratingCount'])]
+    assert _ids(client.get(f'/api/top-movies?limit=5&min_count=1&{query}').get_json()['movies']) == \
+        _ids(expected[:5])
+
+    trending_url = f'/api/trending?as_of={END}&days=60&limit=50'
+    full = client.get(trending_url).get_json()['movies']
+    expected = [m for m in full if keep(m, m['ratingCount'])]
+    # The unfiltered list stops at 50 movies; filtered ones past it may follow
+    filtered = _ids(client.get(f'{trending_url}&{query}').get_json()['movies'])
+    assert expected and filtered[:len(expected)] == _ids(expected)
+
+
+@pytest.mark.parametrize('url', [
+    '/api/recommendations?userId=1&genre=Nope',
+    '/api/top-movies?genre=Drama,Nope',
+    '/api/trending?genre=Nope',
+    '/api/top-movies?year_min=soon',
+    '/api/trending?year_max=later',
+])
+def test_invalid_filters_are_rejected(client, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_custom_recommendations_reject_unknown_genre(client):
+    response = client.post('/api/custom-recommendations', json={'ratings': RATINGS, 'genre': ['Drama', 'Nope']})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': "Unknown genre 'Nope'"}
@@ -0,0 +1,26 @@
+def _revalidate(client, url):
+    first = client.get(url)
+    assert first.status_code == 200
+    return client.get(url, headers={'If-None-Match': first.headers['ETag']})
+
+
+def test_matching_etag_gets_304(client):
+    assert _revalidate(client, '/api/top-movies?min_count=1').status_code == 304
+    assert _revalidate(client, '/api/search-movies?q=movie').status_code == 304
+    assert _revalidate(client, '/api/movies/3').status_code == 304
+
+
+def test_ingested_ratings_change_the_etag(client, bundle):
+    first = client.get('/api/top-movies?min_count=1')
+    bundle['movie_stats'] = bundle['movie_stats'].updated([0], [1], [5.0])
+    second = client.get('/api/top-movies?min_count=1', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200 and second.headers['ETag'] != first.headers['ETag']
+
+
+def test_invalid_parameters_are_rejected_before_revalidation(client):
+    etag = client.get('/api/top-movies?min_count=1&genre=Comedy').headers['ETag']
+    for query in ('min_count=1&genre=Bogus', 'min_count=1&mode=bogus', 'min_count=x'):
+        response = client.get(f'/api/top-movies?{query}', headers={'If-None-Match': etag})
+        assert response.status_code == 400
+    response = client.get('/api/top-movies?min_count=1&genre=Bogus', headers={'If-None-Match': '*'})
+    assert response.status_code == 400
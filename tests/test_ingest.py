@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+from app.factorization import FactorModel
+from app.ingest import RatingDelta, RatingIngestor, attach_delta
+from app.recommender import _user_factor_profile, get_recommendations
+
+from conftest import make_bundle
+
+
+def _ingestor(data, tmp_path, **config):
+    config = dict({
+        'data_bundle': data,
+        'RATINGS_WAL_PATH': str(tmp_path / 'ratings_wal.csv'),
+        'INGEST_COMPACT_THRESHOLD': 10**6,
+        'INGEST_COMPACT_INTERVAL': 3600,
+        'INGEST_PERSIST_ON_COMPACT': False,
+        'ANN_MIN_ROWS': None,
+    }, **config)
+    return RatingIngestor(config)
+
+
+def _unrated_movie(data, user_id):
+    return min(set(data['movie_ids']) - set(data['user_ratings'][user_id]))
+
+
+def test_delta_keeps_newest_rating_across_freeze():
+    delta = RatingDelta()
+    delta.add(1, 10, 3.0, 100)
+    delta.freeze()
+    delta.add(1, 10, 4.5, 101)
+    delta.add(2, 10, 2.0, 102)
+    assert delta.get(1, 10) == 4.5
+    assert delta.user_row(1) == {10: 4.5}
+    assert delta.movie_row(10) == {1: 4.5, 2: 2.0}
+    assert len(delta) == 3
+
+    delta.thaw()
+    assert [entry[:3] for entry in delta.entries()] == [(1, 10, 3.0), (1, 10, 4.5), (2, 10, 2.0)]
+    assert delta.get(1, 10) == 4.5
+
+
+def test_overlay_views_merge_pending_ratings(bundle):
+    delta = attach_delta(bundle)
+    stored = dict(bundle['user_ratings'][1])
+    rated = next(iter(stored))
+    new_movie = _unrated_movie(bundle, 1)
+    delta.add(1, rated, 0.5, 100)
+    delta.add(1, new_movie, 5.0, 100)
+    delta.add(1000, new_movie, 4.0, 100)
+
+    assert bundle['user_ratings'][1] == {**stored, rated: 0.5, new_movie: 5.0}
+    assert bundle['movie_ratings'][new_movie][1000] == 4.0
+    assert 1000 in bundle['user_ids'] and 1000 in bundle['user_ratings']
+    assert list(bundle['user_ids'])[-1] == 1000
+    assert len(bundle['user_ids']) == bundle['rating_store'].n_users + 1
+    assert 1001 not in bundle['user_ratings']
+    with pytest.raises(KeyError):
+        bundle['user_ratings'][1001]
+
+
+def test_wal_replay_restores_pending_ratings(bundle, tmp_path):
+    ingestor = _ingestor(bundle, tmp_path)
+    ingestor.start()
+    movie = _unrated_movie(bundle, 1)
+    count = bundle['movie_stats'].counts[bundle['rating_store'].movie_index(movie)]
+    ingestor.ingest([(1, movie, 4.0, 100), (1000, movie, 3.0, 101)])
+    ingestor.stop()
+
+    reloaded = make_bundle()
+    replayed = _ingestor(reloaded, tmp_path)
+    replayed.start()
+    replayed.stop()
+    assert reloaded['delta'].entries() == [(1, movie, 4.0, 100), (1000, movie, 3.0, 101)]
+    assert reloaded['movie_stats'].counts[reloaded['rating_store'].movie_index(movie)] == count + 2
+    assert reloaded['user_ratings'][1][movie] == 4.0
+
+
+def test_compaction_merges_delta_and_keeps_later_ratings(bundle, tmp_path):
+    ingestor = _ingestor(bundle, tmp_path)
+    ingestor.start()
+    movie = _unrated_movie(bundle, 1)
+    ingestor.ingest([(1, movie, 4.0, 100), (1000, movie, 3.0, 101)])
+
+    build = ingestor._build_compacted
+
+    def build_while_ingesting(data, entries):
+        # A rating accepted while the new bundle is built stays pending in it
+        ingestor.ingest([(2, movie, 1.5, 102)])
+        return build(data, entries)
+
+    ingestor._build_compacted = build_while_ingesting
+    assert ingestor.compact()
+    ingestor.stop()
+
+    compacted = ingestor.config['data_bundle']
+    assert compacted is not bundle and compacted['version'] != bundle['version']
+    assert compacted['rating_store'].rating(1, movie) == 4.0
+    assert compacted['rating_store'].rating(1000, movie) == 3.0
+    assert compacted['rating_store'].n_ratings == bundle['rating_store'].n_ratings + 2
+    assert compacted['delta'].entries() == [(2, movie, 1.5, 102)]
+    assert compacted['user_ratings'][2][movie] == 1.5
+
+
+def test_failed_compaction_keeps_ratings_pending(bundle, tmp_path):
+    ingestor = _ingestor(bundle, tmp_path)
+    ingestor.start()
+    ingestor.ingest([(1, _unrated_movie(bundle, 1), 4.0, 100)])
+
+    def fail(data, entries):
+        ingestor.ingest([(2, _unrated_movie(bundle, 2), 2.0, 101)])
+        raise RuntimeError('build failed')
+
+    ingestor._build_compacted = fail
+    with pytest.raises(RuntimeError):
+        ingestor.compact()
+    ingestor.stop()
+    assert ingestor.config['data_bundle'] is bundle
+    assert [entry[3] for entry in bundle['delta'].entries()] == [100, 101]
+
+
+def test_pending_ratings_update_user_cf_profile(bundle, tmp_path):
+    ingestor = _ingestor(bundle, tmp_path)
+    ingestor.start()
+    before = get_recommendations(1, bundle, k_neighbors=10, min_overlap=3)
+    pending = [(1, rec['movieId'], 0.5, 100) for rec in before[:2]]
+    ingestor.ingest(pending)
+    with_pending = get_recommendations(1, bundle, k_neighbors=10, min_overlap=3)
+    ingestor.compact()
+    ingestor.stop()
+    compacted = get_recommendations(1, ingestor.config['data_bundle'], k_neighbors=10, min_overlap=3)
+
+    assert not {m for _, m, _, _ in pending} & {rec['movieId'] for rec in with_pending}
+    assert [rec['movieId'] for rec in with_pending] == [rec['movieId'] for rec in compacted]
+    assert np.allclose(
+        [rec['predictedRating'] for rec in with_pending], [rec['predictedRating'] for rec in compacted], atol=0.011,
+    )
+
+
+def test_pending_ratings_are_folded_into_user_factors(bundle):
+    delta = attach_delta(bundle)
+    factors = FactorModel.train(bundle['rating_store'], rank=4, iterations=3, threads=1)
+    movie = _unrated_movie(bundle, 1)
+    delta.add(1, movie, 5.0, 100)
+
+    store = bundle['rating_store']
+    (vector, bias), rated = _user_factor_profile(factors, store, 1, store.user_index(1), delta.user_row(1))
+    ratings = bundle['user_ratings'][1]
+    expected, expected_bias = factors.fold_in(list(ratings), list(ratings.values()))
+    assert movie in rated
+    assert np.allclose(vector, expected) and np.isclose(bias, expected_bias)
+    assert not np.allclose(vector, factors.user_vector(1)[0])
@@ -0,0 +1,43 @@
+import numpy as np
+
+from app.data_loader import attach_item_index
+from app.item_index import ItemNeighborIndex
+
+from conftest import make_bundle
+
+
+def _attach(data, path, **config):
+    attach_item_index(data, dict({'ITEM_INDEX_PATH': str(path), 'ITEM_NEIGHBORS': 5, 'ITEM_SHRINKAGE': 10.0}, **config))
+    return data['item_index']
+
+
+def _fresh(data, n_neighbors=5, shrinkage=10.0):
+    return ItemNeighborIndex.build(data['user_cf'].by_movie, data['rating_store'].movie_ids, n_neighbors, shrinkage)
+
+
+def test_saved_index_is_reused_for_the_same_data(tmp_path, monkeypatch):
+    path = tmp_path / 'items.npz'
+    first = _attach(make_bundle(), path)
+    monkeypatch.setattr(ItemNeighborIndex, 'build', None)  # Loading must not rebuild
+    second = _attach(make_bundle(), path)
+    assert np.array_equal(first.neighbors, second.neighbors)
+
+
+def test_changed_ratings_rebuild_the_index(tmp_path):
+    path = tmp_path / 'items.npz'
+    _attach(make_bundle(seed=0), path)
+    data = make_bundle(seed=1)
+    assert np.array_equal(data['rating_store'].movie_ids, make_bundle(seed=0)['rating_store'].movie_ids)
+    index = _attach(data, path)
+    fresh = _fresh(data)
+    assert np.array_equal(index.neighbors, fresh.neighbors)
+    assert np.allclose(index.similarities, fresh.similarities)
+
+
+def test_changed_parameters_rebuild_the_index(tmp_path):
+    path = tmp_path / 'items.npz'
+    data = make_bundle()
+    _attach(data, path)
+    assert _attach(data, path, ITEM_NEIGHBORS=3).n_neighbors == 3
+    index = _attach(data, path, ITEM_NEIGHBORS=3, ITEM_SHRINKAGE=0.0)
+    assert np.allclose(index.similarities, _fresh(data, 3, 0.0).similarities)
@@ -0,0 +1,31 @@
+import signal
+import threading
+
+from app import create_app, lifecycle
+
+
+def test_create_app_leaves_signal_handlers_alone():
+    before = signal.getsignal(signal.SIGHUP)
+    create_app(load=False)
+    assert signal.getsignal(signal.SIGHUP) is before
+
+
+def test_install_signal_handler_starts_a_reload(monkeypatch):
+    app = create_app(load=False)
+    started = threading.Event()
+    monkeypatch.setattr(app.config['data_lifecycle'], 'start', started.set)
+    before = signal.getsignal(signal.SIGHUP)
+    try:
+        assert lifecycle.install_signal_handler(app)
+        handler = signal.getsignal(signal.SIGHUP)
+        assert handler is not before
+        handler(signal.SIGHUP, None)
+        assert started.wait(5)
+    finally:
+        signal.signal(signal.SIGHUP, before)
+
+
+def test_no_handler_without_reload_signal():
+    app = create_app(load=False)
+    app.config['RELOAD_SIGNAL'] = None
+    assert not lifecycle.install_signal_handler(app)
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from app.ingest import attach_delta
+from app.pagination import InvalidCursor, history_cursor, history_start, user_history, user_page
+
+
+def _history_pages(data, user_id, limit):
+    movie_ids, ratings = user_history(data, user_id)
+    pages, cursor = [], None
+    for _ in range(len(movie_ids) + 1):
+        start = history_start(movie_ids, ratings, cursor)
+        end = min(start + limit, len(movie_ids))
+        pages.append(list(zip(movie_ids[start:end].tolist(), ratings[start:end].tolist())))
+        cursor = history_cursor(movie_ids, ratings, end)
+        if cursor is None:
+            return pages
+    raise AssertionError('history pages did not advance')
+
+
+def _user_pages(data, limit):
+    pages, cursor = [], None
+    for _ in range(len(data['user_ids']) + 1):
+        users, cursor = user_page(data, cursor, limit)
+        pages.append(users)
+        if cursor is None:
+            return pages
+    raise AssertionError('user pages did not advance')
+
+
+def test_history_pages_cut_through_equal_ratings(bundle):
+    movie_ids, ratings = user_history(bundle, 1)
+    expected = sorted(bundle['user_ratings'][1].items(), key=lambda item: (-item[1], item[0]))
+    assert list(zip(movie_ids.tolist(), ratings.tolist())) == expected
+    assert len(set(ratings.tolist())) < len(ratings)  # Some ratings repeat
+
+    for limit in range(1, len(expected) + 1):
+        pages = _history_pages(bundle, 1, limit)
+        assert [item for page in pages for item in page] == expected
+        assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_history_cursor_for_a_missing_movie_resumes_in_its_rating_run(bundle):
+    movie_ids, ratings = user_history(bundle, 1)
+    rating = float(ratings[0])
+    run = np.flatnonzero(ratings == ratings[0])
+    # Cursors name the last item returned; it may have been re-rated since
+    assert history_start(movie_ids, ratings, f'{rating!r}:0') == 0
+    assert history_start(movie_ids, ratings, f'{rating!r}:{10**9}') == run[-1] + 1
+    assert history_start(movie_ids, ratings, '5.25:1') == int(np.searchsorted(-ratings, -5.25))
+
+
+def test_history_pages_stay_consistent_when_ratings_arrive(bundle):
+    delta = attach_delta(bundle)
+    movie_ids, ratings = user_history(bundle, 1)
+    first = history_cursor(movie_ids, ratings, 4)
+    rest = list(zip(movie_ids[4:].tolist(), ratings[4:].tolist()))
+
+    unrated = min(set(bundle['movie_ids']) - set(bundle['user_ratings'][1]))
+    delta.add(1, unrated, 5.0, 100)
+    movie_ids, ratings = user_history(bundle, 1)
+    start = history_start(movie_ids, ratings, first)
+    # A new top rating lands before the cursor, so the next page neither repeats nor skips items
+    assert list(zip(movie_ids[start:].tolist(), ratings[start:].tolist())) == rest
+    assert (unrated, 5.0) in zip(movie_ids.tolist(), ratings.tolist())
+
+
+def test_user_pages_merge_users_with_only_pending_ratings(bundle):
+    delta = attach_delta(bundle)
+    stored = bundle['rating_store'].user_ids.tolist()
+    for user_id in (2000, 1000, 1001):
+        delta.add(user_id, 1, 4.0, 100)
+    delta.add(5, 1, 4.0, 100)  # A stored user with a pending rating appears once
+    expected = stored + [1000, 1001, 2000]
+
+    for limit in (1, 3, 7, len(stored), len(expected), len(expected) + 5):
+        pages = _user_pages(bundle, limit)
+        assert [u for page in pages for u in page] == expected
+        assert all(len(page) == limit for page in pages[:-1])
+
+    assert user_page(bundle, str(stored[-1]), 2) == ([1000, 1001], '1001')
+    assert user_page(bundle, '1001', 2) == ([2000], None)
+    assert user_page(bundle, '5000', 2) == ([], None)
+
+
+def test_history_of_a_user_with_only_pending_ratings(bundle):
+    delta = attach_delta(bundle)
+    assert user_history(bundle, 1000) is None
+    delta.add(1000, 3, 2.0, 100)
+    delta.add(1000, 1, 4.5, 101)
+    delta.add(1000, 2, 4.5, 102)
+    movie_ids, ratings = user_history(bundle, 1000)
+    assert movie_ids.tolist() == [1, 2, 3] and ratings.tolist() == [4.5, 4.5, 2.0]
+    assert _history_pages(bundle, 1000, 1) == [[(1, 4.5)], [(2, 4.5)], [(3, 2.0)]]
+
+
+@pytest.mark.parametrize('cursor', ['abc', '1.5', '', ' '])
+def test_invalid_user_cursor(bundle, cursor):
+    with pytest.raises(InvalidCursor):
+        user_page(bundle, cursor)
+
+
+@pytest.mark.parametrize('cursor', ['4.0', 'x:1', '4.0:y', '4.0:1:2', ''])
+def test_invalid_history_cursor(bundle, cursor):
+    movie_ids, ratings = user_history(bundle, 1)
+    with pytest.raises(InvalidCursor):
+        history_start(movie_ids, ratings, cursor)
+
+
+def test_invalid_cursors_are_rejected_by_the_routes(client):
+    response = client.get('/api/users?cursor=abc')
+    assert response.status_code == 400 and response.get_json() == {'error': "Invalid cursor 'abc'"}
+    response = client.get('/api/user-history?userId=1&cursor=4.0')
+    assert response.status_code == 400 and response.get_json() == {'error': "Invalid cursor '4.0'"}
+
+    page = client.get('/api/user-history?userId=1&limit=5').get_json()
+    following = client.get(f"/api/user-history?userId=1&limit=5&cursor={page['nextCursor']}").get_json()
+    assert len(page['history']) == len(following['history']) == 5
+    assert not {h['movieId'] for h in page['history']} & {h['movieId'] for h in following['history']}
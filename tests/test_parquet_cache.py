@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from app import parquet_cache
+from app.data_loader import _load_rating_data
+from app.parquet_cache import check_cache, read_manifest
+
+RATINGS = 'userId,movieId,rating,timestamp\n1,1,4.0,100\n1,2,3.5,200\n2,1,5.0,300\n2,3,2.0,400\n'
+MOVIES = 'movieId,title,genres\n1,One (1990),Drama\n2,Two (1995),Comedy\n3,Three (2000),Drama|Comedy\n'
+
+
+@pytest.fixture
+def config(tmp_path):
+    (tmp_path / 'ratings.csv').write_text(RATINGS)
+    (tmp_path / 'movies.csv').write_text(MOVIES)
+    config = {
+        'RATINGS_CSV': str(tmp_path / 'ratings.csv'),
+        'MOVIES_CSV': str(tmp_path / 'movies.csv'),
+        'CACHE_RATINGS_PARQUET': str(tmp_path / 'ratings.parquet'),
+        'CACHE_MOVIES_PARQUET': str(tmp_path / 'movies.parquet'),
+        'CACHE_MANIFEST_PATH': str(tmp_path / 'manifest.json'),
+    }
+    assert check_cache(config) == (False, 'cache files missing')
+    _load_rating_data(config)
+    assert check_cache(config) == (True, None)
+    return config
+
+
+def _bump_mtime(path, seconds=10):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+
+def test_size_change_rebuilds_the_cache(config):
+    with open(config['RATINGS_CSV'], 'a') as f:
+        f.write('3,2,1.0,500\n')
+    assert check_cache(config) == (False, 'ratings.csv changed size')
+
+    data = _load_rating_data(config)
+    assert data['rating_store'].n_ratings == 5
+    assert check_cache(config) == (True, None)
+
+
+def test_mtime_only_change_rehashes_once(config, monkeypatch):
+    before = read_manifest(config)
+    _bump_mtime(config['MOVIES_CSV'])
+    hashed = []
+    file_sha256 = parquet_cache.file_sha256
+    monkeypatch.setattr(parquet_cache, 'file_sha256', lambda path: hashed.append(path) or file_sha256(path))
+
+    assert check_cache(config) == (True, None)
+    assert hashed == [config['MOVIES_CSV']]
+    after = read_manifest(config)
+    assert after['sources']['MOVIES_CSV']['mtime_ns'] == os.stat(config['MOVIES_CSV']).st_mtime_ns
+    assert after['sources']['MOVIES_CSV']['sha256'] == before['sources']['MOVIES_CSV']['sha256']
+    assert after['sources']['RATINGS_CSV'] == before['sources']['RATINGS_CSV']
+
+    # The rewritten manifest makes the next check cheap again
+    assert check_cache(config) == (True, None)
+    assert hashed == [config['MOVIES_CSV']]
+
+
+def test_same_size_content_change_is_detected(config):
+    with open(config['RATINGS_CSV'], 'w') as f:
+        f.write(RATINGS.replace('3.5', '1.5'))
+    _bump_mtime(config['RATINGS_CSV'])
+    assert check_cache(config) == (False, 'ratings.csv content changed')
+
+    data = _load_rating_data(config)
+    assert data['rating_store'].rating(1, 2) == 1.5
+    assert check_cache(config) == (True, None)
+
+
+def test_changed_output_is_not_trusted(config):
+    _bump_mtime(config['CACHE_RATINGS_PARQUET'])
+    assert check_cache(config) == (False, 'ratings.parquet changed since it was written')
+
+    os.remove(config['CACHE_MANIFEST_PATH'])
+    assert check_cache(config) == (False, 'no cache manifest')
+
+
+def test_schema_bump_invalidates_the_cache(config, monkeypatch):
+    monkeypatch.setattr(parquet_cache, 'CACHE_SCHEMA_VERSION', parquet_cache.CACHE_SCHEMA_VERSION + 1)
+    assert check_cache(config) == (False, f'cache schema version {parquet_cache.CACHE_SCHEMA_VERSION - 1}')
+
+    _load_rating_data(config)
+    assert read_manifest(config)['schema_version'] == parquet_cache.CACHE_SCHEMA_VERSION
+    assert check_cache(config) == (True, None)
+
+
+def test_cache_outlives_deleted_sources(config):
+    os.remove(config['RATINGS_CSV'])
+    os.remove(config['MOVIES_CSV'])
+    assert check_cache(config) == (True, None)
+    assert _load_rating_data(config)['rating_store'].n_ratings == 4
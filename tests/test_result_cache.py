@@ -0,0 +1,55 @@
+from app import result_cache
+from app.result_cache import ResultCache
+
+
+def test_put_from_replaced_version_is_dropped():
+    cache = ResultCache()
+    cache.bind('old')
+    cache.put('k', ['old result'], 'old')
+    # A reload swaps in the new bundle while a request still scores on the old one
+    cache.bind('new')
+    cache.put('k', ['late old result'], 'old')
+    assert cache.get('k', 'new') is None
+    cache.put('k', ['new result'], 'new')
+    assert cache.get('k', 'new') == ['new result']
+    assert cache.get('k', 'old') is None
+
+
+def test_interleaved_versions_do_not_thrash():
+    cache = ResultCache()
+    cache.bind('old')
+    cache.bind('new')
+    cache.put('a', [1], 'new')
+    for _ in range(5):
+        # Old-bundle and new-bundle requests alternate during the swap
+        cache.bind('old')
+        cache.put('b', [2], 'old')
+        cache.bind('new')
+        assert cache.get('a', 'new') == [1]
+    assert cache.get('b', 'old') is None
+    assert cache.stats()['invalidations'] == 0
+
+
+def test_retired_version_can_return_after_grace(monkeypatch):
+    cache = ResultCache()
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    cache.bind('v1')
+    cache.bind('v2')
+    cache.bind('v1')
+    cache.put('k', [1], 'v1')
+    assert cache.get('k', 'v1') is None
+    # Reloading data identical to an earlier load brings its version back
+    now[0] += result_cache.RETIRED_GRACE_SECONDS + 1
+    cache.bind('v1')
+    cache.put('k', [1], 'v1')
+    assert cache.get('k', 'v1') == [1]
+
+
+def test_new_version_drops_entries():
+    cache = ResultCache()
+    cache.bind('v1')
+    cache.put('k', [1], 'v1')
+    cache.bind('v2')
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['invalidations'] == 1
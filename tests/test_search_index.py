@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app import search_index
+from app.search_index import SearchIndex, normalize, title_variants
+
+WORDS = ['star', 'stark', 'stars', 'the', 'theory', 'love', 'lover', 'night', 'nightmare', 'matrix', 'a']
+
+
+@pytest.fixture
+def small_limits(monkeypatch):
+    # Small enough that the precomputed prefixes and capped scans are exercised
+    monkeypatch.setattr(search_index, 'PREFIX_SCAN_MAX', 4)
+    monkeypatch.setattr(search_index, 'PREFIX_RESULTS', 8)
+    monkeypatch.setattr(search_index, 'SCAN_CANDIDATES', 16)
+
+
+def _catalog(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    metadata = {
+        movie_id: {'title': ' '.join(rng.choice(WORDS, rng.integers(1, 4))).title() + f' ({1950 + movie_id % 60})'}
+        for movie_id in range(1, n + 1)
+    }
+    metadata[n + 1] = {'title': 'Matrix, The (1999)'}
+    popularity = {movie_id: int(rng.integers(0, 50)) for movie_id in metadata}
+    return metadata, popularity
+
+
+def _ranked(index, metadata, matches):
+    rank = {movie_id: r for r, movie_id in enumerate(index.movie_ids.tolist())}
+    return sorted((rank[m] for m in metadata if matches(m)))
+
+
+def test_prefix_tiers_match_a_full_scan(small_limits):
+    metadata, popularity = _catalog()
+    index = SearchIndex(metadata, popularity)
+    assert len(index._token_prefixes) > 0 and len(index._title_prefixes) > 0
+
+    for query in ['s', 'st', 'star', 'the', 'th', 'love n', 'st the', 'the ma', 'a']:
+        tokens = query.split()
+        title_prefix = _ranked(index, metadata, lambda m: any(
+            v.startswith(query) for v in title_variants(metadata[m]['title'])
+        ))
+        token_prefix = _ranked(index, metadata, lambda m: all(
+            any(w.startswith(t) for w in ' '.join(title_variants(metadata[m]['title'])).split()) for t in tokens
+        ))
+        for limit in (1, 5, 8, 20):
+            assert index._title_prefix_ranks(query, limit).tolist() == title_prefix[:limit]
+            assert index._token_matches(tokens, limit).tolist() == token_prefix[:limit]
+
+
+def test_infix_and_fuzzy_scans_are_capped(small_limits):
+    metadata, popularity = _catalog()
+    index = SearchIndex(metadata, popularity)
+    names = {m: normalize(metadata[m]['title']) for m in metadata}
+
+    infix = index._infix_matches('ove', 5).tolist()
+    assert infix == _ranked(index, metadata, lambda m: 'ove' in names[m])[:len(infix)]
+    assert 0 < len(infix) <= 5
+    # Only the first SCAN_CANDIDATES ranks of the rarest trigram are read
+    assert max(index._infix_matches('ove', 1000).tolist()) <= index._trigrams['ove'][15]
+
+    query_grams = search_index.trigrams('nightmate')
+    postings = [index._trigrams[g] for g in query_grams if g in index._trigrams]
+    read = set(np.concatenate([p[:16] for p in postings]).tolist())
+    shared = {r: len(query_grams & search_index.trigrams(index.titles[r].decode())) for r in read}
+    expected = sorted((r for r in read if shared[r] >= 0.6 * len(query_grams)), key=lambda r: (-shared[r], r))
+    assert expected and any(len(p) > 16 for p in postings)
+    assert index._fuzzy_matches('nightmate', 10).tolist() == expected[:10]
+
+
+def test_arrays_round_trip(small_limits):
+    metadata, popularity = _catalog()
+    index = SearchIndex(metadata, popularity)
+    restored = SearchIndex.from_arrays(index.to_arrays())
+    for query in ['the matrix', 'sta', 'lov nig', 'tark', 'nightmate', 'a']:
+        assert restored.search(query, 10) == index.search(query, 10)
+    assert index.search('the matrix 1999', 1) == [(301, search_index.TIER_EXACT)]
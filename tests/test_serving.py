@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from flask import Flask, request
+
+pytest.importorskip('a2wsgi')
+
+from app.serving import AsgiApp  # noqa: E402
+
+
+def _echo_app():
+    app = Flask(__name__)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return {'length': len(request.get_data()), 'tail': request.get_data()[-4:].decode()}
+
+    @app.route('/stream')
+    def stream():
+        return app.response_class((f'{i},'.encode() for i in range(1000)), mimetype='text/plain')
+
+    return app
+
+
+def _call(app, scope, messages):
+    """Run one ASGI call with the given received messages; returns the sent ones."""
+    sent = []
+
+    async def run():
+        queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, queue.get, send)
+
+    asyncio.run(run())
+    return sent
+
+
+def _http_scope(method, path, headers=()):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(k.encode(), v.encode()) for k, v in headers], 'client': ('127.0.0.1', 5000),
+        'server': ('testserver', 80),
+    }
+
+
+def test_lifespan_runs_hooks():
+    calls = []
+    app = AsgiApp(_echo_app(), threads=2, on_startup=lambda: calls.append('startup'),
+                  on_shutdown=lambda: calls.append('shutdown'))
+    sent = _call(app, {'type': 'lifespan'}, [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    assert calls == ['startup', 'shutdown']
+    assert [m['type'] for m in sent] == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+def test_lifespan_reports_failed_hook():
+    def fail():
+        raise RuntimeError('no data')
+
+    app = AsgiApp(_echo_app(), threads=2, on_startup=fail)
+    sent = _call(app, {'type': 'lifespan'}, [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    assert sent[0] == {'type': 'lifespan.startup.failed', 'message': 'no data'}
+    assert sent[1]['type'] == 'lifespan.shutdown.complete'
+
+
+def test_request_body_in_chunks():
+    body = b'x' * 100_000 + b'done'
+    chunks = [body[i:i + 16384] for i in range(0, len(body), 16384)]
+    messages = [
+        {'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1} for i, chunk in enumerate(chunks)
+    ]
+    scope = _http_scope('POST', '/echo', [('content-type', 'application/octet-stream'),
+                                          ('content-length', str(len(body)))])
+    sent = _call(AsgiApp(_echo_app(), threads=2), scope, messages)
+    assert sent[0]['type'] == 'http.response.start' and sent[0]['status'] == 200
+    payload = b''.join(m.get('body', b'') for m in sent[1:])
+    assert payload.replace(b' ', b'').replace(b'\n', b'') == b'{"length":100004,"tail":"done"}'
+    assert not sent[-1].get('more_body')
+
+
+def test_streamed_response():
+    sent = _call(AsgiApp(_echo_app(), threads=2), _http_scope('GET', '/stream'), [{'type': 'http.request'}])
+    assert sent[0]['status'] == 200
+    assert b''.join(m.get('body', b'') for m in sent[1:]) == b''.join(f'{i},'.encode() for i in range(1000))
@@ -0,0 +1,81 @@
+import numpy as np
+
+from app.ingest import attach_delta
+from app.trending import DAY_SECONDS, TrendingIndex, trending
+
+from conftest import make_bundle
+
+END = 100 * DAY_SECONDS
+
+
+def _with_trending(data, seed=0):
+    store = data['rating_store']
+    rng = np.random.default_rng(seed)
+    _, movie_ids, values = store.to_arrays()
+    timestamps = END - rng.integers(1, 60 * DAY_SECONDS, len(values))
+    data['trending'] = TrendingIndex.from_ratings(
+        np.searchsorted(store.movie_ids, movie_ids), timestamps, values, store.n_movies,
+    )
+    return data
+
+
+def test_delta_bucket_totals_match_merged_index():
+    data = _with_trending(make_bundle())
+    index, store = data['trending'], data['rating_store']
+    delta = attach_delta(data)
+    assert delta.bucket_seconds == index.bucket_seconds
+    entries = [
+        (1, 3, 4.0, END - 10), (2, 3, 2.0, END - 20), (1, 3, 5.0, END - 30),
+        (7, 5, 3.5, END - 3 * DAY_SECONDS), (1000, 8, 1.0, END - 80 * DAY_SECONDS),
+    ]
+    for entry in entries[:2]:
+        delta.add(*entry)
+    delta.freeze()
+    for entry in entries[2:]:
+        delta.add(*entry)
+    assert delta.newest_timestamp() == END - 10
+
+    buckets, movie_ids, counts, sums = delta.bucket_totals()
+    pending = (buckets, np.searchsorted(store.movie_ids, movie_ids), counts, sums)
+    _, movies, ratings, timestamps = zip(*entries)
+    merged = index.merged(np.searchsorted(store.movie_ids, movies), timestamps, ratings)
+    for half_life in (None, 7 * DAY_SECONDS):
+        window = index.window(END, 30 * DAY_SECONDS, half_life, pending)
+        expected = merged.window(END, 30 * DAY_SECONDS, half_life)
+        for got, want in zip(window, expected):
+            assert np.allclose(got, want)
+        assert trending(index, END, 30 * DAY_SECONDS, half_life, pending=pending)[0].tolist() == \
+            trending(merged, END, 30 * DAY_SECONDS, half_life)[0].tolist()
+
+
+def test_bucket_totals_follow_thaw():
+    delta = attach_delta(make_bundle())
+    delta.add(1, 3, 4.0, DAY_SECONDS + 5)
+    delta.freeze()
+    delta.add(1, 3, 2.0, DAY_SECONDS + 6)
+    delta.thaw()
+    buckets, movie_ids, counts, sums = delta.bucket_totals()
+    assert buckets.tolist() == [1] and movie_ids.tolist() == [3]
+    assert counts.tolist() == [2] and sums.tolist() == [6.0]
+
+
+def test_underflowing_weights_are_not_ranked():
+    data = _with_trending(make_bundle())
+    index = data['trending']
+    half_life = DAY_SECONDS / 2000  # Anything older than the newest bucket weighs 0.5 ** 2000 == 0
+    positions, (decayed, decayed_sums, counts) = trending(index, END, 30 * DAY_SECONDS, half_life, limit=50)
+    newest = index.window(END, DAY_SECONDS)[2]
+    assert sorted(positions.tolist()) == np.flatnonzero(newest).tolist()
+    assert len(positions) and np.all(decayed[positions] > 0)
+    assert np.all(np.isfinite(decayed_sums[positions] / decayed[positions]))
+
+
+def test_trending_route_stays_valid_json_for_tiny_half_life(client, bundle):
+    _with_trending(bundle)
+    response = client.get(f'/api/trending?as_of={END}&half_life=0.00001&limit=50')
+    assert response.status_code == 200
+    assert 'NaN' not in response.get_data(as_text=True)
+    assert all(movie['score'] > 0 for movie in response.get_json()['movies'])
+    for value in ('nan', 'inf'):
+        assert client.get(f'/api/trending?half_life={value}').status_code == 400
+        assert client.get(f'/api/trending?days={value}').status_code == 400
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Train the ALS matrix factorization model and save it next to the data cache.
+The app loads the file at startup and serves /api/recommendations and
+/api/custom-recommendations from it; rerun this after the data changes.
+
+Usage: python train_factors.py [--rank 32] [--regularization 0.1] [--prior-count 20]
+       [--iterations 10] [--threads 4]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Run from project root
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import config as app_config
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rank', type=int, default=app_config.ALS_RANK,
+                        help='latent factors per user and movie')
+    parser.add_argument('--regularization', type=float, default=app_config.ALS_REGULARIZATION,
+                        help='L2 penalty per rating')
+    parser.add_argument('--prior-count', type=float, default=app_config.ALS_PRIOR_COUNT,
+                        help="ratings' worth of extra penalty per user and movie")
+    parser.add_argument('--iterations', type=int, default=app_config.ALS_ITERATIONS,
+                        help='alternating solve iterations')
+    parser.add_argument('--threads', type=int, default=app_config.ALS_THREADS or os.cpu_count() or 1,
+                        help='solver threads')
+    parser.add_argument('--output', default=app_config.FACTORS_PATH,
+                        help='.npz file to write')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    from app.data_loader import load_data
+    from app.factorization import FactorModel
+
+    config = {k: getattr(app_config, k) for k in dir(app_config) if k.isupper()}
+    # Neither the model being replaced nor recommendations built from it are needed
+    config['FACTORS_PATH'] = None
+    config['PRECOMPUTED_RECS_PARQUET'] = None
+    bundle = load_data(config)
+
+    start = time.time()
+    store = bundle['rating_store']
+    logger.info(f"Training rank {args.rank} on {store.n_ratings} ratings with {args.threads} threads")
+    model = FactorModel.train(
+        store,
+        rank=args.rank,
+        regularization=args.regularization,
+        prior_count=args.prior_count,
+        iterations=args.iterations,
+        threads=args.threads,
+    )
+    model.metadata['data_version'] = bundle['version']
+
+    tmp_path = f"{args.output}.tmp.npz"
+    model.save(tmp_path)
+    os.replace(tmp_path, args.output)
+    print(f"Wrote {args.rank}-factor model (train RMSE {model.metadata['train_rmse']:.4f}) "
+          f"to {args.output} in {time.time() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()